@@ -31,6 +31,9 @@ class URLDetailSerializer(serializers.Serializer):
     aspect_ratio = serializers.IntegerField(required=False)
     # audio related detail
     audio_bitrate = serializers.IntegerField(required=False, default=400)
+    # clip related detail (seconds)
+    start_time = serializers.FloatField(required=False, min_value=0)
+    end_time = serializers.FloatField(required=False, min_value=0)
 
     def validate_resolution(self, value):
         valid_resolution_range = [100, 1080]
@@ -51,6 +54,8 @@ class URLDetailSerializer(serializers.Serializer):
         else:
             if data.get('extension'):
                 data['extension'] = data['extension'] if data['extension'] in self.SUPPORTED_AUDIO_EXTENSIONS else 'mp3'
+        if data.get('end_time') and data['end_time'] <= data.get('start_time', 0):
+            raise serializers.ValidationError({'end_time': 'Incorrect end time! it must be after the start time!'})
 
         return data
 
@@ -87,3 +92,30 @@ class ContentInfoSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
         pass
 
+
+class DirectURLSerializer(serializers.Serializer):
+    pk = serializers.UUIDField()
+    download_url = serializers.URLField(max_length=2048)
+    expiration_date = serializers.DateTimeField()
+
+    def create(self, validated_data):
+        pass
+
+    def update(self, instance, validated_data):
+        pass
+
+
+class JobSerializer(serializers.Serializer):
+    id = serializers.CharField(max_length=300)
+    state = serializers.CharField(max_length=50)
+    status_url = serializers.CharField(max_length=400)
+    content_pk = serializers.UUIDField(required=False, allow_null=True)
+    download_job_id = serializers.CharField(max_length=300, required=False, allow_null=True)
+    info = ContentInfoSerializer(required=False, allow_null=True)
+    error = serializers.CharField(required=False, allow_null=True)
+
+    def create(self, validated_data):
+        pass
+
+    def update(self, instance, validated_data):
+        pass
@@ -2,14 +2,24 @@ from django.test import TestCase, override_settings
 from django.shortcuts import reverse
 from django.urls import resolve
 from django.http import FileResponse
+from django.utils import timezone
 from rest_framework.test import APITestCase
 from rest_framework import status
 from celery.result import AsyncResult
+from celery.utils import uuid
+from datetime import timedelta
+from django_celery_results.models import TaskResult
+import io
 import os
+import shutil
+import tempfile
+import zipfile
 from downloader.main_downloader import MainDownloader, CustomYoutubeDL
 from downloader.models import AllowedExtractor, Content
+from downloader.tasks import async_aggregate_playlist, async_process_url, async_refresh_info
 from downloader.tests import wait_until_file_is_being_processed_then_delete
-from .views import GetContentInfoAPIView, DownloadContentAPIView
+from .views import GetContentInfoAPIView, DownloadContentAPIView, JobStatusAPIView, register_job
+from .serializers import URLDetailSerializer
 
 
 @override_settings(
@@ -75,6 +85,12 @@ class GetContentInfoAPIViewTests(APITestCase):
         response2 = self.client.get(self.path, data=data2)
         self.assertEqual(response2.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_view_with_unsupported_url_get(self):
+        response = self.client.get(self.path, data={'url': 'https://example.com/unsupported-content'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, 'Unsupported URL!')
+        self.assertFalse(Content.objects.filter(url='https://example.com/unsupported-content').exists())
+
     def test_view_with_valid_data_post(self):
         data = {
             'url': self.content_url,
@@ -200,3 +216,166 @@ class DownloadContentAPIViewTests(APITestCase):
         self.assertEqual(download_content_response['Content-Type'], 'audio/mpeg')
         wait_until_file_is_being_processed_then_delete(content.download_path, tries=5)
 
+
+class JobStatusAPIViewTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.content_url = 'https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv'
+        cls.content = Content.objects.create(
+            url=cls.content_url,
+            info_id='2PuFyjAs7JA',
+            info_file_path='info/info-2PuFyjAs7JA.json',
+            celery_download_task_id=uuid(),
+        )
+        cls.info = {
+            'id': '2PuFyjAs7JA',
+            'original_url': cls.content_url,
+            'title': 'test content',
+            'duration_string': '3:20',
+            'thumbnail': 'https://i.ytimg.com/vi/2PuFyjAs7JA/maxresdefault.jpg',
+            'webpage_url_domain': 'youtube.com',
+        }
+
+    def test_view_url(self):
+        path = reverse('job-status-api', kwargs={'job_id': uuid()})
+        self.assertEqual(resolve(path).func.__name__, JobStatusAPIView.as_view().__name__)
+
+    def test_pending_job(self):
+        job_id = self.content.celery_download_task_id
+        response = self.client.get(reverse('job-status-api', kwargs={'job_id': job_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], job_id)
+        self.assertEqual(response.data['state'], 'PENDING')
+        self.assertIsNone(response.data['info'])
+
+    def test_registered_job(self):
+        job_id = register_job(async_process_url)
+        response = self.client.get(reverse('job-status-api', kwargs={'job_id': job_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['state'], 'PENDING')
+
+    def test_unknown_job(self):
+        response = self.client.get(reverse('job-status-api', kwargs={'job_id': uuid()}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_foreign_job(self):
+        job_id = uuid()
+        TaskResult.objects.create(task_id=job_id, task_name=async_refresh_info.name, status='SUCCESS', result='0')
+        response = self.client.get(reverse('job-status-api', kwargs={'job_id': job_id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_successful_job_without_info(self):
+        job_id = uuid()
+        AsyncResult(job_id).backend.store_result(job_id, (1, None, str(self.content.pk)), 'SUCCESS')
+        TaskResult.objects.filter(task_id=job_id).update(task_name=async_aggregate_playlist.name)
+        response = self.client.get(reverse('job-status-api', kwargs={'job_id': job_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['content_pk'], str(self.content.pk))
+        self.assertIsNone(response.data['info'])
+
+    def test_successful_job(self):
+        job_id = uuid()
+        AsyncResult(job_id).backend.store_result(job_id, (0, self.info, str(self.content.pk)), 'SUCCESS')
+        TaskResult.objects.filter(task_id=job_id).update(task_name=async_process_url.name)
+        response = self.client.get(reverse('job-status-api', kwargs={'job_id': job_id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['state'], 'SUCCESS')
+        self.assertEqual(response.data['content_pk'], str(self.content.pk))
+        self.assertEqual(response.data['download_job_id'], self.content.celery_download_task_id)
+        self.assertEqual(response.data['info']['title'], self.info['title'])
+        self.assertEqual(response.data['info']['url'], self.content_url)
+
+    def test_async_download_of_not_downloaded_content(self):
+        response = self.client.get(reverse('download-content-api', kwargs={'pk': self.content.pk}), data={'async': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['id'], self.content.celery_download_task_id)
+        self.assertEqual(response.data['content_pk'], str(self.content.pk))
+        self.assertEqual(
+            response.data['status_url'], reverse('job-status-api', kwargs={'job_id': self.content.celery_download_task_id})
+        )
+
+
+@override_settings(DIRECT_URL_DELIVERY=True)
+class DirectURLDeliveryAPITests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.content = Content.objects.create(
+            url='https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv',
+            info_id='2PuFyjAs7JA',
+            info_file_path='info/info-2PuFyjAs7JA.json',
+            type='video',
+            extension='mp4',
+            download_url='https://example.com/progressive-360.mp4',
+            download_url_expiration_date=timezone.now() + timedelta(hours=1),
+        )
+
+    def test_redirect_delivery(self):
+        response = self.client.get(
+            reverse('download-content-api', kwargs={'pk': self.content.pk}), data={'delivery': 'redirect'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(response['Location'], self.content.download_url)
+
+    def test_url_delivery(self):
+        response = self.client.get(
+            reverse('download-content-api', kwargs={'pk': self.content.pk}), data={'delivery': 'url'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['pk'], str(self.content.pk))
+        self.assertEqual(response.data['download_url'], self.content.download_url)
+        self.assertIsNotNone(response.data['expiration_date'])
+
+
+@override_settings(
+    CELERY_TASK_ALWAYS_EAGER=True,
+    CELERY_TASK_STORE_EAGER_RESULT=True,
+    CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
+)
+class PlaylistDownloadAPITests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.playlist = Content.objects.create(
+            url='https://www.instagram.com/p/DAbCdEfGhIj/',
+            info_id='DAbCdEfGhIj',
+            info_file_path='info/info-missing.json',
+            title='test carousel',
+            is_playlist=True,
+        )
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        download_path = os.path.join(self.temp_dir, 'test carousel item.mp4')
+        with open(download_path, 'wb') as file:
+            file.write(b'test carousel item')
+        Content.objects.create(
+            parent=self.playlist, playlist_index=1, url=self.playlist.url, info_id='3400000000000000001',
+            download_path=download_path, downloaded_successfully=True,
+        )
+
+    def test_streamed_zip_download(self):
+        response = self.client.get(reverse('download-content-api', kwargs={'pk': self.playlist.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as zip_file:
+            self.assertListEqual(zip_file.namelist(), ['001 - test carousel item.mp4'])
+        self.playlist.refresh_from_db()
+        self.assertTrue(self.playlist.downloaded_successfully)
+
+
+class URLDetailSerializerTests(TestCase):
+
+    def test_clip_validation(self):
+        url = 'https://youtu.be/2PuFyjAs7JA'
+        serializer = URLDetailSerializer(data={'url': url, 'start_time': 30, 'end_time': 90.5})
+        self.assertTrue(serializer.is_valid())
+        self.assertEqual(serializer.validated_data['start_time'], 30.0)
+        self.assertEqual(serializer.validated_data['end_time'], 90.5)
+        serializer = URLDetailSerializer(data={'url': url})
+        self.assertTrue(serializer.is_valid())
+        self.assertNotIn('start_time', serializer.validated_data)
+        self.assertFalse(URLDetailSerializer(data={'url': url, 'start_time': 90, 'end_time': 30}).is_valid())
+        self.assertFalse(URLDetailSerializer(data={'url': url, 'start_time': -1}).is_valid())
@@ -1,8 +1,9 @@
 from django.urls import path
-from .views import GetContentInfoAPIView, DownloadContentAPIView
+from .views import GetContentInfoAPIView, DownloadContentAPIView, JobStatusAPIView
 
 
 urlpatterns = [
     path('getinfo/', GetContentInfoAPIView.as_view(), name='get-content-info-api'),
     path('download/<uuid:pk>/', DownloadContentAPIView.as_view(), name='download-content-api'),
+    path('jobs/<uuid:job_id>/', JobStatusAPIView.as_view(), name='job-status-api'),
 ]
\ No newline at end of file
@@ -1,19 +1,44 @@
-from django.shortcuts import render
-from django.http import FileResponse
+from django.conf import settings
+from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.forms.models import model_to_dict
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from celery import states
 from celery.result import AsyncResult
+from celery.utils import uuid
+from django_celery_results.models import TaskResult
 from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiParameter, OpenApiTypes
+import os
+from downloader.coordination import TaskResultWaitError, wait_for_result
+from downloader.delivery import make_file_response
+from downloader.direct_url import get_direct_url
+from downloader.extractors import allowed_extractor_registry
 from downloader.main_downloader import DownloadProcessError
-from downloader.tasks import async_process_url, async_download_content
+from downloader.playlists import make_playlist_response
+from downloader.streaming import make_streaming_transcode_response
+from downloader.tasks import (async_aggregate_playlist, async_download_content, async_postprocess_content,
+                              async_process_url, async_process_url_and_download_content, dispatch_download_content,
+                              update_content_with_download_result)
 from downloader.models import Content
-from .serializers import URLDetailSerializer, ContentInfoSerializer
+from .serializers import URLDetailSerializer, ContentInfoSerializer, JobSerializer, DirectURLSerializer
 
 
 # Create your views here.
 
+# The delivery query parameter values that deliver the content by its direct media url
+DIRECT_URL_DELIVERY_MODES = ['redirect', 'url']
+
+# The tasks whose results are served by the job status api, the other task ids are not jobs
+JOB_TASK_NAMES = [
+    task.name for task in (
+        async_process_url, async_process_url_and_download_content, async_download_content, async_postprocess_content,
+        async_aggregate_playlist,
+    )
+]
+
+
 class GetContentInfoAPIView(APIView):
 
     @extend_schema(
@@ -67,11 +92,44 @@ class GetContentInfoAPIView(APIView):
                 default=400,
                 description="Bitrate of the audio content."
             ),
+            OpenApiParameter(
+                name="start_time",
+                type=OpenApiTypes.FLOAT,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="The start of the clip to download (as seconds). Only the needed fragments are downloaded."
+            ),
+            OpenApiParameter(
+                name="end_time",
+                type=OpenApiTypes.FLOAT,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                description="The end of the clip to download (as seconds)."
+            ),
+            OpenApiParameter(
+                name="async",
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                default=False,
+                description="Return 202 Accepted with a job immediately instead of waiting for the process. "
+                            "Follow the job status url to get the result."
+            ),
+            OpenApiParameter(
+                name="stream",
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                default=False,
+                description="Do not start the download of the content, it is started (streamed if possible) by the "
+                            "download api with stream. Ignored if the streaming mode is disabled."
+            ),
         ],
         request=URLDetailSerializer,
         responses={
             200: ContentInfoSerializer,
-            400: OpenApiResponse(response=OpenApiTypes.STR, description="Invalid query params"),
+            202: JobSerializer,
+            400: OpenApiResponse(response=OpenApiTypes.STR, description="Invalid query params or unsupported URL"),
             502: OpenApiResponse(response=OpenApiTypes.STR, description="Any problem during info extraction process")
         },
         description="Get info of the given URL",
@@ -80,37 +138,36 @@ class GetContentInfoAPIView(APIView):
         data = data if data else request.query_params
         url_detail_serializer = URLDetailSerializer(data=data)
         if url_detail_serializer.is_valid():
+            if not allowed_extractor_registry.is_url_supported(url_detail_serializer.validated_data['url']):
+                return Response("Unsupported URL!", status=status.HTTP_400_BAD_REQUEST)
+            # the download is started by the streaming download request instead
+            defer_download = is_stream_request(data) and settings.STREAMING_TRANSCODE
+            if is_async_request(data):
+                process_task = async_process_url if defer_download else async_process_url_and_download_content
+                job_id = register_job(process_task)
+                job_result = process_task.apply_async(
+                    args=(url_detail_serializer.validated_data['url'], ),
+                    kwargs={'detail': url_detail_serializer.validated_data}, task_id=job_id,
+                )
+                return Response(JobSerializer(make_job_data(job_result)).data, status=status.HTTP_202_ACCEPTED)
             process_url_result = async_process_url.delay(url_detail_serializer.validated_data['url'], detail=url_detail_serializer.validated_data)
             try:
-                result = process_url_result.get()
-            except DownloadProcessError as error:
+                result = wait_for_result(process_url_result)
+            except (DownloadProcessError, TaskResultWaitError) as error:
                 return Response(str(error), status=status.HTTP_502_BAD_GATEWAY)
             else:
                 if process_url_result.successful():
                     code, info, content_pk = result
                     content = Content.objects.get(pk=content_pk)
-                    content_info_data = {
-                        'pk': content.pk,
-                        'url': info.get('original_url') or info.get('webpage_url'),
-                        'title': info.get('title'),
-                        'duration': info.get('duration_string'),
-                        'thumbnail_url': info.get('thumbnail'),
-                        'webpage_url_domain': info.get('webpage_url_domain'),
-                        'upload_date': info.get('upload_date'),
-                        'description': make_short_description(info.get('description'), 500),
-                        'track': info.get('track'),
-                        'artist': info.get('artist'),
-                        'album': info.get('album'),
-                        'release_date': info.get('release_date'),
-                        'channel': info.get('channel'),
-                        'uploader': info.get('uploader'),
-                    }
-                    content_info_serializer = ContentInfoSerializer(data=content_info_data)
-                    if content_info_serializer.is_valid():
+                    content_info_serializer = ContentInfoSerializer(data=make_content_info_data(info, content.pk))
+                    if content_info_serializer.is_valid() and defer_download:
+                        return Response(content_info_serializer.data, status=status.HTTP_200_OK)
+                    elif content_info_serializer.is_valid():
                         print(url_detail_serializer.validated_data)
-                        download_content_result = async_download_content.delay(
-                            url_detail_serializer.validated_data['url'], detail=url_detail_serializer.validated_data, info=info,
-                            info_file_path=info.get('info_file_path'), pre_created_content_obj=content.pk
+                        download_content_result = dispatch_download_content(
+                            url_detail_serializer.validated_data['url'], rendition_key=content.rendition_key,
+                            detail=url_detail_serializer.validated_data, info_file_path=info.get('info_file_path'),
+                            pre_created_content_obj=content.pk, playlist=content.is_playlist
                         )
                         content.celery_download_task_id = download_content_result.task_id
                         content.save()
@@ -127,7 +184,8 @@ class GetContentInfoAPIView(APIView):
         request=URLDetailSerializer,
         responses={
             200: ContentInfoSerializer,
-            400: OpenApiResponse(response=OpenApiTypes.STR, description="Invalid query params"),
+            202: JobSerializer,
+            400: OpenApiResponse(response=OpenApiTypes.STR, description="Invalid query params or unsupported URL"),
             502: OpenApiResponse(response=OpenApiTypes.STR, description="Any problem during info extraction process")
         },
         description="Get info of the given URL"
@@ -140,8 +198,46 @@ class DownloadContentAPIView(APIView):
 
     @extend_schema(
         operation_id="api_download_get",
+        parameters=[
+            OpenApiParameter(
+                name="async",
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                default=False,
+                description="Return 202 Accepted with a job immediately if the content is not downloaded yet, "
+                            "instead of waiting for the download process."
+            ),
+            OpenApiParameter(
+                name="stream",
+                type=OpenApiTypes.BOOL,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                default=False,
+                description="Stream the audio (mp3, aac, wav) while it is downloaded and transcoded, if the content is "
+                            "not downloaded yet. The response is chunked (no Content-Length and no ranges)."
+            ),
+            OpenApiParameter(
+                name="delivery",
+                type=OpenApiTypes.STR,
+                location=OpenApiParameter.QUERY,
+                required=False,
+                enum=DIRECT_URL_DELIVERY_MODES,
+                description="Deliver the content by the direct media url of its format if it needs no merge and no "
+                            "conversion: 'redirect' (302 Found) or 'url' (the url and its expiration date as JSON). "
+                            "Falls back to the downloaded content otherwise."
+            ),
+        ],
         responses={
-            200: OpenApiResponse(response=OpenApiTypes.BINARY, description='Downloaded content stream'),
+            200: OpenApiResponse(
+                response=OpenApiTypes.BINARY,
+                description='Downloaded content stream, a streamed ZIP of the downloaded entries for the playlists '
+                            '(or the pk, download_url and expiration_date JSON with delivery=url)'
+            ),
+            302: OpenApiResponse(description='Redirect to the direct media url of the content (delivery=redirect)'),
+            202: JobSerializer,
+            206: OpenApiResponse(response=OpenApiTypes.BINARY, description='Requested byte ranges of the content'),
+            304: OpenApiResponse(description='Not modified content (If-None-Match/If-Modified-Since)'),
             404: OpenApiResponse(response=OpenApiTypes.STR, description='Not found content'),
             502: OpenApiResponse(response=OpenApiTypes.STR, description='Any problem during download process')
         },
@@ -152,33 +248,68 @@ class DownloadContentAPIView(APIView):
             content = Content.objects.valid_contents().get(pk=pk)
         except Content.DoesNotExist:
             return Response("There is no such content!", status=status.HTTP_404_NOT_FOUND)
+        delivery_mode = request.query_params.get('delivery')
+        if delivery_mode in DIRECT_URL_DELIVERY_MODES:
+            direct_url = get_direct_url(content)
+            if direct_url:
+                if delivery_mode == 'redirect':
+                    return redirect(direct_url)
+                direct_url_data = {
+                    'pk': content.pk, 'download_url': direct_url,
+                    'expiration_date': content.download_url_expiration_date,
+                }
+                return Response(DirectURLSerializer(direct_url_data).data, status=status.HTTP_200_OK)
+        if is_stream_request(request.query_params):
+            response = make_streaming_transcode_response(content)
+            if response is not None:
+                return response
         # add else here?
         if content.celery_download_task_id:
             download_result = AsyncResult(id=content.celery_download_task_id)
         else:
-            detail_fields = ['type', 'extension', 'resolution', 'frame_rate', 'aspect_ratio', 'audio_bitrate']
+            detail_fields = [
+                'type', 'extension', 'resolution', 'frame_rate', 'aspect_ratio', 'audio_bitrate', 'start_time', 'end_time'
+            ]
             content_detail = {k: v for k, v in model_to_dict(content).items() if k in detail_fields}
-            download_result = async_download_content.delay(
-                content.url, detail=content_detail, info_file_path=content.info_file_path,
-                pre_created_content_obj=content.pk
+            download_result = dispatch_download_content(
+                content.url, rendition_key=content.rendition_key, detail=content_detail,
+                info_file_path=content.info_file_path, pre_created_content_obj=content.pk, playlist=content.is_playlist
             )
+            content.celery_download_task_id = download_result.task_id
+            Content.objects.filter(pk=content.pk).update(celery_download_task_id=download_result.task_id)
+        if is_async_request(request.query_params) and not download_result.ready():
+            job_data = make_job_data(download_result, content=content)
+            return Response(JobSerializer(job_data).data, status=status.HTTP_202_ACCEPTED)
         try:
-            result = download_result.get()
+            result = wait_for_result(download_result, in_flight_key=content.rendition_key)
+        except TaskResultWaitError as error:
+            # the next request dispatches the download again
+            Content.objects.filter(pk=content.pk).update(celery_download_task_id=None)
+            return Response(str(error), status=status.HTTP_502_BAD_GATEWAY)
         except DownloadProcessError as error:
             return Response(str(error), status=status.HTTP_502_BAD_GATEWAY)
         else:
             if download_result.successful():
                 content.refresh_from_db()
+                update_content_with_download_result(content, result)
                 content.celery_download_task_id = download_result.task_id
                 content.save()
-                if content.download_path and content.downloaded_successfully:
-                    return FileResponse(open(content.download_path, 'rb'), as_attachment=True, status=status.HTTP_200_OK)
+                if content.is_playlist and content.downloaded_successfully:
+                    response = make_playlist_response(content)
+                    if response is not None:
+                        return response
+                if content.download_path and content.downloaded_successfully and os.path.exists(content.download_path):
+                    return make_file_response(request, content.download_path)
             return Response("Download process was unsuccessful!", status=status.HTTP_502_BAD_GATEWAY)
 
     @extend_schema(
         operation_id="api_download_post",
         responses={
             200: OpenApiResponse(response=OpenApiTypes.BINARY, description='Downloaded content stream'),
+            302: OpenApiResponse(description='Redirect to the direct media url of the content (delivery=redirect)'),
+            202: JobSerializer,
+            206: OpenApiResponse(response=OpenApiTypes.BINARY, description='Requested byte ranges of the content'),
+            304: OpenApiResponse(description='Not modified content (If-None-Match/If-Modified-Since)'),
             404: OpenApiResponse(response=OpenApiTypes.STR, description='Not found content'),
             502: OpenApiResponse(response=OpenApiTypes.STR, description='Any problem during download process')
         },
@@ -188,6 +319,104 @@ class DownloadContentAPIView(APIView):
         return self.get(request, pk, *args, **kwargs)
 
 
+class JobStatusAPIView(APIView):
+
+    @extend_schema(
+        operation_id="api_jobs_get",
+        responses={
+            200: JobSerializer,
+            404: OpenApiResponse(response=OpenApiTypes.STR, description='Not found job'),
+        },
+        description="Get the state of an asynchronous getinfo or download job, "
+                    "with the content info and content pk when the job is done.",
+    )
+    def get(self, request, job_id, *args, **kwargs):
+        if not is_known_job(str(job_id)):
+            return Response("Job not found!", status=status.HTTP_404_NOT_FOUND)
+        job_result = AsyncResult(id=str(job_id))
+        return Response(JobSerializer(make_job_data(job_result)).data, status=status.HTTP_200_OK)
+
+
+def is_async_request(data):
+    return str(data.get('async', '')).lower() in ('1', 'true', 'yes', 'on')
+
+
+def is_stream_request(data):
+    return str(data.get('stream', '')).lower() in ('1', 'true', 'yes', 'on')
+
+
+def register_job(task):
+    """
+    Records a pending result of the job before its task is sent, so that the job status api knows the queued job.
+    Returns the job id, which is the task id.
+    :param task:
+    :return:
+    """
+    job_id = uuid()
+    TaskResult.objects.get_or_create(task_id=job_id, defaults={'task_name': task.name, 'status': states.PENDING})
+    return job_id
+
+
+def is_known_job(job_id):
+    """
+    Returns whether the id is the id of a getinfo or download job:
+    the result of a job task is recorded (started or registered), or a content refers to the download job.
+    :param job_id:
+    :return:
+    """
+    if TaskResult.objects.filter(task_id=job_id, task_name__in=JOB_TASK_NAMES).exists():
+        return True
+    return Content.objects.filter(celery_download_task_id=job_id).exists()
+
+
+def make_job_data(job_result, content=None):
+    """
+    Returns the job data of a getinfo or download celery task result, which is the input of JobSerializer.
+    :param job_result:
+    :param content:
+    :return:
+    """
+    job_data = {
+        'id': job_result.id,
+        'state': job_result.state,
+        'status_url': reverse('job-status-api', kwargs={'job_id': job_result.id}),
+        'content_pk': content.pk if content else None,
+        'download_job_id': content.celery_download_task_id if content else None,
+        'info': None,
+        'error': None,
+    }
+    # the job tasks return (code, info, content pk), the info is None if there is no info of the content (playlist)
+    if job_result.successful() and isinstance(job_result.result, (list, tuple)) and len(job_result.result) == 3:
+        code, info, content_pk = job_result.result
+        content = content or Content.objects.filter(pk=content_pk).first()
+        content_pk = content.pk if content else content_pk
+        job_data['content_pk'] = content_pk
+        job_data['download_job_id'] = content.celery_download_task_id if content else None
+        job_data['info'] = make_content_info_data(info, content_pk) if info else None
+    elif job_result.failed():
+        job_data['error'] = str(job_result.result)
+    return job_data
+
+
+def make_content_info_data(info, content_pk):
+    return {
+        'pk': content_pk,
+        'url': info.get('original_url') or info.get('webpage_url'),
+        'title': info.get('title'),
+        'duration': info.get('duration_string'),
+        'thumbnail_url': info.get('thumbnail'),
+        'webpage_url_domain': info.get('webpage_url_domain'),
+        'upload_date': info.get('upload_date'),
+        'description': make_short_description(info.get('description'), 500),
+        'track': info.get('track'),
+        'artist': info.get('artist'),
+        'album': info.get('album'),
+        'release_date': info.get('release_date'),
+        'channel': info.get('channel'),
+        'uploader': info.get('uploader'),
+    }
+
+
 def make_short_description(description, max_len=500):
     if isinstance(description, str) and len(description) > max_len:
         return description[:max_len - 10] + '...'
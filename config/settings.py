@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 from environs import Env
+from kombu import Queue
 
 env = Env()
 env.read_env()
@@ -148,7 +149,46 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CELERY_RESULT_BACKEND = 'django-db'
 CELERY_CACHE_BACKEND = 'default'
 CELERY_RESULT_EXTENDED = True
+CELERY_TASK_TRACK_STARTED = True
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+# The short user-facing extractions do not wait behind the long downloads, run a worker per queue (-Q) to separate them.
+# A worker without -Q consumes all the queues.
+CELERY_TASK_DEFAULT_QUEUE = 'celery'
+CELERY_TASK_QUEUES = (
+    Queue('celery'),
+    Queue('extract'),
+    Queue('download'),
+    Queue('postprocess'),
+    Queue('maintenance'),
+)
+CELERY_TASK_ROUTES = {
+    'downloader.tasks.async_extract_info': {'queue': 'extract'},
+    'downloader.tasks.async_process_url': {'queue': 'extract'},
+    'downloader.tasks.async_process_url_and_download_content': {'queue': 'extract'},
+    'downloader.tasks.async_refresh_info': {'queue': 'extract'},
+    'downloader.tasks.async_download_content': {'queue': 'download'},
+    'downloader.tasks.async_postprocess_content': {'queue': 'postprocess'},
+    'downloader.tasks.async_download_playlist_entry': {'queue': 'download'},
+    'downloader.tasks.async_aggregate_playlist': {'queue': 'download'},
+    # polls the entry downloads of a playlist (the chords of the database result backend)
+    'celery.chord_unlock': {'queue': 'download'},
+    'downloader.tasks.delete_expired_content_files': {'queue': 'maintenance'},
+}
+# The pool, concurrency and prefetch are worker options, the workers of the queues (see docker-compose-prod.yml):
+#   extract: -c 8 --prefetch-multiplier 4 (short extractions)
+#   download: -P threads -c 16 --prefetch-multiplier 1 (long I/O-bound downloads)
+#   postprocess: -P prefork --prefetch-multiplier 1 (CPU-bound ffmpeg, a process per CPU core)
+#   celery,maintenance: -c 2 --prefetch-multiplier 1
+# reject_on_worker_lost only works on the prefork pool, the unacknowledged (acks_late) downloads of a lost threads
+# worker are delivered again by the broker after the visibility timeout, which must be longer than the longest
+# download (a running download would be delivered twice otherwise).
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'visibility_timeout': env.int('CELERY_VISIBILITY_TIMEOUT', default=2 * 60 * 60),
+}
+# Run the (CPU-bound) postprocessors of the downloads in a separate task chained after the download, on the postprocess queue
+DEFER_POSTPROCESSING = env.bool('DEFER_POSTPROCESSING', default=True)
+# The number of the entries of a playlist (or a carousel) that are downloaded at the same time
+PLAYLIST_PARALLEL_DOWNLOADS = env.int('PLAYLIST_PARALLEL_DOWNLOADS', default=4)
 
 # crispy
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
@@ -167,3 +207,79 @@ SPECTACULAR_SETTINGS = {
     'VERSION': '1.0.0',
     'SERVE_INCLUDE_SCHEMA': False,
 }
+
+# redis (in-flight download registry and notifications)
+REDIS_URL = env.str('REDIS_URL', default=env.str('CELERY_BROKER_URL', default=''))
+DOWNLOAD_IN_FLIGHT_TIMEOUT = env.int('DOWNLOAD_IN_FLIGHT_TIMEOUT', default=60 * 60)
+# A running download keeps its claim alive, the claim of a lost (killed) worker expires after these seconds
+DOWNLOAD_IN_FLIGHT_HEARTBEAT_TIMEOUT = env.int('DOWNLOAD_IN_FLIGHT_HEARTBEAT_TIMEOUT', default=90)
+TASK_RESULT_RECHECK_INTERVAL = env.int('TASK_RESULT_RECHECK_INTERVAL', default=30)
+# The views stop waiting for a task result after these seconds
+TASK_RESULT_WAIT_TIMEOUT = env.int('TASK_RESULT_WAIT_TIMEOUT', default=60 * 60)
+DOWNLOAD_PROGRESS_MIN_INTERVAL = env.float('DOWNLOAD_PROGRESS_MIN_INTERVAL', default=0.5)
+DOWNLOAD_PROGRESS_EVENT_TIMEOUT = env.int('DOWNLOAD_PROGRESS_EVENT_TIMEOUT', default=60 * 60)
+DOWNLOAD_PROGRESS_KEEP_ALIVE_INTERVAL = env.int('DOWNLOAD_PROGRESS_KEEP_ALIVE_INTERVAL', default=15)
+# The progress (server-sent events) streams are closed after these seconds
+DOWNLOAD_PROGRESS_STREAM_MAX_DURATION = env.int('DOWNLOAD_PROGRESS_STREAM_MAX_DURATION', default=60 * 60)
+
+# cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+if REDIS_URL:
+    CACHES['shared'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+
+# allowed extractors registry
+# The cache alias of the generation counter that invalidates the registries of the other processes
+ALLOWED_EXTRACTORS_CACHE_ALIAS = env.str('ALLOWED_EXTRACTORS_CACHE_ALIAS', default='shared' if REDIS_URL else 'default')
+ALLOWED_EXTRACTORS_RECHECK_INTERVAL = env.float('ALLOWED_EXTRACTORS_RECHECK_INTERVAL', default=30)
+
+# youtubedl pool (warmed YoutubeDL objects reused by the tasks of each worker thread)
+# The number of the kept option profiles per worker thread (0 disables the pool)
+YOUTUBEDL_POOL_MAX_PROFILES = env.int('YOUTUBEDL_POOL_MAX_PROFILES', default=4)
+# The objects are recreated after this number of uses (0 for no limit)
+YOUTUBEDL_POOL_MAX_USES = env.int('YOUTUBEDL_POOL_MAX_USES', default=100)
+
+# info store
+INFO_STORE_ROOT = env.str('INFO_STORE_ROOT', default='info')
+# 'gzip', 'zstd' (needs the zstandard package) or 'none'
+INFO_STORE_COMPRESSION = env.str('INFO_STORE_COMPRESSION', default='gzip')
+# The cache alias of the hot tier of the info store (empty to disable)
+INFO_STORE_CACHE_ALIAS = env.str('INFO_STORE_CACHE_ALIAS', default='shared' if REDIS_URL else '')
+INFO_STORE_CACHE_TIMEOUT = env.int('INFO_STORE_CACHE_TIMEOUT', default=60 * 60)
+# The info extraction (getinfo) does not process the formats of the infos, the download task resolves them
+INFO_ONLY_EXTRACTION = env.bool('INFO_ONLY_EXTRACTION', default=True)
+# An info is refreshed before the download if its format urls expire within these seconds
+INFO_FRESHNESS_MARGIN = env.int('INFO_FRESHNESS_MARGIN', default=15 * 60)
+# Refresh the stale infos in the background (extract queue) when they are reused by the info extraction
+INFO_BACKGROUND_REFRESH = env.bool('INFO_BACKGROUND_REFRESH', default=True)
+
+# content delivery
+# 'django' streams the files through the workers (FileResponse), 'x-accel-redirect' (nginx) and 'x-sendfile'
+# (apache, lighttpd, caddy) hand the transfer to the front proxy after the checks.
+CONTENT_DELIVERY_BACKEND = env.str('CONTENT_DELIVERY_BACKEND', default='django')
+# The files under CONTENT_DELIVERY_ROOT (the download directory) are served from CONTENT_DELIVERY_INTERNAL_URL
+# (nginx internal location), the other files are never offloaded to the front proxy.
+CONTENT_DELIVERY_ROOT = env.path('CONTENT_DELIVERY_ROOT', default=BASE_DIR / 'temp')
+CONTENT_DELIVERY_INTERNAL_URL = env.str('CONTENT_DELIVERY_INTERNAL_URL', default='/protected/')
+
+# Allow the streaming mode of the download api (the audio is transcoded to the response while it is downloaded)
+STREAMING_TRANSCODE = env.bool('STREAMING_TRANSCODE', default=False)
+
+# direct url delivery
+# Deliver the single file formats that need no merge or conversion by their direct media url (redirect or json)
+DIRECT_URL_DELIVERY = env.bool('DIRECT_URL_DELIVERY', default=False)
+# The lifetime (seconds) of the direct urls without an expire parameter
+DIRECT_URL_MAX_AGE = env.int('DIRECT_URL_MAX_AGE', default=60 * 60)
+# A direct url is not delivered if it expires in less than these seconds
+DIRECT_URL_EXPIRATION_MARGIN = env.int('DIRECT_URL_EXPIRATION_MARGIN', default=60)
+
+# master copy
+# Download the best source once per info (the master copy) and derive the renditions from it locally with ffmpeg
+MASTER_COPY = env.bool('MASTER_COPY', default=False)
+MASTER_COPY_DIR = env.str('MASTER_COPY_DIR', default='master')
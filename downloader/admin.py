@@ -6,7 +6,7 @@ from .models import Content, AllowedExtractor
 class ContentAdmin(admin.ModelAdmin):
     fields = [
         'url', 'celery_download_task_id',  'info_id', 'info_file_path', 'title', 'type', 'extension', 'resolution', 'frame_rate',
-        'aspect_ratio', 'audio_bitrate', 'download_url', 'download_path', 'downloaded_successfully', 'expired', 'expiration_date'
+        'aspect_ratio', 'audio_bitrate', 'start_time', 'end_time', 'download_url', 'download_url_expiration_date', 'download_path', 'rendition_key', 'downloaded_successfully', 'expired', 'expiration_date'
     ]
     list_display = ['title', 'processed_at', 'downloaded_successfully', 'expired']
 
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_save, post_delete
 
 
 class DownloaderConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'downloader'
+
+    def ready(self):
+        from .extractors import invalidate_allowed_extractors
+        allowed_extractor_model = self.get_model('AllowedExtractor')
+        post_save.connect(invalidate_allowed_extractors, sender=allowed_extractor_model,
+                          dispatch_uid='invalidate_allowed_extractors_on_save')
+        post_delete.connect(invalidate_allowed_extractors, sender=allowed_extractor_model,
+                            dispatch_uid='invalidate_allowed_extractors_on_delete')
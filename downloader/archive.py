@@ -0,0 +1,77 @@
+import io
+import os
+import zipfile
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from .delivery import FILE_CHUNK_SIZE
+
+
+class ZipStreamBuffer(io.RawIOBase):
+    """
+    ZipStreamBuffer is the non-seekable output of a ZipFile, its written bytes are popped by the response generator.
+    ZipFile writes the sizes and the CRC of the members after their data (data descriptors) to a non-seekable output.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        """
+        Returns the written bytes as a list of one chunk (or an empty list) and empties the buffer.
+        :return:
+        """
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return [data] if data else []
+
+
+def make_zip_response(members, file_name):
+    """
+    Returns a chunked response of a ZIP archive of the files which is built while it is sent (no temp archive).
+    :param members: (archive name, file path) pairs
+    :param file_name:
+    :return:
+    """
+    response = StreamingHttpResponse(iter_zip_stream(members), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, file_name)
+    # Disabling the proxy buffering to deliver the first bytes immediately.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def iter_zip_stream(members):
+    """
+    Yields the bytes of a ZIP archive of the files chunk by chunk, reading FILE_CHUNK_SIZE bytes of a file at a time.
+    The files are stored without compression, the media files are already compressed.
+    :param members: (archive name, file path) pairs
+    :return:
+    """
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as zip_file:
+        for arcname, file_path in members:
+            zip_info = zipfile.ZipInfo.from_file(file_path, arcname)
+            with open(file_path, 'rb') as source, zip_file.open(zip_info, mode='w', force_zip64=True) as destination:
+                while chunk := source.read(FILE_CHUNK_SIZE):
+                    destination.write(chunk)
+                    yield from buffer.pop()
+            yield from buffer.pop()
+    yield from buffer.pop()
+
+
+def make_archive_name(index, file_path, index_width=3):
+    """
+    Returns the unique archive name of an entry file, prefixed with its index (the entries may have the same title).
+    :param index:
+    :param file_path:
+    :param index_width:
+    :return:
+    """
+    return f'{index:0{index_width}d} - {os.path.basename(file_path)}'
@@ -0,0 +1,208 @@
+import threading
+import time
+from contextlib import contextmanager
+import redis
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+from django.conf import settings
+
+IN_FLIGHT_DOWNLOAD_KEY_PREFIX = 'easydownloader:in-flight-download:'
+TASK_DONE_CHANNEL_PREFIX = 'easydownloader:task-done:'
+# Deletes the key only if it still belongs to the given task, so a late release can not remove a newer claim.
+RELEASE_IN_FLIGHT_DOWNLOAD_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+# Extends the claim only if it belongs to the given task or has expired (a redelivered owner claims it again).
+HEARTBEAT_IN_FLIGHT_DOWNLOAD_SCRIPT = """
+local owner = redis.call('get', KEYS[1])
+if owner == false or owner == ARGV[1] then
+    return redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+end
+return 0
+"""
+_redis_connection = None
+
+
+class TaskResultWaitError(Exception):
+    """
+    Raised by wait_for_result when the task is not done within the wait timeout or its in-flight owner is lost
+    (e.g. the worker is killed before releasing the claim).
+    """
+
+
+def get_redis_connection():
+    """
+    Returns a shared redis connection to REDIS_URL or None if redis is not configured.
+    :return:
+    """
+    global _redis_connection
+    if not settings.REDIS_URL:
+        return None
+    if _redis_connection is None:
+        _redis_connection = redis.Redis.from_url(settings.REDIS_URL)
+    return _redis_connection
+
+
+def claim_in_flight_download(rendition_key, task_id):
+    """
+    Registers the task as the owner of the rendition download if no other task is downloading it.
+    Returns the task id of the owner, which is the given task id if the claim succeeded (or redis is not available).
+    :param rendition_key:
+    :param task_id:
+    :return owner_task_id:
+    """
+    connection = get_redis_connection()
+    if connection is None or not rendition_key:
+        return task_id
+    key = IN_FLIGHT_DOWNLOAD_KEY_PREFIX + rendition_key
+    try:
+        if connection.set(key, task_id, nx=True, ex=settings.DOWNLOAD_IN_FLIGHT_TIMEOUT):
+            return task_id
+        owner_task_id = connection.get(key)
+    except redis.RedisError:
+        return task_id
+    return owner_task_id.decode() if owner_task_id else task_id
+
+
+def release_in_flight_download(rendition_key, task_id):
+    connection = get_redis_connection()
+    if connection is None or not rendition_key:
+        return
+    try:
+        connection.eval(RELEASE_IN_FLIGHT_DOWNLOAD_SCRIPT, 1, IN_FLIGHT_DOWNLOAD_KEY_PREFIX + rendition_key, task_id)
+    except redis.RedisError:
+        pass
+
+
+def is_in_flight_download_owner(rendition_key, task_id):
+    """
+    Checks whether the task still owns the in-flight download of the rendition (its claim has not expired).
+    Returns True if it can not be checked (redis is not available).
+    :param rendition_key:
+    :param task_id:
+    :return:
+    """
+    connection = get_redis_connection()
+    if connection is None or not rendition_key:
+        return True
+    try:
+        owner_task_id = connection.get(IN_FLIGHT_DOWNLOAD_KEY_PREFIX + rendition_key)
+    except redis.RedisError:
+        return True
+    return bool(owner_task_id) and owner_task_id.decode() == task_id
+
+
+@contextmanager
+def in_flight_download_heartbeat(rendition_key, task_id, hand_over=False):
+    """
+    Keeps the in-flight claim of the running task alive: the claim expires DOWNLOAD_IN_FLIGHT_HEARTBEAT_TIMEOUT
+    seconds after the task stops (e.g. its worker is killed), instead of DOWNLOAD_IN_FLIGHT_TIMEOUT,
+    so the waiters of a lost download fail over early (see wait_for_result).
+    With hand_over, the claim gets DOWNLOAD_IN_FLIGHT_TIMEOUT again at the end for the next task of the chain.
+    :param rendition_key:
+    :param task_id:
+    :param hand_over:
+    :return:
+    """
+    connection = get_redis_connection()
+    if connection is None or not rendition_key or not task_id:
+        yield
+        return
+    key = IN_FLIGHT_DOWNLOAD_KEY_PREFIX + rendition_key
+    timeout = settings.DOWNLOAD_IN_FLIGHT_HEARTBEAT_TIMEOUT
+    stopped = threading.Event()
+
+    def beat():
+        while True:
+            try:
+                connection.eval(HEARTBEAT_IN_FLIGHT_DOWNLOAD_SCRIPT, 1, key, task_id, timeout)
+            except redis.RedisError:
+                pass
+            if stopped.wait(timeout / 3):
+                return
+
+    heartbeat_thread = threading.Thread(target=beat, daemon=True)
+    heartbeat_thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        heartbeat_thread.join()
+        if hand_over:
+            try:
+                connection.eval(
+                    HEARTBEAT_IN_FLIGHT_DOWNLOAD_SCRIPT, 1, key, task_id, settings.DOWNLOAD_IN_FLIGHT_TIMEOUT
+                )
+            except redis.RedisError:
+                pass
+
+
+def publish_task_done(task_id):
+    """
+    Notifies the waiters of the task that its result is stored in the result backend.
+    :param task_id:
+    :return:
+    """
+    connection = get_redis_connection()
+    if connection is None or not task_id:
+        return
+    try:
+        connection.publish(TASK_DONE_CHANNEL_PREFIX + task_id, 'done')
+    except redis.RedisError:
+        pass
+
+
+def wait_for_result(async_result, in_flight_key=None, timeout=None):
+    """
+    Waits for the task to be done using the redis task-done notification instead of polling the result backend,
+    then returns the task result (like AsyncResult.get, raises the task error).
+    The result backend is checked once after subscribing (the task may be done before that) and then only every
+    TASK_RESULT_RECHECK_INTERVAL seconds as a safety net for missed notifications.
+    The wait is bounded by timeout (TASK_RESULT_WAIT_TIMEOUT by default). If in_flight_key is given, the wait also
+    ends when the task no longer owns the in-flight download for two rechecks in a row (its worker is lost).
+    Falls back to AsyncResult.get if redis is not available.
+    Raises TaskResultWaitError if the task is not done in time or is lost.
+    :param async_result:
+    :param in_flight_key: the rendition key of the download task
+    :param timeout: seconds
+    :return:
+    """
+    timeout = settings.TASK_RESULT_WAIT_TIMEOUT if timeout is None else timeout
+    connection = get_redis_connection()
+    if connection is None:
+        return get_result(async_result, timeout)
+    try:
+        pubsub = connection.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(TASK_DONE_CHANNEL_PREFIX + async_result.id)
+    except redis.RedisError:
+        return get_result(async_result, timeout)
+    deadline = time.monotonic() + timeout
+    owner_lost_checks = 0
+    try:
+        while not async_result.ready():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TaskResultWaitError("The task is not done in time!")
+            if pubsub.get_message(timeout=min(settings.TASK_RESULT_RECHECK_INTERVAL, remaining)):
+                break
+            # the owner releases the claim just before its result is stored, a lost owner is not seen twice
+            if in_flight_key and not is_in_flight_download_owner(in_flight_key, async_result.id):
+                owner_lost_checks += 1
+                if owner_lost_checks > 1 and not async_result.ready():
+                    raise TaskResultWaitError("The task is lost!")
+            else:
+                owner_lost_checks = 0
+    except redis.RedisError:
+        pass
+    finally:
+        pubsub.close()
+    return get_result(async_result, max(deadline - time.monotonic(), 1))
+
+
+def get_result(async_result, timeout):
+    try:
+        return async_result.get(timeout=timeout)
+    except CeleryTimeoutError as error:
+        raise TaskResultWaitError("The task is not done in time!") from error
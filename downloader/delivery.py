@@ -0,0 +1,210 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.crypto import get_random_string
+from django.utils.http import content_disposition_header, http_date, parse_etags, parse_http_date_safe, quote_etag
+from rest_framework import status
+
+RANGE_HEADER_REGEX = re.compile(r'^bytes=(?P<ranges>[0-9\-,\s]+)$')
+MAX_RANGES_COUNT = 16
+FILE_CHUNK_SIZE = 64 * 1024
+DJANGO_DELIVERY_BACKEND = 'django'
+X_ACCEL_REDIRECT_DELIVERY_BACKEND = 'x-accel-redirect'
+X_SENDFILE_DELIVERY_BACKEND = 'x-sendfile'
+
+
+def make_file_response(request, file_path, as_attachment=True):
+    """
+    Returns a response of the file using the CONTENT_DELIVERY_BACKEND.
+    The front proxy backends only get the headers, the proxy handles the transfer (and the range requests) itself.
+    :param request:
+    :param file_path:
+    :param as_attachment:
+    :return:
+    """
+    backend = settings.CONTENT_DELIVERY_BACKEND
+    if backend == X_ACCEL_REDIRECT_DELIVERY_BACKEND:
+        internal_url = get_internal_url(file_path)
+        if internal_url:
+            return make_offloaded_file_response(file_path, 'X-Accel-Redirect', internal_url, as_attachment)
+    elif backend == X_SENDFILE_DELIVERY_BACKEND:
+        if is_under_delivery_root(file_path):
+            return make_offloaded_file_response(file_path, 'X-Sendfile', os.path.abspath(file_path), as_attachment)
+    return make_django_file_response(request, file_path, as_attachment)
+
+
+def make_offloaded_file_response(file_path, header, header_value, as_attachment=True):
+    response = HttpResponse(content_type=guess_content_type(file_path))
+    response[header] = header_value
+    response['Content-Disposition'] = content_disposition_header(as_attachment, os.path.basename(file_path))
+    return response
+
+
+def get_internal_url(file_path):
+    """
+    Returns the internal (front proxy) url of the file, or None if the file is not under CONTENT_DELIVERY_ROOT.
+    :param file_path:
+    :return:
+    """
+    if not is_under_delivery_root(file_path):
+        return None
+    relative_path = os.path.relpath(os.path.abspath(file_path), os.path.abspath(settings.CONTENT_DELIVERY_ROOT))
+    return settings.CONTENT_DELIVERY_INTERNAL_URL.rstrip('/') + '/' + quote(relative_path.replace(os.sep, '/'))
+
+
+def is_under_delivery_root(file_path):
+    root = os.path.abspath(settings.CONTENT_DELIVERY_ROOT)
+    return os.path.commonpath([root, os.path.abspath(file_path)]) == root
+
+
+def make_django_file_response(request, file_path, as_attachment=True):
+    """
+    Returns a response of the file that supports conditional requests and resumable downloads:
+    ETag and Last-Modified headers, If-None-Match/If-Modified-Since (304 Not Modified),
+    Range (206 Partial Content, multipart/byteranges for multiple ranges, 416 for unsatisfiable ranges) and If-Range.
+    Falls back to a plain FileResponse for the whole file.
+    :param request:
+    :param file_path:
+    :param as_attachment:
+    :return:
+    """
+    file_stat = os.stat(file_path)
+    file_size = file_stat.st_size
+    etag = make_file_etag(file_stat)
+    last_modified = http_date(file_stat.st_mtime)
+    if not is_modified(request, etag, file_stat.st_mtime):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        response['Last-Modified'] = last_modified
+        return response
+
+    ranges = None
+    if request.headers.get('Range') and if_range_matches(request, etag, last_modified):
+        ranges = parse_range_header(request.headers['Range'], file_size)
+        if ranges == []:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{file_size}'
+            return response
+
+    content_type = guess_content_type(file_path)
+    if not ranges:
+        response = FileResponse(open(file_path, 'rb'), as_attachment=as_attachment, status=status.HTTP_200_OK)
+    elif len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(
+            iter_file_range(file_path, start, end), content_type=content_type, status=status.HTTP_206_PARTIAL_CONTENT
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{file_size}'
+    else:
+        boundary = get_random_string(32)
+        parts = [
+            (f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+             f'Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n'.encode(), start, end)
+            for start, end in ranges
+        ]
+        closing = f'\r\n--{boundary}--\r\n'.encode()
+        response = StreamingHttpResponse(
+            iter_multipart_file_ranges(file_path, parts, closing),
+            content_type=f'multipart/byteranges; boundary={boundary}', status=status.HTTP_206_PARTIAL_CONTENT
+        )
+        response['Content-Length'] = sum(
+            len(header) + end - start + 1 + 2 for header, start, end in parts
+        ) + len(closing) - 2
+    if ranges:
+        response['Content-Disposition'] = content_disposition_header(as_attachment, os.path.basename(file_path))
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    return response
+
+
+def make_file_etag(file_stat):
+    # A strong validator of the file version, changes whenever the file is replaced or rewritten.
+    return quote_etag(f'{file_stat.st_ino:x}-{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}')
+
+
+def is_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        # Weak comparison for If-None-Match.
+        return not ('*' in etags or etag.removeprefix('W/') in [tag.removeprefix('W/') for tag in etags])
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if if_modified_since is not None:
+        return int(mtime) > if_modified_since
+    return True
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        # Strong comparison for If-Range.
+        return if_range == etag
+    return if_range == last_modified
+
+
+def parse_range_header(range_header, file_size):
+    """
+    Parses the Range header and returns the list of (start, end) byte positions (both inclusive).
+    Returns None if the header is invalid or has too many ranges (the whole file should be sent)
+    and an empty list if none of the ranges is satisfiable.
+    :param range_header:
+    :param file_size:
+    :return:
+    """
+    match = RANGE_HEADER_REGEX.match(range_header.strip())
+    if not match:
+        return None
+    range_specs = [spec.strip() for spec in match.group('ranges').split(',') if spec.strip()]
+    if not range_specs or len(range_specs) > MAX_RANGES_COUNT:
+        return None
+    ranges = []
+    for range_spec in range_specs:
+        start, separator, end = range_spec.partition('-')
+        if not separator or (not start and not end):
+            return None
+        if not start:
+            # suffix range, the last n bytes
+            suffix_length = int(end)
+            if suffix_length == 0:
+                continue
+            start, end = max(file_size - suffix_length, 0), file_size - 1
+        else:
+            start, end = int(start), int(end) if end else None
+            if end is not None and end < start:
+                return None
+            if start >= file_size:
+                continue
+            end = file_size - 1 if end is None else min(end, file_size - 1)
+        ranges.append((start, end))
+    return ranges
+
+
+def iter_file_range(file_path, start, end):
+    with open(file_path, 'rb') as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def iter_multipart_file_ranges(file_path, parts, closing):
+    for index, (header, start, end) in enumerate(parts):
+        yield header if index == 0 else b'\r\n' + header
+        yield from iter_file_range(file_path, start, end)
+    yield closing
+
+
+def guess_content_type(file_path):
+    content_type, encoding = mimetypes.guess_type(file_path)
+    return content_type or 'application/octet-stream'
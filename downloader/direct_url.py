@@ -0,0 +1,83 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from .info_store import get_url_expiration
+from .main_downloader import DownloadProcessError, select_content_format
+from .models import Content
+
+# The protocols of the formats that a client can download from their url itself
+DIRECT_URL_PROTOCOLS = ('http', 'https')
+
+
+def get_direct_url(content):
+    """
+    Returns the direct media url of the content, or None if the content should be delivered by the local pipeline.
+    The stored url is returned while it is valid, otherwise the format is selected again from the saved info and
+    its url is stored on the content (download_url and download_url_expiration_date).
+    Only the single file formats that need no merge, no conversion and no clip are delivered directly (no playlists).
+    :param content:
+    :return:
+    """
+    if not settings.DIRECT_URL_DELIVERY or content.is_playlist:
+        return None
+    if has_valid_direct_url(content):
+        return content.download_url
+    if content.start_time or content.end_time:
+        return None
+    selected_info = select_direct_format(content)
+    if selected_info is None:
+        return None
+    content.download_url = selected_info['url']
+    content.download_url_expiration_date = get_url_expiration(selected_info['url']) or (
+        timezone.now() + timedelta(seconds=settings.DIRECT_URL_MAX_AGE)
+    )
+    Content.objects.filter(pk=content.pk).update(
+        download_url=content.download_url, download_url_expiration_date=content.download_url_expiration_date
+    )
+    return content.download_url if has_valid_direct_url(content) else None
+
+
+def has_valid_direct_url(content):
+    if not content.download_url or not content.download_url_expiration_date:
+        return False
+    margin = timedelta(seconds=settings.DIRECT_URL_EXPIRATION_MARGIN)
+    return content.download_url_expiration_date - margin > timezone.now()
+
+
+def select_direct_format(content):
+    """
+    Selects the format of the content from its saved info and returns it if it can be delivered directly, or None.
+    A merged selection is replaced by the single file format of the extension if it has the same height.
+    :param content:
+    :return:
+    """
+    try:
+        selected_info, _ = select_content_format(content)
+        if selected_info is not None and selected_info.get('requested_formats'):
+            height = selected_info.get('height')
+            selected_info, _ = select_content_format(content, format=f'best[ext={content.extension}]')
+            if selected_info is not None and selected_info.get('height') != height:
+                return None
+    except DownloadProcessError:
+        return None
+    if selected_info is None or not is_direct_format(selected_info, content):
+        return None
+    return selected_info
+
+
+def is_direct_format(selected_info, content):
+    """
+    Checks whether the format is a single file of the content extension that a client can download by its url.
+    The formats that need cookies are not direct, the cookies are not passed to the client.
+    :param selected_info:
+    :param content:
+    :return:
+    """
+    return bool(
+        selected_info.get('url')
+        and not selected_info.get('requested_formats')
+        and not selected_info.get('cookies')
+        and selected_info.get('protocol') in DIRECT_URL_PROTOCOLS
+        and selected_info.get('ext') == content.extension
+    )
+
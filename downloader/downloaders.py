@@ -1,25 +1,93 @@
 from config.settings import BASE_DIR
+import functools
 import os
+import shutil
 import yt_dlp
-from yt_dlp.utils import (ExtractorError, EntryNotInPlaylist, ReExtractInfo, DownloadError, variadic)
+from yt_dlp.utils import (ExtractorError, EntryNotInPlaylist, ReExtractInfo, DownloadError, variadic,
+                          download_range_func)
 from PIL import Image
-import contextlib
-import fileinput
-import json
 from datetime import datetime
+from .info_store import get_info_store
+from .options import OptionProfile, thaw, split_per_use_options
+from .pool import youtubedl_pool
+from .postprocessors import FFmpegSinglePassAudioPP
+
+# the detail fields that the options are derived from (the other fields, like url, are per request)
+OPTION_DETAIL_FIELDS = (
+    'type', 'extension', 'resolution', 'frame_rate', 'aspect_ratio', 'audio_bitrate', 'start_time', 'end_time',
+)
+# the format sort fields preferring the sources whose codecs can be stream copied (remuxed) to the extensions
+REMUXABLE_CODECS_FORMAT_SORT = {
+    'mp4': ['vcodec:h264', 'acodec:aac'],
+    'mov': ['vcodec:h264', 'acodec:aac'],
+    'aac': ['acodec:aac'],
+    'mp3': ['acodec:mp3'],
+}
 
 
 class CustomYoutubeDL(yt_dlp.YoutubeDL):
+    def __init__(self, params=None, auto_init=True):
+        # the downloaded infos whose postprocessing is deferred (the defer_postprocessing param)
+        self.deferred_postprocessing_infos = []
+        # YoutubeDL changes its params, the options may also be an immutable OptionProfile
+        super().__init__(thaw(params) if params is not None else None, auto_init)
+
     def __download_wrapper(self, *args, **kwargs):
         return self._YoutubeDL__download_wrapper(*args, **kwargs)
 
+    def reset(self, params=None):
+        """
+        Resets the per-use state of a reused (pooled) object and applies the per-use params (outtmpl and the hooks).
+        Keeps the loaded extractors, postprocessors and format selector, the cookies and the HTTP connections.
+        :param params:
+        :return:
+        """
+        params = params or {}
+        self._download_retcode = 0
+        self._num_downloads = 0
+        self._num_videos = 0
+        self._playlist_level = 0
+        self._playlist_urls = set()
+        self._printed_messages = set()
+        self.deferred_postprocessing_infos = []
+        self.params.pop('outtmpl', None)
+        if params.get('outtmpl'):
+            self.params['outtmpl'] = params['outtmpl']
+        self._parse_outtmpl()
+        self._progress_hooks = []
+        self._postprocessor_hooks = []
+        for pps in self._pps.values():
+            for pp in pps:
+                pp._progress_hooks = [pp.report_progress]
+        for progress_hook in params.get('progress_hooks', []):
+            self.add_progress_hook(progress_hook)
+        for postprocessor_hook in params.get('postprocessor_hooks', []):
+            self.add_postprocessor_hook(postprocessor_hook)
+
+    def post_process(self, filename, info, files_to_move=None):
+        if not self.params.get('defer_postprocessing'):
+            return super().post_process(filename, info, files_to_move)
+        # modified
+        # keeping the downloaded info for the postprocess stage instead of running the postprocessors
+        info['filepath'] = filename
+        info['__files_to_move'] = files_to_move or {}
+        # the merger and the fixups of the download itself can not be deferred
+        for postprocessor in info.pop('__postprocessors', None) or []:
+            info = self.run_pp(postprocessor, info)
+        self.deferred_postprocessing_infos.append(dict(info))
+        del info['__files_to_move']
+        return info
+
     def download_with_info_file(self, info_filename, tried_to_refresh_info=False):
-        with contextlib.closing(fileinput.FileInput(
-                [info_filename], mode='r',
-                openhook=fileinput.hook_encoded('utf-8'))) as f:
-            # FileInput doesn't have a read method, we can't call json.load
-            infos = [self.sanitize_info(info, self.params.get('clean_infojson', True))
-                     for info in variadic(json.loads('\n'.join(f)))]
+        info_store = get_info_store()
+        loaded_info = info_store.load(info_filename)
+        # modified
+        # refreshing the info file before its format urls expire, instead of after a failed download
+        if not tried_to_refresh_info and not info_store.is_fresh(loaded_info) and loaded_info.get('webpage_url'):
+            self.report_warning('The format urls of the info file are about to expire; refreshing the info file')
+            loaded_info = self.refresh_info_file(loaded_info['webpage_url'], info_filename)
+            tried_to_refresh_info = True
+        infos = [self.sanitize_info(info, self.params.get('clean_infojson', True)) for info in variadic(loaded_info)]
         for info in infos:
             try:
                 self.__download_wrapper(self.process_ie_result)(info, download=True)
@@ -33,9 +101,7 @@ class CustomYoutubeDL(yt_dlp.YoutubeDL):
                 # refreshing the info file
                 if not tried_to_refresh_info:
                     self.report_warning(f'It seems the info file data is expired; trying to refresh the info file')
-                    new_info = self.extract_info(webpage_url, download=False)
-                    with open(info_filename, 'w') as info_file:
-                        json.dump(self.sanitize_info(new_info), info_file)
+                    self.refresh_info_file(webpage_url, info_filename)
                     return self.download_with_info_file(info_filename, tried_to_refresh_info=True)
                 else:
                     self.report_warning(f'The info failed to download: {e}; trying with URL {webpage_url}')
@@ -45,6 +111,40 @@ class CustomYoutubeDL(yt_dlp.YoutubeDL):
                 self.report_error(e)
         return self._download_retcode
 
+    def extract_info_only(self, url):
+        """
+        Extracts the info of the url without processing it (no format sorting and selection), only filling the
+        common fields of the processed infos (duration_string, upload_date, thumbnail ...).
+        The formats are resolved later by the download. The results that are not a single video are processed,
+        the url entries of the playlists are not extracted (each entry is extracted by its own download task).
+        :param url:
+        :return:
+        """
+        info = self.extract_info(url, download=False, process=False)
+        if info.get('_type', 'video') != 'video':
+            extract_flat = self.params.get('extract_flat', False)
+            self.params['extract_flat'] = extract_flat or 'in_playlist'
+            try:
+                return self.process_ie_result(info, download=False)
+            finally:
+                self.params['extract_flat'] = extract_flat
+        self._fill_common_fields(info, final=False)
+        if not info.get('thumbnail') and info.get('thumbnails'):
+            self._sanitize_thumbnails(info)
+            info['thumbnail'] = info['thumbnails'][-1]['url']
+        return info
+
+    def refresh_info_file(self, webpage_url, info_filename):
+        """
+        Extracts the info of the url again and saves it to the info file. Returns the saved (sanitized) info.
+        :param webpage_url:
+        :param info_filename:
+        :return:
+        """
+        new_info = self.sanitize_info(self.extract_info(webpage_url, download=False))
+        get_info_store().save(new_info, path=info_filename)
+        return new_info
+
 
 class ThumbnailEditedYoutubeDL(CustomYoutubeDL):
     # making the thumbnails 1:1
@@ -68,6 +168,12 @@ class ThumbnailEditedYoutubeDL(CustomYoutubeDL):
         return ret
 
 
+class DownloadRangeFunc(download_range_func):
+    # hashable, so it can be a part of an option profile
+    def __hash__(self):
+        return hash(repr(self))
+
+
 class BaseDownloader:
     is_downloader = True
     extractor = ''
@@ -86,92 +192,226 @@ class YoutubeDownloader(BaseDownloader):
         self.info_file_path = info_file_path
         if self.info and not self.info_file_path and self.info.get('info_file_path', None):
             self.info_file_path = self.info['info_file_path']
-        self.options = default_options if default_options else {}
+        # the (shared) option profile is never changed, the detail options are derived from it
+        self.options, self.per_use_options = split_per_use_options(default_options)
         self.main_downloader_obj = main_downloader_obj
         self.detail = detail if detail else {}
         self.is_video = True if self.detail.get('type') == 'video' else False
+        # the data of the pooled YoutubeDL object of the last download (see keep_download_data)
+        self.prepared_file_path = None
+        self.deferred_postprocessing_infos = []
 
     def get_format(self, default_format='bestvideo+bestaudio/best/best*'):
         if not self.detail:
             return default_format
         translated_format = ''
-        postprocessors = self.options.get('postprocessors', [])
+        filter_string = ''
+        if self.detail.get('extension'):
+            filter_string += '[ext={extension}]'.format(extension=self.detail['extension'])
         if self.is_video:
-            filter_string = ''
-            if self.detail.get('extension'):
-                filter_string += '[ext={extension}]'.format(extension=self.detail['extension'])
-                self.options.update(
-                    {
-                        'merge_output_format': '/'.join([self.detail['extension'], 'mp4', 'mkv', 'webm']),
-                    }
-                )
-                postprocessors += [{
-                        'key': 'FFmpegVideoConvertor',
-                        'preferedformat': f'{self.detail['extension']}',
-                    }, ]
             if self.detail.get('aspect_ratio'):
                 filter_string += '[aspect_ratio={aspect_ratio}]'.format(aspect_ratio=self.detail['aspect_ratio'])
             translated_format += f'bestvideo{filter_string}+bestaudio/bestvideo+bestaudio/best/best*'
-
         else:
-            filter_string = ''
-            if self.detail.get('extension'):
-                filter_string += '[ext={extension}]'.format(extension=self.detail['extension'])
-                self.options.update(
-                    {
-                        'writethumbnail': True,
-                    }
-                )
-                audio_converter_postprocessor = {
-                            'key': 'FFmpegExtractAudio',
-                            'preferredcodec': f'{self.detail["extension"]}',
-                }
-                if self.detail.get('audio_bitrate'):
-                    audio_converter_postprocessor.update({
-                        'preferredquality': f'{self.detail["audio_bitrate"]}',
-                    })
-                postprocessors += [
-                    {
-                        'key': 'EmbedThumbnail',
-                        'already_have_thumbnail': False,
-                    },
-                    audio_converter_postprocessor,
-                ]
             translated_format += f'bestaudio{filter_string}/bestaudio/best'
-        postprocessors = delete_copies(postprocessors)
-        self.options['postprocessors'] = postprocessors
         return translated_format
 
     def get_format_sort(self, default_sort=''):
         if not self.detail:
             return default_sort if default_sort else []
         format_sort_list = []
+        codec_sort_list = REMUXABLE_CODECS_FORMAT_SORT.get(self.detail.get('extension'), [])
         if self.is_video:
             if self.detail.get('resolution'):
                 format_sort_list.append('height~{resolution}'.format(resolution=self.detail['resolution']))
+            elif codec_sort_list:
+                # the codec preference never outranks the resolution
+                format_sort_list.append('res')
             if self.detail.get('frame_rate'):
                 format_sort_list.append('fps~{frame_rate}'.format(frame_rate=self.detail['frame_rate']))
+            format_sort_list += codec_sort_list
         else:
+            # copying the audio is lossless, so its codec is preferred over the nearest bitrate
+            format_sort_list += codec_sort_list
             if self.detail.get('audio_bitrate'):
                 format_sort_list.append('abr~{audio_bitrate}'.format(audio_bitrate=self.detail['audio_bitrate']))
         return format_sort_list
 
-    def get_options(self):
-        format_time = datetime.now().strftime('%Y%m%d%H%M%S')
-        self.options.update({
-            'outtmpl': str(BASE_DIR / os.path.join(self.where_to_save, f'%(title)s-{format_time}.%(ext)s')),
+    def get_clip(self):
+        """
+        Returns the (start_time, end_time) clip of the detail in seconds, or None for the whole content.
+        :return:
+        """
+        start_time, end_time = (float(self.detail.get(field) or 0) for field in ('start_time', 'end_time'))
+        if not start_time and not end_time:
+            return None
+        return start_time, end_time or float('inf')
+
+    def get_detail_options(self):
+        """
+        Returns the options derived from the detail: the format, the format sort and the postprocessors of the
+        extension (running before the postprocessors of the profile).
+        The audio of the COVER_EXTS containers is post-processed in a single pass (FFmpegSinglePassAudio).
+        :return:
+        """
+        detail_options = {
             'format': self.get_format(),
             'format_sort': self.get_format_sort(),
+        }
+        clip = self.get_clip()
+        if clip:
+            # only the fragments of the clip are downloaded (and postprocessed)
+            detail_options['download_ranges'] = DownloadRangeFunc([], [clip])
+        postprocessors = []
+        profile_postprocessors = thaw(self.options.get('postprocessors', []))
+        if self.detail and self.detail.get('extension'):
+            if self.is_video:
+                detail_options['merge_output_format'] = '/'.join([self.detail['extension'], 'mp4', 'mkv', 'webm'])
+                postprocessors.append({
+                    'key': 'FFmpegRemuxingVideoConvertor',
+                    'preferedformat': f'{self.detail['extension']}',
+                })
+            else:
+                detail_options['writethumbnail'] = True
+                audio_converter_postprocessor = {
+                    'key': 'FFmpegExtractAudio',
+                    'preferredcodec': f'{self.detail["extension"]}',
+                }
+                if self.detail.get('audio_bitrate'):
+                    audio_converter_postprocessor.update({
+                        'preferredquality': f'{self.detail["audio_bitrate"]}',
+                    })
+                if self.detail['extension'] in FFmpegSinglePassAudioPP.COVER_EXTS:
+                    # converting, embedding the cover and adding the metadata in one ffmpeg command
+                    audio_converter_postprocessor['key'] = 'FFmpegSinglePassAudio'
+                    postprocessors.append(audio_converter_postprocessor)
+                    profile_postprocessors = [
+                        postprocessor for postprocessor in profile_postprocessors
+                        if postprocessor.get('key') != 'FFmpegMetadata'
+                    ]
+                else:
+                    postprocessors += [
+                        audio_converter_postprocessor,
+                        {
+                            'key': 'EmbedThumbnail',
+                            'already_have_thumbnail': False,
+                        },
+                    ]
+        postprocessors += profile_postprocessors
+        detail_options['postprocessors'] = delete_copies(postprocessors)
+        return detail_options
+
+    def get_option_profile(self):
+        """
+        Returns the option profile of the detail (cached per downloader class, profile and detail).
+        :return:
+        """
+        return get_detail_option_profile(type(self), self.options, make_option_detail(self.detail))
+
+    def get_options(self):
+        format_time = datetime.now().strftime('%Y%m%d%H%M%S')
+        options = self.get_option_profile().to_dict()
+        options.update(self.per_use_options)
+        options['outtmpl'] = str(BASE_DIR / os.path.join(self.where_to_save, f'%(title)s-{format_time}.%(ext)s'))
+        return options
+
+    def get_master_detail(self):
+        """
+        Returns the detail of the master copy the detail rendition can be derived from: the best audio for the audio,
+        or the video with the same resolution, frame rate and aspect ratio (in the codecs of mp4, remuxable to the
+        other containers) for the video.
+        :return:
+        """
+        if not self.is_video:
+            return {'type': 'audio'}
+        master_detail = {field: self.detail.get(field) for field in ('resolution', 'frame_rate', 'aspect_ratio')}
+        return dict(master_detail, type='video', extension='mp4')
+
+    def get_master_options(self, outtmpl):
+        options = get_detail_option_profile(
+            type(self), self.options, make_option_detail(self.get_master_detail())
+        ).to_dict()
+        options.update(self.per_use_options)
+        # the master is kept as downloaded, the postprocessors only run on its derived renditions
+        options.update({
+            'outtmpl': outtmpl,
+            'postprocessors': [],
+            'writethumbnail': False,
+            'defer_postprocessing': True,
         })
-        self.options.get('postprocessors', []).reverse()
-        return self.options
+        return options
+
+    def download_master(self, outtmpl):
+        """
+        Downloads the master copy of the detail without postprocessing it.
+        Returns error code and the downloaded info (with its filepath) or None.
+        :param outtmpl:
+        :return code, info:
+        """
+        code = 1
+        with youtubedl_pool.acquire(CustomYoutubeDL, self.get_master_options(outtmpl)) as ytdl_obj:
+            if self.info_file_path:
+                code = ytdl_obj.download_with_info_file(self.info_file_path)
+            elif ytdl_obj.extract_info(self.url, download=True):
+                code = 0
+            downloaded_infos = ytdl_obj.deferred_postprocessing_infos
+        # the master copy is a single video
+        if code or len(downloaded_infos) != 1:
+            return code or 1, None
+        master_info = downloaded_infos[0]
+        master_info.pop('__files_to_move', None)
+        return code, master_info
+
+    def derive(self, master_path, master_info):
+        """
+        Derives the rendition of the detail locally from a master copy: postprocesses a hard link to the master file,
+        the postprocessors replace and remove their input path but not the master file (copied across file systems).
+        Returns error code, postprocessed info and the prepared file path like download method.
+        :param master_path:
+        :param master_info:
+        :return code, info, prepared_file_path:
+        """
+        youtubedl = CustomYoutubeDL if self.is_video else ThumbnailEditedYoutubeDL
+        with youtubedl_pool.acquire(youtubedl, self.get_options()) as ytdl_obj:
+            info = dict(master_info)
+            file_path = ytdl_obj.prepare_filename(info)
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            if os.path.lexists(file_path):
+                os.remove(file_path)
+            try:
+                os.link(master_path, file_path)
+            except OSError:
+                shutil.copyfile(master_path, file_path)
+            ytdl_obj._write_thumbnails('video', info, file_path)
+            info = ytdl_obj.post_process(file_path, info)
+            self.keep_download_data(ytdl_obj)
+        return 0, info, self.prepared_file_path
+
+    def keep_download_data(self, ytdl_obj):
+        """
+        Keeps the data of the pooled YoutubeDL object that is used after the object is released to the pool:
+        the file path prepared for the info and the (sanitized) infos of the deferred postprocessing.
+        :param ytdl_obj:
+        :return:
+        """
+        self.prepared_file_path = ytdl_obj.prepare_filename(self.info) if self.info else None
+        self.deferred_postprocessing_infos = [
+            ytdl_obj.sanitize_info(info) for info in ytdl_obj.deferred_postprocessing_infos
+        ]
 
     def download(self, fake=False):
+        """
+        Downloads the content of the detail, the YoutubeDL object stays in the pool (see keep_download_data).
+        Returns error code, info and the file path prepared for the info.
+        :param fake:
+        :return code, info, prepared_file_path:
+        """
         print('this is the customized download function for youtube!')
         code = 1
-        print(self.get_options())
+        options = self.get_options()
+        print(options)
         youtubedl = CustomYoutubeDL if self.is_video else ThumbnailEditedYoutubeDL
-        with youtubedl(self.get_options()) as ytdl_obj:
+        with youtubedl_pool.acquire(youtubedl, options) as ytdl_obj:
             print('downloading:')
             if fake:
                 code = 0
@@ -182,12 +422,29 @@ class YoutubeDownloader(BaseDownloader):
                 if self.info:
                     code = 0
             print('file downloaded successfully')
-            return code, self.info, ytdl_obj
+            self.keep_download_data(ytdl_obj)
+        return code, self.info, self.prepared_file_path
 
 
 class InstagramDownloader(YoutubeDownloader):
     extractor = 'instagram'
 
+
+def make_option_detail(detail):
+    """
+    Returns the hashable detail of the option profile cache, only containing the OPTION_DETAIL_FIELDS.
+    :param detail:
+    :return:
+    """
+    return OptionProfile({field: value for field, value in (detail or {}).items() if field in OPTION_DETAIL_FIELDS})
+
+
+@functools.lru_cache(maxsize=256)
+def get_detail_option_profile(downloader_class, profile, detail):
+    downloader = downloader_class(None, detail=thaw(detail), default_options=profile)
+    return profile.replace(downloader.get_detail_options())
+
+
 def delete_copies(arr):
     new_list = []
     for i in arr:
@@ -73,13 +73,13 @@ class YoutubeDownloaderTests(TestCase):
     def test_video_format_sort_list(self):
         self.assertListEqual(
             self.video_youtube_downloader_obj.get_options().get('format_sort', None),
-            [f'height~{self.video_detail['resolution']}', f'fps~{self.video_detail['frame_rate']}']
+            [f'height~{self.video_detail['resolution']}', f'fps~{self.video_detail['frame_rate']}', 'vcodec:h264', 'acodec:aac']
         )
 
     def test_audio_format_sort_list(self):
         self.assertListEqual(
             self.audio_youtube_downloader_obj.get_options().get('format_sort', None),
-            [f'abr~{self.audio_detail['audio_bitrate']}', ]
+            ['acodec:mp3', f'abr~{self.audio_detail['audio_bitrate']}']
         )
 
     def test_video_postprocessors_list(self):
@@ -87,7 +87,7 @@ class YoutubeDownloaderTests(TestCase):
             self.video_youtube_downloader_obj.get_options().get('postprocessors', None),
             [
                 {
-                    'key': 'FFmpegVideoConvertor',
+                    'key': 'FFmpegRemuxingVideoConvertor',
                     'preferedformat': f'{self.video_detail['extension']}',
                 },
                 {
@@ -101,42 +101,39 @@ class YoutubeDownloaderTests(TestCase):
             self.audio_youtube_downloader_obj.get_options().get('postprocessors', None),
             [
                 {
-                    'key': 'FFmpegExtractAudio',
+                    'key': 'FFmpegSinglePassAudio',
                     'preferredcodec': f'{self.audio_detail['extension']}',
                     'preferredquality': f'{self.audio_detail['audio_bitrate']}',
                 },
-                {
-                    'key': 'EmbedThumbnail',
-                    'already_have_thumbnail': False,
-                },
-                {
-                    'key': 'FFmpegMetadata',
-                },
             ]
         )
 
 
     def test_video_content_downloading(self):
-        code, _, ytdl_obj = self.video_youtube_downloader_obj.download(fake=False)
+        code, _, prepared_file_path = self.video_youtube_downloader_obj.download(fake=False)
         self.assertEqual(code, 0)
-        self.assertTrue(os.path.exists(self.video_main_downloader_obj.get_download_path(ytdl_obj)))
-        self.assertTrue(os.path.isfile(self.video_main_downloader_obj.get_download_path(ytdl_obj)))
-        os.remove(self.video_main_downloader_obj.get_download_path(ytdl_obj))
+        self.video_main_downloader_obj.prepared_file_path = prepared_file_path
+        download_path = self.video_main_downloader_obj.get_download_path(None)
+        self.assertTrue(os.path.exists(download_path))
+        self.assertTrue(os.path.isfile(download_path))
+        os.remove(download_path)
         # fake downloading
         code, _, _ = self.video_youtube_downloader_obj.download(fake=True)
         self.assertEqual(code, 0)
-        self.assertFalse(os.path.exists(self.video_main_downloader_obj.get_download_path(ytdl_obj)))
+        self.assertFalse(os.path.exists(download_path))
 
     def test_audio_content_downloading(self):
-        code, _, ytdl_obj = self.audio_youtube_downloader_obj.download(fake=False)
+        code, _, prepared_file_path = self.audio_youtube_downloader_obj.download(fake=False)
         self.assertEqual(code, 0)
-        self.assertTrue(os.path.exists(self.audio_main_downloader_obj.get_download_path(ytdl_obj)))
-        self.assertTrue(os.path.isfile(self.audio_main_downloader_obj.get_download_path(ytdl_obj)))
-        os.remove(self.audio_main_downloader_obj.get_download_path(ytdl_obj))
+        self.audio_main_downloader_obj.prepared_file_path = prepared_file_path
+        download_path = self.audio_main_downloader_obj.get_download_path(None)
+        self.assertTrue(os.path.exists(download_path))
+        self.assertTrue(os.path.isfile(download_path))
+        os.remove(download_path)
         # fake downloading
         code, _, _ = self.audio_youtube_downloader_obj.download(fake=True)
         self.assertEqual(code, 0)
-        self.assertFalse(os.path.exists(self.audio_main_downloader_obj.get_download_path(ytdl_obj)))
+        self.assertFalse(os.path.exists(download_path))
 
     def test_main_downloader_uses_youtube_downloader(self):
         with CustomYoutubeDL(self.video_main_downloader_obj.options) as ytdl_obj:
@@ -0,0 +1,190 @@
+import re
+import threading
+import time
+from django.conf import settings
+from django.core.cache import caches
+from yt_dlp.extractor import gen_extractor_classes
+from yt_dlp.utils import orderedSet_from_options, variadic
+from .models import AllowedExtractor
+from .url_normalization import make_url_key, normalize_url
+
+ALLOWED_EXTRACTORS_GENERATION_CACHE_KEY = 'allowed-extractors:generation'
+NAMED_GROUP_REGEX = re.compile(r'\(\?P<\w+>')
+NAMED_BACKREFERENCE_REGEX = re.compile(r'\(\?P=\w+\)')
+GLOBAL_FLAGS_REGEX = re.compile(r'^\(\?([aiLmsux]+)\)')
+
+
+class AllowedExtractorRegistry:
+    """
+    AllowedExtractorRegistry is a lazy, process wide cache of the active AllowedExtractor objects.
+    It keeps the allowed_extractors regexes (the YoutubeDL option) and the extractor classes they allow, with one
+    precompiled combined regex of their valid urls, to reject unsupported urls before queueing any task.
+    It is built on the first use (not at import time) and rebuilt after AllowedExtractor changes:
+    the post_save/post_delete signals invalidate it and bump a generation counter in the shared cache,
+    which the other processes check every ALLOWED_EXTRACTORS_RECHECK_INTERVAL seconds.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._generation = None
+        self._checked_at = 0
+
+    def get_regexes(self):
+        return list(self.get_state()['regexes'])
+
+    def get_extractor_classes(self):
+        return list(self.get_state()['extractor_classes'])
+
+    def is_url_supported(self, url):
+        """
+        Returns whether any of the allowed extractors is suitable for the url.
+        The combined regex is a superset of the suitable() checks (which may only narrow their _VALID_URL),
+        the extractors whose valid urls could not be combined are checked using suitable().
+        :param url:
+        :return:
+        """
+        state = self.get_state()
+        if state['combined_regex'] is not None and state['combined_regex'].match(url):
+            return True
+        return any(extractor_class.suitable(url) for extractor_class in state['fallback_extractor_classes'])
+
+    def get_canonical_key(self, url):
+        """
+        Returns the canonical key (the extractor key and the video id) of the url without any network request,
+        or None if the first suitable allowed extractor (in the YoutubeDL order) can not match an id in the url.
+        :param url:
+        :return:
+        """
+        for extractor_class in self.get_state()['ordered_extractor_classes']:
+            if extractor_class.suitable(url):
+                video_id = extractor_class.get_temp_id(url)
+                return make_url_key(extractor_class.ie_key(), video_id) if video_id else None
+        return None
+
+    def get_url_keys(self, url):
+        """
+        Returns the keys of the contents of the url (Content.url_key): its canonical key and its normalized form,
+        the cheap fallback (and the key of the contents of the urls without an id).
+        :param url:
+        :return:
+        """
+        return [key for key in dict.fromkeys([self.get_canonical_key(url), normalize_url(url)]) if key]
+
+    def get_state(self):
+        state = self._state
+        if state is None or self.is_stale():
+            with self._lock:
+                if self._state is None or self.is_stale():
+                    self._generation = get_generation()
+                    self._state = build_registry_state(
+                        [extractor.regex for extractor in AllowedExtractor.objects.active_extractors()]
+                    )
+                    self._checked_at = time.monotonic()
+                state = self._state
+        return state
+
+    def is_stale(self):
+        if time.monotonic() - self._checked_at < settings.ALLOWED_EXTRACTORS_RECHECK_INTERVAL:
+            return False
+        self._checked_at = time.monotonic()
+        return get_generation() != self._generation
+
+    def invalidate(self):
+        with self._lock:
+            self._state = None
+
+
+allowed_extractor_registry = AllowedExtractorRegistry()
+
+
+def get_generation():
+    return caches[settings.ALLOWED_EXTRACTORS_CACHE_ALIAS].get(ALLOWED_EXTRACTORS_GENERATION_CACHE_KEY, 0)
+
+
+def bump_generation():
+    cache = caches[settings.ALLOWED_EXTRACTORS_CACHE_ALIAS]
+    cache.add(ALLOWED_EXTRACTORS_GENERATION_CACHE_KEY, 0, None)
+    try:
+        cache.incr(ALLOWED_EXTRACTORS_GENERATION_CACHE_KEY)
+    except ValueError:
+        cache.set(ALLOWED_EXTRACTORS_GENERATION_CACHE_KEY, 1, None)
+
+
+def invalidate_allowed_extractors(sender=None, **kwargs):
+    """
+    The post_save/post_delete receiver of AllowedExtractor.
+    :param sender:
+    :param kwargs:
+    :return:
+    """
+    bump_generation()
+    allowed_extractor_registry.invalidate()
+
+
+def build_registry_state(regexes):
+    """
+    Resolves the allowed extractor classes of the regexes the same way YoutubeDL does (case-insensitive fullmatch
+    against the extractor names) and compiles their valid urls into one regex.
+    :param regexes:
+    :return:
+    """
+    all_extractor_classes = {extractor_class.IE_NAME.lower(): extractor_class for extractor_class in gen_extractor_classes()}
+    try:
+        names = orderedSet_from_options(regexes, {
+            'all': list(all_extractor_classes),
+            'default': [name for name, extractor_class in all_extractor_classes.items() if extractor_class._ENABLED],
+        }, use_regex=True)
+    except (re.error, ValueError):
+        names = []
+    extractor_classes = [all_extractor_classes[name] for name in names]
+    # the order of the extractors in YoutubeDL, the first suitable one extracts the url
+    ordered_extractor_classes = [
+        extractor_class for extractor_class in all_extractor_classes.values()
+        if extractor_class.IE_NAME.lower() in names
+    ]
+    patterns, fallback_extractor_classes = [], []
+    for extractor_class in extractor_classes:
+        extractor_patterns = [make_combinable_pattern(pattern) for pattern in variadic(extractor_class._VALID_URL)
+                              if isinstance(pattern, str)]
+        if extractor_patterns and None not in extractor_patterns:
+            patterns.extend(extractor_patterns)
+        else:
+            fallback_extractor_classes.append(extractor_class)
+    combined_regex = None
+    if patterns:
+        try:
+            combined_regex = re.compile('|'.join(f'(?:{pattern})' for pattern in patterns))
+        except re.error:
+            fallback_extractor_classes = extractor_classes
+    return {
+        'regexes': list(regexes),
+        'extractor_classes': extractor_classes,
+        'ordered_extractor_classes': ordered_extractor_classes,
+        'combined_regex': combined_regex,
+        'fallback_extractor_classes': fallback_extractor_classes,
+    }
+
+
+def make_combinable_pattern(pattern):
+    """
+    Returns the valid url pattern of an extractor in a form that can be joined with the others
+    (without named groups and with scoped instead of global flags), or None if it is not possible.
+    :param pattern:
+    :return:
+    """
+    if NAMED_BACKREFERENCE_REGEX.search(pattern):
+        return None
+    pattern = NAMED_GROUP_REGEX.sub('(?:', pattern)
+    flags_match = GLOBAL_FLAGS_REGEX.match(pattern)
+    if flags_match:
+        flags, pattern = flags_match.group(1), pattern[flags_match.end():]
+        if 'x' in flags:
+            # ends a possible trailing comment of the verbose pattern before the closing parenthesis
+            pattern += '\n'
+        pattern = f'(?{flags}:{pattern})'
+    try:
+        re.compile(pattern)
+    except re.error:
+        return None
+    return pattern
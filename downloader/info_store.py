@@ -0,0 +1,212 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+from django.conf import settings
+from django.core.cache import caches
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_COMPRESSION = 'gzip'
+ZSTD_COMPRESSION = 'zstd'
+NO_COMPRESSION = 'none'
+COMPRESSION_EXTENSIONS = {
+    GZIP_COMPRESSION: '.json.gz',
+    ZSTD_COMPRESSION: '.json.zst',
+    NO_COMPRESSION: '.json',
+}
+# The info key of the freshness deadline (a unix timestamp) of the format urls, recorded on save
+FRESH_UNTIL_KEY = '_fresh_until'
+# The query parameters of the signed media urls that hold their expiration timestamp
+URL_EXPIRATION_PARAMS = ('expire', 'expires', 'Expires')
+
+
+class InfoStore:
+    """
+    InfoStore saves and loads the extracted infos of the contents.
+    The infos are saved as compressed json blobs (gzip, or zstd if zstandard is installed) in a hashed directory
+    layout (info/ab/cd/info-<id>.json.gz) using atomic write-then-rename, so readers never see a torn file.
+    Uses orjson if it is installed. If cache_alias is set, the infos are also kept in that django cache (hot tier).
+    The plain json files of the flat layout (info/info-<id>.json) are still readable.
+    The freshness deadline of an info (the expiration of its signed format urls) is recorded in it, see is_fresh.
+    """
+
+    def __init__(self, root=None, compression=None, cache_alias=None, cache_timeout=None):
+        self.root = root or settings.INFO_STORE_ROOT
+        self.compression = compression or settings.INFO_STORE_COMPRESSION
+        if self.compression == ZSTD_COMPRESSION and zstandard is None:
+            self.compression = GZIP_COMPRESSION
+        self.cache_alias = settings.INFO_STORE_CACHE_ALIAS if cache_alias is None else cache_alias
+        self.cache_timeout = settings.INFO_STORE_CACHE_TIMEOUT if cache_timeout is None else cache_timeout
+
+    def get_path(self, info_id):
+        info_id = str(info_id)
+        hashed_id = hashlib.sha1(info_id.encode('utf-8')).hexdigest()
+        file_name = 'info-' + re.sub(r'[^\w.-]', '_', info_id) + COMPRESSION_EXTENSIONS[self.compression]
+        return os.path.join(self.root, hashed_id[:2], hashed_id[2:4], file_name)
+
+    def save(self, info, path=None):
+        """
+        Saves the (sanitized) info and returns its path.
+        :param info:
+        :param path: the path of the info, defaults to the path of the info id
+        :return path:
+        """
+        path = path or self.get_path(info['id'])
+        fresh_until = get_info_fresh_until(info) if isinstance(info, dict) else None
+        if fresh_until is not None:
+            info = dict(info, **{FRESH_UNTIL_KEY: fresh_until})
+        data = compress(dump_json(info), get_path_compression(path))
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        temp_file_path = None
+        try:
+            with tempfile.NamedTemporaryFile(dir=directory, prefix='.tmp-', delete=False) as temp_file:
+                temp_file_path = temp_file.name
+                temp_file.write(data)
+            os.chmod(temp_file_path, 0o644)
+            os.replace(temp_file_path, path)
+        except BaseException:
+            # the temporary file of a failed write is not left behind
+            if temp_file_path and os.path.exists(temp_file_path):
+                os.remove(temp_file_path)
+            raise
+        if self.cache_alias:
+            caches[self.cache_alias].set(self.get_cache_key(path), data, self.cache_timeout)
+        return path
+
+    def load(self, path):
+        """
+        Loads the info of the path. The hot tier keeps the compressed data of the infos, not the loaded dicts.
+        :param path:
+        :return:
+        """
+        data = caches[self.cache_alias].get(self.get_cache_key(path)) if self.cache_alias else None
+        if data is None:
+            with open(path, 'rb') as info_file:
+                data = info_file.read()
+            if self.cache_alias:
+                caches[self.cache_alias].set(self.get_cache_key(path), data, self.cache_timeout)
+        return load_json(decompress(data, get_path_compression(path)))
+
+    def exists(self, path):
+        return bool(path) and os.path.isfile(path)
+
+    @staticmethod
+    def is_fresh(info):
+        """
+        Returns whether the format urls of the info are still usable (they expire after the INFO_FRESHNESS_MARGIN).
+        The infos without any expiring url are always fresh.
+        :param info:
+        :return:
+        """
+        if not isinstance(info, dict):
+            return True
+        fresh_until = info[FRESH_UNTIL_KEY] if FRESH_UNTIL_KEY in info else get_info_fresh_until(info)
+        return fresh_until is None or time.time() < fresh_until
+
+    @staticmethod
+    def get_cache_key(path):
+        return 'info-store:' + hashlib.sha1(str(path).encode('utf-8')).hexdigest()
+
+
+def get_info_store():
+    return InfoStore()
+
+
+def get_info_fresh_until(info):
+    """
+    Returns the freshness deadline (a unix timestamp) of the info: the earliest expiration of its format urls
+    (and of the format urls of its entries) minus INFO_FRESHNESS_MARGIN, or None if none of its urls expires.
+    :param info:
+    :return:
+    """
+    expiration_dates = list(iter_url_expirations(info))
+    if not expiration_dates:
+        return None
+    return min(expiration_dates).timestamp() - settings.INFO_FRESHNESS_MARGIN
+
+
+def iter_url_expirations(info):
+    """
+    Yields the expiration dates of the expiring format urls of the info and of its entries (e.g. a playlist).
+    :param info:
+    :return:
+    """
+    for fmt in (info, *(info.get('formats') or []), *(info.get('requested_formats') or [])):
+        expiration_date = get_url_expiration(fmt.get('url'))
+        if expiration_date:
+            yield expiration_date
+    for entry in info.get('entries') or []:
+        if isinstance(entry, dict):
+            yield from iter_url_expirations(entry)
+
+
+def get_url_expiration(url):
+    """
+    Returns the expiration date of a signed media url from its expire query parameter (a unix timestamp),
+    or None if the url has no such parameter.
+    :param url:
+    :return:
+    """
+    if not url or not isinstance(url, str):
+        return None
+    query = parse_qs(urlparse(url).query)
+    for param in URL_EXPIRATION_PARAMS:
+        values = query.get(param)
+        if values and values[0].isdigit():
+            return datetime.fromtimestamp(int(values[0]), tz=timezone.utc)
+    return None
+
+
+def get_path_compression(path):
+    if str(path).endswith(COMPRESSION_EXTENSIONS[GZIP_COMPRESSION]):
+        return GZIP_COMPRESSION
+    if str(path).endswith(COMPRESSION_EXTENSIONS[ZSTD_COMPRESSION]):
+        return ZSTD_COMPRESSION
+    return NO_COMPRESSION
+
+
+def compress(data, compression):
+    if compression == GZIP_COMPRESSION:
+        return gzip.compress(data, compresslevel=6)
+    if compression == ZSTD_COMPRESSION:
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def decompress(data, compression):
+    if compression == GZIP_COMPRESSION:
+        return gzip.decompress(data)
+    if compression == ZSTD_COMPRESSION:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def dump_json(obj):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            # e.g. integers bigger than 64 bits
+            pass
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def load_json(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -1,19 +1,41 @@
+import hashlib
 import inspect
 import json
 import os
 import re
-from yt_dlp.utils import (DownloadError, DownloadCancelled,
+import uuid
+from django.conf import settings
+from yt_dlp.utils import (variadic, DownloadError, DownloadCancelled,
                           UnsupportedError, UserNotLive, ExtractorError, PostProcessingError, YoutubeDLError)
 from config.settings import BASE_DIR
 from . import downloaders
 from .downloaders import CustomYoutubeDL
-from .models import Content, AllowedExtractor
+from .extractors import allowed_extractor_registry
+from .info_store import get_info_store
+from .options import OptionProfile
+from .pool import youtubedl_pool
+from .models import Content
+from .url_normalization import make_info_url_key
+from .progress import ProgressPublisher
 
-allowed_extractors_regexes_list = [extractor.regex for extractor in AllowedExtractor.objects.active_extractors()]
 DOWNLOADERS_LIST = [(name, obj, getattr(obj, 'extractor', ''))
                     for name, obj in inspect.getmembers(downloaders, inspect.isclass)
                     if getattr(obj, 'is_downloader', False)]
 DOWNLOADERS_DICT = {extractor: downloader_obj for _, downloader_obj, extractor in DOWNLOADERS_LIST}
+RENDITION_DETAIL_FIELDS = ['type', 'extension', 'resolution', 'frame_rate', 'aspect_ratio', 'audio_bitrate',
+                           'start_time', 'end_time']
+CLIP_DETAIL_FIELDS = ['start_time', 'end_time']
+VIDEO_ONLY_DETAIL_FIELDS = ['resolution', 'frame_rate', 'aspect_ratio']
+AUDIO_ONLY_DETAIL_FIELDS = ['audio_bitrate']
+# The info fields that the tasks return instead of the whole info (the fields of the content info views and serializers).
+INFO_PROJECTION_FIELDS = [
+    'id', 'extractor', 'extractor_key', 'original_url', 'webpage_url', 'webpage_url_domain', 'title', 'duration_string',
+    'thumbnail', 'upload_date', 'description', 'track', 'artist', 'album', 'release_date', 'channel', 'uploader',
+    'info_file_path',
+]
+INFO_PROJECTION_MAX_DESCRIPTION_LENGTH = 500
+# The info types whose entries are downloaded as separate contents (see playlists.py), e.g. the instagram carousels
+PLAYLIST_INFO_TYPES = ('playlist', 'multi_video')
 
 
 class DownloadProcessError(Exception):
@@ -52,12 +74,85 @@ def raise_download_process_error(func):
     return wrapper
 
 
+def normalize_detail(detail):
+    """
+    Returns a comparable copy of the detail dict that only contains the fields affecting the output file.
+    Numeric strings (like the ones coming from URLForm) become integers and 'none' values become None.
+    The fields that are not related to the content type are dropped (e.g. resolution for audio).
+    The clip fields (seconds) become floats and are only kept if they are set (a clip starting at 0 is not set).
+    :param detail:
+    :return:
+    """
+    detail = detail or {}
+    content_type = str(detail.get('type') or 'audio').lower()
+    ignored_fields = AUDIO_ONLY_DETAIL_FIELDS if content_type == 'video' else VIDEO_ONLY_DETAIL_FIELDS
+    normalized_detail = {}
+    for field in RENDITION_DETAIL_FIELDS:
+        if field in ignored_fields:
+            continue
+        value = detail.get(field)
+        if isinstance(value, str):
+            value = value.strip().lower()
+            if value in ('', 'none'):
+                value = None
+            elif value.isdigit():
+                value = int(value)
+        if field in CLIP_DETAIL_FIELDS:
+            value = float(value) if value not in (None, '') else None
+            if not value:
+                continue
+        normalized_detail[field] = value
+    normalized_detail['type'] = content_type
+    return normalized_detail
+
+
+def make_rendition_key(extractor, info_id, detail):
+    """
+    Returns the key of a rendition, which is the same for every content of the same extractor video with the same
+    normalized detail. Contents sharing a rendition key can share their downloaded file.
+    :param extractor:
+    :param info_id:
+    :param detail:
+    :return:
+    """
+    key_data = [str(extractor or '').lower(), str(info_id), normalize_detail(detail)]
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def make_master_key(extractor, info_id, master_detail):
+    """
+    Returns the key of a master copy (see YoutubeDownloader.get_master_detail), never equal to a rendition key.
+    :param extractor:
+    :param info_id:
+    :param master_detail:
+    :return:
+    """
+    key_data = ['master', str(extractor or '').lower(), str(info_id), normalize_detail(master_detail)]
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def make_info_projection(info):
+    """
+    Returns a compact copy of the info containing only INFO_PROJECTION_FIELDS, small enough for the broker and the
+    result backend. A long description is truncated (ending with '...').
+    The whole info is always available using the info_file_path field.
+    :param info:
+    :return:
+    """
+    info_projection = {field: info.get(field) for field in INFO_PROJECTION_FIELDS}
+    description = info_projection['description']
+    if isinstance(description, str) and len(description) > INFO_PROJECTION_MAX_DESCRIPTION_LENGTH:
+        # the ellipsis marks the truncated descriptions
+        info_projection['description'] = description[:INFO_PROJECTION_MAX_DESCRIPTION_LENGTH - 3] + '...'
+    return info_projection
+
+
 @raise_download_process_error
 def download_content(url, where_to_save='temp', format_data=None):
     options = {
         'format': 'bestvideo+bestaudio/best/best*',
         'outtmpl': str(BASE_DIR / os.path.join(where_to_save, '%(title)s.%(ext)s')),
-        'allowed_extractors': allowed_extractors_regexes_list,
+        'allowed_extractors': allowed_extractor_registry.get_regexes(),
         'verbos': True,
         'writethumbnail': True,
         'postprocessors': [
@@ -73,16 +168,15 @@ def download_content(url, where_to_save='temp', format_data=None):
     with downloaders.CustomYoutubeDL(options) as downloader:
         print('starting download process...')
         code = 1
-        related_downloaded_contents = Content.objects.filter(url=url)
-        if related_downloaded_contents.exists():
-            info_file_path = related_downloaded_contents.order_by('-processed_at').first().info_file_path
-            with open(info_file_path) as info_file:
-                info = json.load(info_file)
+        related_downloaded_content = Content.objects.filter(
+            url_key__in=allowed_extractor_registry.get_url_keys(url)
+        ).first()
+        if related_downloaded_content:
+            info_file_path = related_downloaded_content.info_file_path
+            info = get_info_store().load(info_file_path)
         else:
             info = downloader.extract_info(url, download=False)
-            info_file_path = f'info/info-{info['id']}.json'
-            with open(info_file_path, 'w') as info_file:
-                json.dump(downloader.sanitize_info(info), info_file)
+            info_file_path = get_info_store().save(downloader.sanitize_info(info))
         print('checking the customized function:')
         if info.get('extractor').lower() in DOWNLOADERS_DICT.keys():
             downloader_class_obj = DOWNLOADERS_DICT[info.get('extractor').lower()]
@@ -104,6 +198,7 @@ def download_content(url, where_to_save='temp', format_data=None):
             info_id=info['id'],
             info_file_path=info_file_path,
             url=info.get('original_url') or info.get('webpage_url'),
+            url_key=make_info_url_key(info),
             title=info.get('title'),
             download_path=download_path,
             successful=False if code else True,
@@ -119,13 +214,12 @@ class MainDownloader:
     Raises DownloadProcessError for any failure during download process with the proper massage.
     """
     download_dir = 'temp'
-    default_options = {
+    # an immutable OptionProfile, use self.options (derived from it) for the options of a process
+    default_options = OptionProfile({
         'format': 'bestvideo+bestaudio/best/best*',
         'outtmpl': str(BASE_DIR / os.path.join(download_dir, '%(title)s.%(ext)s')),
-        'allowed_extractors': allowed_extractors_regexes_list,
         # 'verbose': True,
         # 'writethumbnail': True,
-        # 'progress_hooks': [hook, ],
         # 'cookiefile': 'cookies.txt',
         # 'cookiesfrombrowser': ('edge', ),
         'postprocessors': [
@@ -137,11 +231,12 @@ class MainDownloader:
             #     'already_have_thumbnail': False,
             # }
         ]
-    }
+    })
 
     def __init__(
             self, url, detail=None, custom_downloader=None,
-            content_obj=None, pre_created_content_obj=None, info=None, info_file_path=None, options=None
+            content_obj=None, pre_created_content_obj=None, info=None, info_file_path=None, options=None,
+            defer_postprocessing=False, master_copy=None, info_only=False,
     ):
         self.url = url
         self.detail = detail or {}
@@ -152,8 +247,23 @@ class MainDownloader:
         self.pre_created_content_obj = pre_created_content_obj
         self.info = info
         self.info_file_path = info_file_path
-        self.options = self.default_options
-        self.options.update(options or dict())
+        self.download_path = None
+        # the file path prepared by the YoutubeDL object of the custom downloader (see get_download_path)
+        self.prepared_file_path = None
+        # the allowed extractors are loaded lazily and stay up to date with the AllowedExtractor changes
+        self.options = self.default_options.replace(allowed_extractors=allowed_extractor_registry.get_regexes())
+        self.options = self.options.replace(options or dict())
+        # the postprocessors run in a separate stage (run_postprocessing) after the download
+        self.defer_postprocessing = defer_postprocessing
+        self.postprocessing_pending = False
+        if defer_postprocessing:
+            self.options = self.options.replace(defer_postprocessing=True)
+        # the rendition is derived locally from the master copy of the info (see derive_from_master)
+        self.master_copy = settings.MASTER_COPY if master_copy is None else master_copy
+        # the info is extracted without processing its formats and the process without download
+        # does not prepare the download (see run), the download task resolves the formats
+        self.info_only = info_only
+        self.download_skipped = False
 
     @raise_download_process_error
     def get_custom_downloader(self, main_ytdl_obj):
@@ -180,30 +290,38 @@ class MainDownloader:
     @raise_download_process_error
     def extract_info(self, ytdl_obj):
         """
-        Returns url info if exists (using whether info attribute or a related content),
+        Returns url info if exists (using whether info attribute, info_file_path attribute or a related content),
         Or extracts url info and saves it in a json file.
         Sets info and info_file_path attributes.
         :param ytdl_obj:
         :return:
         """
+        info_store = get_info_store()
         if getattr(self, 'info', None):
-            # Better to initialize class using info beside info_file_path to avoid parallel same file writing problems of info json file.
+            # Better to initialize class using info beside info_file_path to avoid writing the same info file again.
             if not getattr(self, 'info_file_path', None):
-                self.info_file_path = f'info/info-{self.info['id']}.json'
-                with open(self.info_file_path, 'w') as info_file:
-                    json.dump(ytdl_obj.sanitize_info(self.info), info_file)
+                self.info_file_path = info_store.save(ytdl_obj.sanitize_info(self.info))
             return self.info
 
-        related_downloaded_contents = Content.objects.filter(url=self.url)
-        if related_downloaded_contents.exists():
-            self.info_file_path = related_downloaded_contents.order_by('-processed_at').first().info_file_path
-            with open(self.info_file_path) as info_file:
-                self.info = json.load(info_file)
+        if info_store.exists(getattr(self, 'info_file_path', None)):
+            self.info = info_store.load(self.info_file_path)
+            self.info['info_file_path'] = self.info_file_path
+            return self.info
+
+        # the contents of the other variants of the url share its info
+        # (the url entries of a playlist have no info until they are downloaded)
+        related_downloaded_content = Content.objects.filter(
+            url_key__in=allowed_extractor_registry.get_url_keys(self.url)
+        ).exclude(info_file_path='').order_by('-processed_at').only('info_file_path').first()
+        if related_downloaded_content and info_store.exists(related_downloaded_content.info_file_path):
+            self.info_file_path = related_downloaded_content.info_file_path
+            self.info = info_store.load(self.info_file_path)
         else:
-            self.info = ytdl_obj.extract_info(self.url, download=False)
-            self.info_file_path = f'info/info-{self.info['id']}.json'
-            with open(self.info_file_path, 'w') as info_file:
-                json.dump(ytdl_obj.sanitize_info(self.info), info_file)
+            if self.info_only:
+                self.info = ytdl_obj.extract_info_only(self.url)
+            else:
+                self.info = ytdl_obj.extract_info(self.url, download=False)
+            self.info_file_path = info_store.save(ytdl_obj.sanitize_info(self.info))
         self.info['info_file_path'] = self.info_file_path
         return self.info
 
@@ -212,7 +330,7 @@ class MainDownloader:
         """
         Downloads the content of the url using custom downloader or default download functionality.
         Sets downloaded_successfully attribute.
-        Returns error code and the YoutubeDL object.
+        Returns error code and the given YoutubeDL object, the pooled object of the custom downloader is not returned.
         :param ytdl_obj:
         :param fake:
         :return code, ytdl_obj:
@@ -220,18 +338,224 @@ class MainDownloader:
         code = 1
         if self.downloaded_successfully:
             code = 0
+        if not fake and self.get_cached_rendition(ytdl_obj):
+            self.downloaded_successfully = True
+            return 0, ytdl_obj
         custom_downloader = self.get_custom_downloader(ytdl_obj)
-        if custom_downloader:
-            code, info, ytdl_obj = custom_downloader.download(fake=fake)
+        # the master copy is a single video, the playlists are downloaded entry by entry
+        if (custom_downloader and self.master_copy and not fake and not custom_downloader.get_clip()
+                and self.extract_info(ytdl_obj).get('_type', 'video') == 'video'):
+            code = self.derive_from_master(ytdl_obj, custom_downloader)
+        elif custom_downloader:
+            code, info, self.prepared_file_path = custom_downloader.download(fake=fake)
         else:
             code = ytdl_obj.download_with_info_file(self.info_file_path) if not fake else 0
-        self.downloaded_successfully = not code
+        if self.defer_postprocessing and not fake and not code:
+            if custom_downloader:
+                deferred_postprocessing_infos = custom_downloader.deferred_postprocessing_infos
+            else:
+                deferred_postprocessing_infos = [
+                    ytdl_obj.sanitize_info(info) for info in ytdl_obj.deferred_postprocessing_infos
+                ]
+            get_info_store().save(deferred_postprocessing_infos, path=self.get_postprocessing_info_path(ytdl_obj))
+            self.postprocessing_pending = True
+        self.downloaded_successfully = not code and not self.postprocessing_pending
         return code, ytdl_obj
 
+    @raise_download_process_error
+    def derive_from_master(self, ytdl_obj, custom_downloader):
+        """
+        Derives the rendition from the master copy of the info, downloading the master first if it is not cached.
+        The postprocessors of the rendition run on a link to the master file (deferred like the download ones).
+        The concurrent downloads of a master write their own files, the finished file replaces the master atomically.
+        Returns error code.
+        :param ytdl_obj:
+        :param custom_downloader:
+        :return code:
+        """
+        master_content, master_info = self.get_cached_master(ytdl_obj, custom_downloader)
+        if master_content is None:
+            master_key = self.get_master_key(ytdl_obj, custom_downloader)
+            master_path_prefix = str(BASE_DIR / os.path.join(settings.MASTER_COPY_DIR, f'master-{master_key[:32]}'))
+            code, master_info = custom_downloader.download_master(f'{master_path_prefix}.{uuid.uuid4().hex}.%(ext)s')
+            if code:
+                return code
+            master_path = master_path_prefix + os.path.splitext(master_info['filepath'])[1]
+            os.replace(master_info['filepath'], master_path)
+            master_info['filepath'] = master_path
+            master_content = self.create_master_content(ytdl_obj, custom_downloader, master_info)
+        code, info, self.prepared_file_path = custom_downloader.derive(master_content.download_path, master_info)
+        if not self.defer_postprocessing:
+            self.download_path = info.get('filepath') or self.download_path
+        return code
+
+    @raise_download_process_error
+    def get_master_key(self, ytdl_obj, custom_downloader):
+        info = self.extract_info(ytdl_obj)
+        return make_master_key(
+            info.get('extractor_key') or info.get('extractor'), info.get('id'), custom_downloader.get_master_detail()
+        )
+
+    @staticmethod
+    def get_master_info_path(master_content):
+        return get_info_store().get_path('master-' + master_content.rendition_key)
+
+    @raise_download_process_error
+    def get_cached_master(self, ytdl_obj, custom_downloader):
+        """
+        Searches for a downloaded, non-expired master copy of the rendition whose file and info still exist.
+        The audio can also be derived from a video master of the same info.
+        Returns the master content and its downloaded info or None, None.
+        :param ytdl_obj:
+        :param custom_downloader:
+        :return master_content, master_info:
+        """
+        info_store = get_info_store()
+        master_contents_list = [Content.objects.cached_renditions(self.get_master_key(ytdl_obj, custom_downloader))]
+        if not custom_downloader.is_video:
+            master_contents_list.append(Content.objects.downloaded_valid_contents().filter(
+                info_id=self.extract_info(ytdl_obj).get('id'), type='master-video', expired=False,
+                download_path__isnull=False,
+            ))
+        for master_contents in master_contents_list:
+            for master_content in master_contents[:5]:
+                master_info_path = self.get_master_info_path(master_content)
+                if os.path.isfile(master_content.download_path) and info_store.exists(master_info_path):
+                    return master_content, info_store.load(master_info_path)
+        return None, None
+
+    @raise_download_process_error
+    def create_master_content(self, ytdl_obj, custom_downloader, master_info):
+        """
+        Creates the content of a downloaded master copy (expiring like the other contents) and saves its info.
+        :param ytdl_obj:
+        :param custom_downloader:
+        :param master_info:
+        :return:
+        """
+        info = self.extract_info(ytdl_obj)
+        master_detail = normalize_detail(custom_downloader.get_master_detail())
+        master_content = Content.objects.create(
+            info_id=info.get('id'),
+            info_file_path=self.info_file_path,
+            url=info.get('original_url') or info.get('webpage_url'),
+            url_key=make_info_url_key(info),
+            title=info.get('title'),
+            type='master-' + master_detail['type'],
+            extension=master_info.get('ext'),
+            resolution=master_detail.get('resolution'),
+            frame_rate=master_detail.get('frame_rate'),
+            aspect_ratio=master_detail.get('aspect_ratio'),
+            audio_bitrate=None,
+            download_path=master_info['filepath'],
+            rendition_key=self.get_master_key(ytdl_obj, custom_downloader),
+            downloaded_successfully=True,
+        )
+        get_info_store().save(ytdl_obj.sanitize_info(master_info), path=self.get_master_info_path(master_content))
+        return master_content
+
+    @raise_download_process_error
+    def get_postprocessing_info_path(self, ytdl_obj):
+        """
+        Returns the path of the downloaded infos (with the downloaded file paths) of the deferred postprocessing.
+        The path is keyed by the content (the same in both stages), so that the concurrent downloads of a rendition
+        do not share the file; by the rendition key if there is no content.
+        :param ytdl_obj:
+        :return:
+        """
+        content = self.content_obj or self.pre_created_content_obj
+        key = str(content.pk) if content else self.get_rendition_key(ytdl_obj)
+        return get_info_store().get_path('postprocessing-' + key)
+
+    @raise_download_process_error
+    def run_postprocessing(self):
+        """
+        Runs the deferred postprocessors (defer_postprocessing) on the downloaded files of the process, the postprocess
+        stage of the download. Sets download_path attribute to the postprocessed file path.
+        Returns error code, extracted info and content object like run method.
+        :return:
+        """
+        info_store = get_info_store()
+        self.options = self.options.without('defer_postprocessing')
+        progress_publisher = self.get_progress_publisher()
+        if progress_publisher:
+            self.options = self.options.replace(progress_publisher.get_hooks_options())
+        code = 1
+        try:
+            with youtubedl_pool.acquire(CustomYoutubeDL, self.options) as main_ytdl_obj:
+                info = self.extract_info(main_ytdl_obj)
+                postprocessing_info_path = self.get_postprocessing_info_path(main_ytdl_obj)
+                custom_downloader = self.get_custom_downloader(main_ytdl_obj)
+                options = custom_downloader.get_options() if custom_downloader else self.options
+            with youtubedl_pool.acquire(CustomYoutubeDL, options) as ytdl_obj:
+                if info_store.exists(postprocessing_info_path):
+                    for downloaded_info in variadic(info_store.load(postprocessing_info_path)):
+                        files_to_move = downloaded_info.pop('__files_to_move', None)
+                        downloaded_info = ytdl_obj.post_process(downloaded_info['filepath'], downloaded_info, files_to_move)
+                        self.download_path = downloaded_info.get('filepath') or self.download_path
+                    os.remove(postprocessing_info_path)
+                    code = 0
+                self.downloaded_successfully = not code
+                content = self.get_content_obj(ytdl_obj)
+        except Exception:
+            if progress_publisher:
+                progress_publisher.publish_done(successful=False)
+            raise
+        if progress_publisher:
+            progress_publisher.publish_done(successful=not code)
+        return code, info, content
+
+    @raise_download_process_error
+    def select_format(self, **option_overrides):
+        """
+        Selects the format of the detail from the info without downloading it (without the postprocessors and the clip).
+        Returns the selected format info and its download path (with the detail extension), or (None, None) if there
+        is no custom downloader.
+        :param option_overrides: the options replacing the options of the custom downloader (e.g. the format)
+        :return selected_info, download_path:
+        """
+        with youtubedl_pool.acquire(CustomYoutubeDL, self.options) as main_ytdl_obj:
+            custom_downloader = self.get_custom_downloader(main_ytdl_obj)
+        if custom_downloader is None:
+            return None, None
+        options = dict(custom_downloader.get_options(), postprocessors=[], **option_overrides)
+        options.pop('download_ranges', None)
+        with youtubedl_pool.acquire(CustomYoutubeDL, options) as ytdl_obj:
+            selected_info = ytdl_obj.process_ie_result(dict(self.info), download=False)
+            download_path = ytdl_obj.prepare_filename(selected_info)
+        if self.detail.get('extension'):
+            download_path = re.sub(r'\.[^.\\]+$', f'.{self.detail['extension']}', download_path)
+        return selected_info, download_path
+
+    @raise_download_process_error
+    def get_rendition_key(self, ytdl_obj):
+        info = self.extract_info(ytdl_obj)
+        return make_rendition_key(info.get('extractor_key') or info.get('extractor'), info.get('id'), self.detail)
+
+    @raise_download_process_error
+    def get_cached_rendition(self, ytdl_obj):
+        """
+        Searches for a downloaded, non-expired content with the same rendition key whose file still exists.
+        Sets download_path attribute to the cached file path and returns the cached content or returns None.
+        :param ytdl_obj:
+        :return:
+        """
+        cached_contents = Content.objects.cached_renditions(self.get_rendition_key(ytdl_obj))
+        for content in (self.content_obj, self.pre_created_content_obj):
+            if content:
+                cached_contents = cached_contents.exclude(pk=content.pk)
+        for cached_content in cached_contents[:5]:
+            if os.path.isfile(cached_content.download_path):
+                self.download_path = cached_content.download_path
+                return cached_content
+        return None
+
     @raise_download_process_error
     def get_download_path(self, ytdl_obj):
+        if self.download_path:
+            return self.download_path
         info = self.extract_info(ytdl_obj)
-        download_path = ytdl_obj.prepare_filename(info)
+        download_path = self.prepared_file_path or ytdl_obj.prepare_filename(info)
         download_path = re.sub(
             r'\.[^.\\]+$', f'.{self.detail['extension']}', download_path
         ) if self.detail.get('extension') else download_path
@@ -248,14 +572,23 @@ class MainDownloader:
             return self.content_obj
 
         info = self.extract_info(ytdl_obj)
+        is_playlist = info.get('_type') in PLAYLIST_INFO_TYPES
         data = {
             'info_id': info.get('id'),
             'info_file_path': self.info_file_path,
             'url': info.get('original_url') or info.get('webpage_url'),
+            'url_key': make_info_url_key(info),
             'title': info.get('title'),
-            'download_path': self.get_download_path(ytdl_obj),
+            # the files of a playlist are the files of its entries, the file name of an info only extraction
+            # (without the processed formats) is set by its download
+            'download_path': None if is_playlist or self.download_skipped else self.get_download_path(ytdl_obj),
+            'is_playlist': is_playlist,
+            'rendition_key': self.get_rendition_key(ytdl_obj),
             'downloaded_successfully': self.downloaded_successfully
         }
+        for field, value in normalize_detail(self.detail).items():
+            if field in ('type', 'extension') or isinstance(value, (int, float)):
+                data[field] = value
         if self.pre_created_content_obj:
             for k, v in data.items():
                 setattr(self.pre_created_content_obj, k, v)
@@ -269,18 +602,62 @@ class MainDownloader:
     def run(self, main_ytdl_obj=None, download=True):
         """
         Runs the download process properly. No need to run any other method.
-        Returns error code, extracted info, content object and YoutubeDL object.
+        Returns error code, extracted info and content object (the pooled YoutubeDL objects are not returned).
         Raises DownloadProcessError for any failure in process.
         :param main_ytdl_obj:
         :param download:
         :returns:
         :raises DownloadProcessError:
         """
-        main_ytdl_obj = CustomYoutubeDL(self.options) if not main_ytdl_obj else main_ytdl_obj
-        with main_ytdl_obj:
-            info = self.extract_info(main_ytdl_obj)
-            code, ytdl_obj = self.download(main_ytdl_obj, fake=not download)
-            content = self.get_content_obj(ytdl_obj)
-        return code, info, content, ytdl_obj
+        progress_publisher = self.get_progress_publisher() if download else None
+        if progress_publisher:
+            self.options = self.options.replace(progress_publisher.get_hooks_options())
+        ytdl_context = main_ytdl_obj if main_ytdl_obj else youtubedl_pool.acquire(CustomYoutubeDL, self.options)
+        try:
+            with ytdl_context as main_ytdl_obj:
+                info = self.extract_info(main_ytdl_obj)
+                if self.info_only and not download:
+                    code = 0
+                    self.download_skipped = True
+                else:
+                    code, _ = self.download(main_ytdl_obj, fake=not download)
+                content = self.get_content_obj(main_ytdl_obj)
+        except Exception:
+            if progress_publisher:
+                progress_publisher.publish_done(successful=False)
+            raise
+        if progress_publisher and not self.postprocessing_pending:
+            progress_publisher.publish_done(successful=not code)
+        return code, info, content
+
+    def get_progress_publisher(self):
+        """
+        Returns a ProgressPublisher for the content of the process if the content is already created, or returns None.
+        :return:
+        """
+        content = self.content_obj or self.pre_created_content_obj
+        return ProgressPublisher(content.pk) if content else None
 
 
+def select_content_format(content, **option_overrides):
+    """
+    Selects the format of the content from its saved info without downloading it (see MainDownloader.select_format).
+    Returns the selected format info and the download path of the content,
+    or (None, None) if the info is not saved or is stale (see InfoStore.is_fresh).
+    :param content:
+    :param option_overrides:
+    :return selected_info, download_path:
+    :raises DownloadProcessError:
+    """
+    info_store = get_info_store()
+    if not content.info_file_path or not info_store.exists(content.info_file_path):
+        return None, None
+    info = info_store.load(content.info_file_path)
+    if not info_store.is_fresh(info):
+        # the urls of the formats are expired (or about to), the info is refreshed by the download
+        return None, None
+    detail = {field: getattr(content, field) for field in RENDITION_DETAIL_FIELDS}
+    main_downloader_obj = MainDownloader(
+        content.url, detail=detail, info=info, info_file_path=content.info_file_path,
+    )
+    return main_downloader_obj.select_format(**option_overrides)
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0012_alter_content_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='rendition_key',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0013_content_rendition_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='content',
+            name='info_file_path',
+            field=models.FilePathField(max_length=300, path='info/'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0014_alter_content_info_file_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='end_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='start_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
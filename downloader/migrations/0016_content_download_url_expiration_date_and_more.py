@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0015_content_start_time_content_end_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='download_url_expiration_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='content',
+            name='download_url',
+            field=models.URLField(blank=True, max_length=2048, null=True),
+        ),
+    ]
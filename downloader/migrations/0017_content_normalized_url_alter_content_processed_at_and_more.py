@@ -0,0 +1,87 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:29
+
+import hashlib
+import django.utils.timezone
+from django.db import migrations, models
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# A frozen copy of url_normalization.normalize_url, the migration does not change with it
+TRACKING_QUERY_PARAMS = ('si', 'feature', 'igsh', 'igshid', 'fbclid', 'gclid', 'pp')
+TRACKING_QUERY_PARAM_PREFIXES = ('utm_', )
+NORMALIZED_URL_MAX_LENGTH = 400
+
+
+def normalize_url(url):
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').removeprefix('www.')
+    if parts.port and parts.port not in (80, 443):
+        host += f':{parts.port}'
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_QUERY_PARAMS and not key.startswith(TRACKING_QUERY_PARAM_PREFIXES)
+    )
+    path = parts.path.rstrip('/')
+    normalized_url = urlunsplit(('https', host, path, urlencode(query), ''))
+    if len(normalized_url) <= NORMALIZED_URL_MAX_LENGTH:
+        return normalized_url
+    return 'sha256:' + hashlib.sha256(normalized_url.encode('utf-8')).hexdigest()
+
+
+def fill_normalized_urls(apps, schema_editor):
+    Content = apps.get_model('downloader', 'Content')
+    contents = []
+    for content in Content.objects.exclude(url__isnull=True).only('pk', 'url').iterator(chunk_size=2000):
+        content.normalized_url = normalize_url(content.url)
+        contents.append(content)
+        if len(contents) >= 2000:
+            Content.objects.bulk_update(contents, ['normalized_url'])
+            contents = []
+    Content.objects.bulk_update(contents, ['normalized_url'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0016_content_download_url_expiration_date_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='normalized_url',
+            field=models.CharField(blank=True, editable=False, max_length=400, null=True),
+        ),
+        migrations.RunPython(fill_normalized_urls, migrations.RunPython.noop, elidable=True),
+        migrations.AlterField(
+            model_name='content',
+            name='processed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='content',
+            name='rendition_key',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(fields=['normalized_url', '-processed_at'], name='content_url_processed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(fields=['rendition_key', 'expiration_date'], name='content_rendition_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(fields=['info_id', 'type'], name='content_info_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(fields=['download_path', 'expiration_date'], name='content_path_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(condition=models.Q(('expired', False)), fields=['expiration_date'], name='content_unexpired_exp_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0017_content_normalized_url_alter_content_processed_at_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='content',
+            name='content_url_processed_idx',
+        ),
+        migrations.RenameField(
+            model_name='content',
+            old_name='normalized_url',
+            new_name='url_key',
+        ),
+        migrations.AddIndex(
+            model_name='content',
+            index=models.Index(fields=['url_key', '-processed_at'], name='content_url_processed_idx'),
+        ),
+    ]
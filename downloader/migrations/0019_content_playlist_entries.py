@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('downloader', '0018_rename_content_normalized_url_url_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='content',
+            name='is_playlist',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='downloader.content'),
+        ),
+        migrations.AddField(
+            model_name='content',
+            name='playlist_index',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
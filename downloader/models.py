@@ -3,8 +3,11 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from django.db.models import Q
 import uuid
+from .url_normalization import URL_KEY_MAX_LENGTH, normalize_url
 # Create your models here.
 
+CONTENT_LIFETIME = timedelta(hours=5)
+
 
 class ContentManager(models.Manager):
     def expired_contents(self):
@@ -23,6 +26,11 @@ class ContentManager(models.Manager):
     def downloaded_expired_contents(self):
         return self.filter(downloaded_successfully=True, expiration_date__lte=timezone.now())
 
+    def cached_renditions(self, rendition_key):
+        return self.downloaded_valid_contents().filter(
+            rendition_key=rendition_key, expired=False, download_path__isnull=False
+        )
+
 
 class AllowedExtractorManager(models.Manager):
     def active_extractors(self):
@@ -32,9 +40,12 @@ class AllowedExtractorManager(models.Manager):
 class Content(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     info_id = models.CharField(max_length=300)
-    info_file_path = models.FilePathField(path='info/')
+    info_file_path = models.FilePathField(path='info/', max_length=300)
     celery_download_task_id = models.CharField(max_length=300, blank=True, null=True)
     url = models.URLField(blank=True, null=True)
+    # the lookup key of the url: the extractor key and the video id of its info (see url_normalization.make_url_key),
+    # or the normalized url (set on save)
+    url_key = models.CharField(max_length=URL_KEY_MAX_LENGTH, blank=True, null=True, editable=False)
     title = models.CharField(max_length=300, blank=True, null=True)
     type = models.CharField(max_length=20, blank=True, null=True, default='audio')
     extension = models.CharField(max_length=20, blank=True, null=True, default='mp3')
@@ -42,26 +53,54 @@ class Content(models.Model):
     frame_rate = models.IntegerField(blank=True, null=True)
     aspect_ratio = models.IntegerField(blank=True, null=True)
     audio_bitrate = models.IntegerField(blank=True, null=True, default=400)
-    download_url = models.URLField(blank=True, null=True)
+    # the clip of the content (seconds)
+    start_time = models.FloatField(blank=True, null=True)
+    end_time = models.FloatField(blank=True, null=True)
+    # the direct media url of the selected format (see direct_url.py), the signed urls are long
+    download_url = models.URLField(max_length=2048, blank=True, null=True)
+    download_url_expiration_date = models.DateTimeField(blank=True, null=True)
     download_path = models.FilePathField(path='temp/', blank=True, null=True)
-    processed_at = models.DateTimeField(auto_now_add=True)
+    rendition_key = models.CharField(max_length=64, blank=True, null=True)
+    processed_at = models.DateTimeField(default=timezone.now, editable=False)
     expiration_date = models.DateTimeField(blank=True, null=True)
     downloaded_successfully = models.BooleanField(default=False)
     expired = models.BooleanField(blank=True, default=False)
+    # a playlist (or a carousel) content aggregates the contents of its entries, which are downloaded in parallel
+    is_playlist = models.BooleanField(default=False)
+    parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='entries', blank=True, null=True)
+    playlist_index = models.PositiveIntegerField(blank=True, null=True)
     objects = ContentManager()
 
     class Meta:
         ordering = ['-processed_at', ]
+        indexes = [
+            # the latest content of an url (MainDownloader.extract_info)
+            models.Index(fields=['url_key', '-processed_at'], name='content_url_processed_idx'),
+            # the cached renditions and master copies (ContentManager.cached_renditions)
+            models.Index(fields=['rendition_key', 'expiration_date'], name='content_rendition_exp_idx'),
+            # the master videos of an info (MainDownloader.get_cached_master)
+            models.Index(fields=['info_id', 'type'], name='content_info_type_idx'),
+            # the valid contents sharing a file (the expired content files cleanup)
+            models.Index(fields=['download_path', 'expiration_date'], name='content_path_exp_idx'),
+            # the expired but not processed contents (the expired content files cleanup)
+            models.Index(fields=['expiration_date'], condition=Q(expired=False), name='content_unexpired_exp_idx'),
+        ]
 
     def __str__(self):
         return f'{self.pk} content'
 
     def save(self, **kwargs):
-        # Setting expiration_date according to processed_at
+        # Setting expiration_date according to processed_at and the missing url_key according to url in the same write
+        update_fields = kwargs.get('update_fields')
+        if not self.expiration_date:
+            self.expiration_date = self.processed_at + CONTENT_LIFETIME
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields = {*update_fields, 'expiration_date'}
+        if not self.url_key and self.url:
+            self.url_key = normalize_url(self.url)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'url_key'}
         super().save(**kwargs)
-        if self.processed_at and not self.expiration_date:
-            self.expiration_date = self.processed_at + timedelta(hours=5)
-            super().save(update_fields=['expiration_date', ])
 
 
 class AllowedExtractor(models.Model):
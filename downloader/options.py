@@ -0,0 +1,94 @@
+from collections.abc import Mapping
+
+# The options that differ between the uses of the same option profile (the per task hooks and output template).
+PER_USE_OPTIONS = ('outtmpl', 'progress_hooks', 'postprocessor_hooks')
+
+
+class OptionProfile(Mapping):
+    """
+    OptionProfile is an immutable, hashable mapping of YoutubeDL options.
+    The nested dicts are frozen as OptionProfile objects and the lists as tuples, so a profile can be shared by the
+    tasks and threads of a worker and used as a cache key. Use replace() to derive a new profile (copy-on-write)
+    and to_dict() to get the mutable options that YoutubeDL expects.
+    """
+    __slots__ = ('_options', '_hash')
+
+    def __init__(self, options=None, **kwargs):
+        options = dict(options or {}, **kwargs)
+        self._options = {key: freeze(value) for key, value in options.items()}
+        self._hash = None
+
+    def __getitem__(self, key):
+        return self._options[key]
+
+    def __iter__(self):
+        return iter(self._options)
+
+    def __len__(self):
+        return len(self._options)
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(frozenset(self._options.items()))
+        return self._hash
+
+    def __eq__(self, other):
+        if isinstance(other, OptionProfile):
+            return hash(self) == hash(other) and self._options == other._options
+        return NotImplemented
+
+    def __repr__(self):
+        return f'OptionProfile({self._options!r})'
+
+    def __reduce__(self):
+        return OptionProfile, (self.to_dict(), )
+
+    def replace(self, options=None, **kwargs):
+        """
+        Returns a new profile with the given options replaced.
+        :param options:
+        :param kwargs:
+        :return:
+        """
+        return OptionProfile(dict(self._options, **dict(options or {}, **kwargs)))
+
+    def without(self, *keys):
+        return OptionProfile({key: value for key, value in self._options.items() if key not in keys})
+
+    def to_dict(self):
+        return thaw(self)
+
+
+def freeze(value):
+    if isinstance(value, OptionProfile):
+        return value
+    if isinstance(value, Mapping):
+        return OptionProfile(value)
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, set):
+        return frozenset(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    if isinstance(value, frozenset):
+        return set(value)
+    return value
+
+
+def split_per_use_options(options):
+    """
+    Splits the options to their profile (OptionProfile) and their per-use options (PER_USE_OPTIONS, a dict).
+    :param options:
+    :return profile, per_use_options:
+    """
+    options = options or {}
+    per_use_options = {key: options[key] for key in PER_USE_OPTIONS if key in options}
+    if isinstance(options, OptionProfile):
+        return options.without(*PER_USE_OPTIONS), thaw(per_use_options)
+    return OptionProfile({key: value for key, value in options.items() if key not in PER_USE_OPTIONS}), per_use_options
@@ -0,0 +1,103 @@
+import os
+import re
+from django.utils import timezone
+from .archive import make_archive_name, make_zip_response
+from .info_store import get_info_store
+from .main_downloader import RENDITION_DETAIL_FIELDS, make_rendition_key
+from .models import Content, CONTENT_LIFETIME
+from .url_normalization import make_url_key, normalize_url
+
+# The entry types of the flat extracted playlists, their infos are extracted by the entry downloads
+URL_ENTRY_TYPES = ('url', 'url_transparent')
+
+
+def get_entry_contents(parent, detail=None):
+    """
+    Returns the entry contents of the playlist content in their playlist order, creating them from its info
+    (one content per entry) if they are not created yet.
+    :param parent:
+    :param detail:
+    :return:
+    """
+    entries = list(parent.entries.order_by('playlist_index'))
+    if entries:
+        return entries
+    info_store = get_info_store()
+    if not info_store.exists(parent.info_file_path):
+        return []
+    return create_entry_contents(parent, info_store.load(parent.info_file_path), detail)
+
+
+def create_entry_contents(parent, playlist_info, detail=None):
+    """
+    Creates the entry contents of the playlist content (in one query) and returns them.
+    The processed entries (e.g. the carousel items) are saved to the info store and downloaded using their info,
+    the url entries of a flat extraction are downloaded using their url.
+    :param parent:
+    :param playlist_info:
+    :param detail:
+    :return:
+    """
+    info_store = get_info_store()
+    detail = detail or {field: getattr(parent, field) for field in RENDITION_DETAIL_FIELDS}
+    processed_at = timezone.now()
+    entries = []
+    for index, entry in enumerate(playlist_info.get('entries') or [], 1):
+        if not entry or not entry.get('id'):
+            continue
+        is_url_entry = entry.get('_type') in URL_ENTRY_TYPES
+        extractor_key = entry.get('extractor_key') or entry.get('ie_key')
+        url = (entry.get('url') if is_url_entry else entry.get('webpage_url')) or parent.url
+        entries.append(Content(
+            parent=parent,
+            playlist_index=entry.get('playlist_index') or index,
+            info_id=entry['id'],
+            info_file_path='' if is_url_entry else info_store.save(entry),
+            url=url,
+            url_key=make_url_key(extractor_key, entry['id']) if extractor_key else normalize_url(url),
+            title=entry.get('title'),
+            rendition_key=make_rendition_key(extractor_key, entry['id'], detail) if extractor_key else None,
+            processed_at=processed_at,
+            expiration_date=processed_at + CONTENT_LIFETIME,
+            **{field: getattr(parent, field) for field in RENDITION_DETAIL_FIELDS},
+        ))
+    return Content.objects.bulk_create(entries)
+
+
+def split_into_lanes(items, lane_count):
+    """
+    Splits the items into at most lane_count lists, the items of a lane run one after another.
+    :param items:
+    :param lane_count:
+    :return:
+    """
+    lane_count = max(1, min(lane_count, len(items)))
+    return [items[lane::lane_count] for lane in range(lane_count)]
+
+
+def get_archive_members(parent):
+    """
+    Returns the (archive name, file path) pairs of the downloaded entries of the playlist content whose files exist.
+    :param parent:
+    :return:
+    """
+    entries = parent.entries.filter(
+        downloaded_successfully=True, download_path__isnull=False
+    ).order_by('playlist_index')
+    return [
+        (make_archive_name(entry.playlist_index or 0, entry.download_path), entry.download_path)
+        for entry in entries if os.path.isfile(entry.download_path)
+    ]
+
+
+def make_playlist_response(parent):
+    """
+    Returns a streamed ZIP response of the downloaded entries of the playlist content, or None if there is none.
+    :param parent:
+    :return:
+    """
+    members = get_archive_members(parent)
+    if not members:
+        return None
+    file_name = re.sub(r'[\\/:*?"<>|]', '_', parent.title or str(parent.pk))
+    return make_zip_response(members, f'{file_name}.zip')
@@ -0,0 +1,85 @@
+import contextlib
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from django.conf import settings
+from .options import PER_USE_OPTIONS, thaw
+
+
+class YoutubeDLPool:
+    """
+    YoutubeDLPool keeps warmed (already initialized) YoutubeDL objects to reuse them across the tasks of a worker,
+    instead of loading the extractors, the postprocessors, the cookie jar and the HTTP handlers for each task.
+    The objects are keyed by their option profile (the class and the options except PER_USE_OPTIONS),
+    reset before each use and not closed between the uses, so their HTTP connections are reused too.
+    The idle objects are kept per thread, so an object is never shared by two concurrent tasks.
+    """
+
+    def __init__(self, max_profiles=None, max_uses=None):
+        self.max_profiles = settings.YOUTUBEDL_POOL_MAX_PROFILES if max_profiles is None else max_profiles
+        self.max_uses = settings.YOUTUBEDL_POOL_MAX_USES if max_uses is None else max_uses
+        self._local = threading.local()
+
+    @contextlib.contextmanager
+    def acquire(self, youtubedl_class, options=None):
+        """
+        Returns a context manager of a ready to use youtubedl_class object with the options.
+        The object is released to the pool (not closed) at exit.
+        :param youtubedl_class:
+        :param options:
+        :return:
+        """
+        # a private (mutable) copy, YoutubeDL changes its params
+        options = thaw(options or {})
+        if not self.max_profiles:
+            with youtubedl_class(options) as ytdl_obj:
+                yield ytdl_obj
+            return
+        key = make_option_profile_key(youtubedl_class, options)
+        ytdl_obj = self.get_idle_objects().pop(key, None)
+        if ytdl_obj is None:
+            ytdl_obj = youtubedl_class(options)
+            ytdl_obj.pool_uses = 0
+        else:
+            ytdl_obj.reset(options)
+        ytdl_obj.pool_uses += 1
+        try:
+            yield ytdl_obj
+        except Exception:
+            # the state of the object is unknown after a failure
+            ytdl_obj.close()
+            raise
+        self.release(key, ytdl_obj)
+
+    def release(self, key, ytdl_obj):
+        ytdl_obj.save_cookies()
+        if self.max_uses and ytdl_obj.pool_uses >= self.max_uses:
+            ytdl_obj.close()
+            return
+        idle_objects = self.get_idle_objects()
+        idle_objects[key] = ytdl_obj
+        idle_objects.move_to_end(key)
+        while len(idle_objects) > self.max_profiles:
+            _, evicted_ytdl_obj = idle_objects.popitem(last=False)
+            evicted_ytdl_obj.close()
+
+    def get_idle_objects(self):
+        if not hasattr(self._local, 'idle_objects'):
+            self._local.idle_objects = OrderedDict()
+        return self._local.idle_objects
+
+    def clear(self):
+        idle_objects = self.get_idle_objects()
+        while idle_objects:
+            _, ytdl_obj = idle_objects.popitem()
+            ytdl_obj.close()
+
+
+youtubedl_pool = YoutubeDLPool()
+
+
+def make_option_profile_key(youtubedl_class, options):
+    profile = {k: v for k, v in options.items() if k not in PER_USE_OPTIONS}
+    profile_data = json.dumps([youtubedl_class.__qualname__, profile], sort_keys=True, default=repr)
+    return hashlib.sha256(profile_data.encode('utf-8')).hexdigest()
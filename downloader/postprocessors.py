@@ -0,0 +1,202 @@
+import os
+import time
+from yt_dlp.globals import postprocessors
+from yt_dlp.postprocessor import EmbedThumbnailPP, FFmpegExtractAudioPP, FFmpegMetadataPP, FFmpegVideoConvertorPP
+from yt_dlp.postprocessor.common import PostProcessor
+from yt_dlp.postprocessor.ffmpeg import ACODECS, FFmpegThumbnailsConvertorPP, resolve_mapping
+from yt_dlp.utils import PostProcessingError, prepend_extension, replace_extension
+
+
+class FFmpegSinglePassAudioPP(FFmpegExtractAudioPP):
+    """
+    FFmpegSinglePassAudioPP converts the audio, adds the metadata (and the chapters) and embeds the cover
+    in one ffmpeg command, instead of the FFmpegExtractAudio, EmbedThumbnail and FFmpegMetadata chain
+    which rewrites the whole file three times.
+    It only handles the containers which ffmpeg can embed a cover into (COVER_EXTS),
+    the other targets and a failed single pass fall back to the chain.
+    """
+    COVER_EXTS = ('mp3', 'flac')
+    COVER_THUMBNAIL_EXTS = ('jpg', 'jpeg', 'png')
+
+    def __init__(self, downloader=None, preferredcodec=None, preferredquality=None, nopostoverwrites=False,
+                 already_have_thumbnail=False):
+        super().__init__(downloader, preferredcodec, preferredquality, nopostoverwrites)
+        self._preferredcodec = preferredcodec
+        self._preferredquality_arg = preferredquality
+        self._already_have_thumbnail = already_have_thumbnail
+
+    @PostProcessor._restrict_to(images=False)
+    def run(self, information):
+        target_format, _ = resolve_mapping(information['ext'], self.mapping)
+        if target_format not in self.COVER_EXTS:
+            return self.run_chain(information)
+        try:
+            return self.run_single_pass(information, target_format)
+        except PostProcessingError as e:
+            self.report_warning(f'Unable to post-process the audio in a single pass: {e}; falling back to the chain')
+            return self.run_chain(information)
+
+    def run_single_pass(self, information, target_format):
+        orig_path = path = information['filepath']
+        filecodec = self.get_audio_codec(path)
+        if filecodec is None:
+            raise PostProcessingError('unable to obtain file audio codec with ffprobe')
+        if filecodec == target_format:
+            extension, _, more_opts, acodec = *ACODECS[target_format], 'copy'
+        else:
+            extension, acodec, more_opts = ACODECS[target_format]
+            more_opts = self._quality_args(acodec)
+
+        new_path = temp_path = replace_extension(path, extension, information['ext'])
+        if new_path == path:
+            orig_path = prepend_extension(path, 'orig')
+            temp_path = prepend_extension(path, 'temp')
+
+        input_paths = [path]
+        options = ['-map', '0:a', '-acodec', acodec, *more_opts]
+        original_thumbnail, thumbnail_path = self.get_cover_thumbnail(information)
+        if thumbnail_path:
+            options.extend(['-map', f'{len(input_paths)}:0', '-c:v', 'copy', '-disposition:v:0', 'attached_pic',
+                            '-metadata:s:v', 'title=Album cover', '-metadata:s:v', 'comment=Cover (front)'])
+            input_paths.append(thumbnail_path)
+        if target_format == 'mp3':
+            options.extend(['-id3v2_version', '3'])
+
+        metadata_pp = FFmpegMetadataPP(self._downloader)
+        metadata_path = None
+        metadata_pp._fixup_chapters(information)
+        if information.get('chapters'):
+            metadata_path = replace_extension(path, 'meta')
+            # writes the chapters to the ffmetadata file
+            list(metadata_pp._get_chapter_opts(information['chapters'], metadata_path))
+            options.extend(['-map_metadata', f'{len(input_paths)}', '-map_chapters', f'{len(input_paths)}'])
+            input_paths.append(metadata_path)
+        for option in metadata_pp._get_metadata_opts(information):
+            options.extend(option)
+
+        self.to_screen(f'Destination: {new_path} (single pass)')
+        try:
+            self.run_ffmpeg_multiple_files(input_paths, temp_path, options)
+        finally:
+            if metadata_path:
+                self._delete_downloaded_files(metadata_path)
+
+        os.replace(path, orig_path)
+        os.replace(temp_path, new_path)
+        information['filepath'] = new_path
+        information['ext'] = extension
+        if information.get('filetime') is not None:
+            self.try_utime(
+                new_path, time.time(), information['filetime'], errnote='Cannot update utime of audio file')
+
+        if thumbnail_path:
+            converted = original_thumbnail != thumbnail_path
+            self._delete_downloaded_files(
+                thumbnail_path if converted or not self._already_have_thumbnail else None,
+                original_thumbnail if converted and not self._already_have_thumbnail else None,
+                info=information)
+        return [orig_path], information
+
+    def run_chain(self, information):
+        """
+        Runs the FFmpegExtractAudio, EmbedThumbnail and FFmpegMetadata postprocessors one after another.
+        :param information:
+        :return:
+        """
+        files_to_delete = []
+        for postprocessor in (
+            FFmpegExtractAudioPP(
+                self._downloader, self._preferredcodec, self._preferredquality_arg, self._nopostoverwrites),
+            EmbedThumbnailPP(self._downloader, self._already_have_thumbnail),
+            FFmpegMetadataPP(self._downloader),
+        ):
+            pp_files_to_delete, information = postprocessor.run(information)
+            files_to_delete.extend(pp_files_to_delete)
+        return files_to_delete, information
+
+    def get_cover_thumbnail(self, information):
+        """
+        Returns the original and the (converted) path of the thumbnail to embed, or (None, None).
+        :param information:
+        :return:
+        """
+        thumbnails = information.get('thumbnails') or []
+        idx = next((-i for i, t in enumerate(thumbnails[::-1], 1) if t.get('filepath')), None)
+        if idx is None or not os.path.exists(thumbnails[idx]['filepath']):
+            return None, None
+        convertor = FFmpegThumbnailsConvertorPP(self._downloader)
+        convertor.fixup_webp(information, idx)
+        original_thumbnail = thumbnail_path = thumbnails[idx]['filepath']
+        if os.path.splitext(thumbnail_path)[1][1:].lower() not in self.COVER_THUMBNAIL_EXTS:
+            thumbnail_path = convertor.convert_thumbnail(thumbnail_path, 'png')
+        return original_thumbnail, thumbnail_path
+
+
+class FFmpegRemuxingVideoConvertorPP(FFmpegVideoConvertorPP):
+    """
+    FFmpegRemuxingVideoConvertorPP converts the videos like FFmpegVideoConvertor, but stream copies (remuxes)
+    the streams whose codecs fit the target container and only transcodes the others.
+    The containers which are not in REMUXABLE_CODECS are always transcoded.
+    """
+    # the codec prefixes that can be stream copied into the containers
+    REMUXABLE_CODECS = {
+        'mp4': {'v': ('avc', 'h264', 'hev', 'hvc', 'h265', 'av01'), 'a': ('mp4a', 'aac', 'mp3')},
+        'mov': {'v': ('avc', 'h264', 'hev', 'hvc', 'h265'), 'a': ('mp4a', 'aac', 'mp3')},
+        'webm': {'v': ('vp8', 'vp9', 'vp09', 'av01'), 'a': ('opus', 'vorbis')},
+        'mkv': {'v': ('', ), 'a': ('', )},
+    }
+
+    @PostProcessor._restrict_to(images=False)
+    def run(self, info):
+        filename, source_ext = info['filepath'], info['ext'].lower()
+        target_ext, _skip_msg = resolve_mapping(source_ext, self.mapping)
+        if _skip_msg:
+            self.to_screen(f'Not {self._ACTION} media file "{filename}"; {_skip_msg}')
+            return [], info
+
+        options = self.get_remuxing_options(target_ext, info)
+        copied_streams = ', '.join(options[i + 1] for i, option in enumerate(options) if option in ('-c:v', '-c:a'))
+        outpath = replace_extension(filename, target_ext, source_ext)
+        self.to_screen(
+            f'{self._ACTION.title()} video from {source_ext} to {target_ext} '
+            f'(stream copying: {copied_streams or "none"}); Destination: {outpath}')
+        self.run_ffmpeg(filename, outpath, options)
+
+        info['filepath'] = outpath
+        info['format'] = info['ext'] = target_ext
+        return [filename], info
+
+    def get_remuxing_options(self, target_ext, info):
+        """
+        Returns the ffmpeg options of the conversion, copying the video and the audio streams if their codecs fit.
+        :param target_ext:
+        :param info:
+        :return:
+        """
+        remuxable_codecs = self.REMUXABLE_CODECS.get(target_ext)
+        if remuxable_codecs is None:
+            return list(self._options(target_ext))
+        options = list(self.stream_copy_opts(False))
+        for stream_type, codecs in get_stream_codecs(info).items():
+            if codecs and all(codec.startswith(remuxable_codecs[stream_type]) for codec in codecs):
+                options.extend([f'-c:{stream_type}', 'copy'])
+        return options
+
+
+def get_stream_codecs(info):
+    """
+    Returns the (lowercase) video and audio codecs of the downloaded formats of the info.
+    :param info:
+    :return:
+    """
+    codecs = {'v': [], 'a': []}
+    for fmt in info.get('requested_formats') or [info]:
+        for stream_type, codec in (('v', fmt.get('vcodec')), ('a', fmt.get('acodec'))):
+            if codec and codec != 'none':
+                codecs[stream_type].append(codec.lower())
+    return codecs
+
+
+# registering the postprocessors, so they can be used by their key in the postprocessors option
+postprocessors.value.setdefault('FFmpegSinglePassAudioPP', FFmpegSinglePassAudioPP)
+postprocessors.value.setdefault('FFmpegRemuxingVideoConvertorPP', FFmpegRemuxingVideoConvertorPP)
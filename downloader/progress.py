@@ -0,0 +1,158 @@
+import json
+import time
+import redis
+from celery.result import AsyncResult
+from django.conf import settings
+from .coordination import get_redis_connection
+from .models import Content
+
+PROGRESS_CHANNEL_PREFIX = 'easydownloader:progress:'
+LAST_PROGRESS_EVENT_KEY_PREFIX = 'easydownloader:last-progress:'
+PROGRESS_EVENT_FIELDS = [
+    'status', 'downloaded_bytes', 'total_bytes', 'total_bytes_estimate', 'speed', 'eta', 'elapsed',
+    'fragment_index', 'fragment_count',
+]
+FINAL_STAGE = 'done'
+FINISHED_EVENT = {'stage': FINAL_STAGE, 'status': 'finished'}
+FAILED_EVENT = {'stage': FINAL_STAGE, 'status': 'error'}
+
+
+class ProgressPublisher:
+    """
+    ProgressPublisher collects the yt-dlp progress and postprocessor hook events of a content download
+    and publishes them through redis for the progress (server-sent events) view.
+    Download progress events are rate limited by DOWNLOAD_PROGRESS_MIN_INTERVAL, status changes are always published.
+    """
+
+    def __init__(self, content_pk, min_interval=None):
+        self.content_pk = str(content_pk)
+        self.min_interval = settings.DOWNLOAD_PROGRESS_MIN_INTERVAL if min_interval is None else min_interval
+        self.last_published_at = 0
+        self.last_status = None
+
+    def get_hooks_options(self):
+        return {
+            'progress_hooks': [self.progress_hook, ],
+            'postprocessor_hooks': [self.postprocessor_hook, ],
+        }
+
+    def progress_hook(self, status_dict):
+        event = {field: status_dict.get(field) for field in PROGRESS_EVENT_FIELDS}
+        event['stage'] = 'download'
+        force = status_dict.get('status') != self.last_status
+        self.last_status = status_dict.get('status')
+        self.publish(event, force=force)
+
+    def postprocessor_hook(self, status_dict):
+        event = {
+            'stage': 'postprocess',
+            'status': status_dict.get('status'),
+            'postprocessor': status_dict.get('postprocessor'),
+        }
+        self.publish(event, force=True)
+
+    def publish_done(self, successful=True):
+        self.publish(FINISHED_EVENT if successful else FAILED_EVENT, force=True)
+
+    def publish(self, event, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_published_at < self.min_interval:
+            return
+        connection = get_redis_connection()
+        if connection is None:
+            return
+        self.last_published_at = now
+        data = json.dumps(event)
+        try:
+            connection.pipeline(transaction=False).publish(
+                PROGRESS_CHANNEL_PREFIX + self.content_pk, data
+            ).set(
+                LAST_PROGRESS_EVENT_KEY_PREFIX + self.content_pk, data, ex=settings.DOWNLOAD_PROGRESS_EVENT_TIMEOUT
+            ).execute()
+        except redis.RedisError:
+            pass
+
+
+def iter_progress_events(content_pk, max_duration=None):
+    """
+    Yields the progress events of the content as server-sent events until the download is done.
+    Starts with the last published event, so late subscribers know the current state.
+    Yields keep-alive comments while there is no event, checking the content state (see get_done_event) each time
+    in case its done event is missed. The stream ends after max_duration seconds
+    (DOWNLOAD_PROGRESS_STREAM_MAX_DURATION by default).
+    Without redis, only the done event of a done download is yielded.
+    :param content_pk:
+    :param max_duration:
+    :return:
+    """
+    connection = get_redis_connection()
+    if connection is None:
+        done_event = get_done_event(content_pk)
+        if done_event:
+            yield format_server_sent_event(json.dumps(done_event))
+        return
+    content_pk = str(content_pk)
+    max_duration = settings.DOWNLOAD_PROGRESS_STREAM_MAX_DURATION if max_duration is None else max_duration
+    deadline = time.monotonic() + max_duration
+    pubsub = connection.pubsub(ignore_subscribe_messages=True)
+    try:
+        pubsub.subscribe(PROGRESS_CHANNEL_PREFIX + content_pk)
+        last_event = connection.get(LAST_PROGRESS_EVENT_KEY_PREFIX + content_pk)
+        if last_event:
+            yield format_server_sent_event(last_event)
+            if json.loads(last_event).get('stage') == FINAL_STAGE:
+                return
+        while (remaining := deadline - time.monotonic()) > 0:
+            message = pubsub.get_message(timeout=min(settings.DOWNLOAD_PROGRESS_KEEP_ALIVE_INTERVAL, remaining))
+            if not message:
+                done_event = get_done_event(content_pk)
+                if done_event:
+                    yield format_server_sent_event(json.dumps(done_event))
+                    return
+                yield ': keep-alive\n\n'
+                continue
+            yield format_server_sent_event(message['data'])
+            if json.loads(message['data']).get('stage') == FINAL_STAGE:
+                return
+    except redis.RedisError:
+        return
+    finally:
+        pubsub.close()
+
+
+def get_done_event(content_pk):
+    """
+    Returns the done event of the content if it is downloaded or its download task is done, otherwise None.
+    :param content_pk:
+    :return:
+    """
+    content = Content.objects.filter(pk=content_pk).only('downloaded_successfully', 'celery_download_task_id').first()
+    if content is None:
+        return FAILED_EVENT
+    if content.downloaded_successfully:
+        return FINISHED_EVENT
+    if not content.celery_download_task_id:
+        return None
+    download_result = AsyncResult(content.celery_download_task_id)
+    if not download_result.ready():
+        return None
+    result = download_result.result
+    successful = download_result.successful() and isinstance(result, (list, tuple)) and not result[0]
+    return FINISHED_EVENT if successful else FAILED_EVENT
+
+
+def publish_contents_done(content_pks, successful=True):
+    """
+    Publishes the done event of the contents, e.g. the contents sharing the download of another content.
+    :param content_pks:
+    :param successful:
+    :return:
+    """
+    for content_pk in content_pks:
+        ProgressPublisher(content_pk).publish_done(successful=successful)
+
+
+def format_server_sent_event(data, event='progress'):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return f'event: {event}\ndata: {data}\n\n'
@@ -0,0 +1,209 @@
+import os
+import subprocess
+from celery import states, uuid
+from celery.result import AsyncResult
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from yt_dlp.postprocessor import FFmpegMetadataPP, FFmpegPostProcessor
+from .coordination import (claim_in_flight_download, in_flight_download_heartbeat, publish_task_done,
+                           release_in_flight_download)
+from .delivery import FILE_CHUNK_SIZE, guess_content_type
+from .main_downloader import DownloadProcessError, make_info_projection, select_content_format
+from .models import Content
+from .progress import publish_contents_done
+
+# The audio extensions that can be transcoded to a pipe: (ffmpeg audio codec, ffmpeg output format)
+STREAMABLE_AUDIO_EXTENSIONS = {
+    'mp3': ('libmp3lame', 'mp3'),
+    'aac': ('aac', 'adts'),
+    'wav': ('pcm_s16le', 'wav'),
+}
+# The protocols of the source formats that ffmpeg can read itself
+STREAMABLE_PROTOCOLS = ('http', 'https', 'm3u8', 'm3u8_native')
+
+
+def make_streaming_transcode_response(content):
+    """
+    Returns a chunked response of the content that is transcoded by ffmpeg while its source is being downloaded,
+    or None if the content can not be streamed (the normal download pipeline should be used).
+    The output is also written to the disk (teed), the content is updated with it when the stream is completed.
+    The stream owns the in-flight download of the rendition like a download task (its id is stored on the content
+    as celery_download_task_id), the other requests of the rendition wait for its result (see finish_stream).
+    :param content:
+    :return:
+    """
+    if not is_streamable_content(content):
+        return None
+    source = get_stream_source(content)
+    if source is None:
+        return None
+    selected_info, download_path = source
+    info_projection = make_info_projection(selected_info)
+    stream_id = uuid()
+    if claim_in_flight_download(content.rendition_key, stream_id) != stream_id:
+        return None
+    if not Content.objects.filter(pk=content.pk, celery_download_task_id__isnull=True).update(
+            celery_download_task_id=stream_id):
+        # the content is dispatched by another request meanwhile
+        release_in_flight_download(content.rendition_key, stream_id)
+        return None
+    part_path = f'{download_path}.{stream_id}.part'
+    os.makedirs(os.path.dirname(part_path), exist_ok=True)
+    process = subprocess.Popen(
+        build_streaming_command(selected_info, content), stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    # an expired source url or a failed transcode falls back to the normal pipeline before any response
+    first_chunk = process.stdout.read(FILE_CHUNK_SIZE)
+    if not first_chunk:
+        process.stdout.close()
+        process.wait()
+        finish_stream(content, stream_id, info_projection, completed=False)
+        return None
+    response = StreamingHttpResponse(
+        iter_stream_output(content, stream_id, info_projection, process, part_path, download_path, first_chunk),
+        content_type=guess_content_type(download_path),
+    )
+    response['Content-Disposition'] = content_disposition_header(True, os.path.basename(download_path))
+    # Disabling the proxy buffering to deliver the first bytes immediately.
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def is_streamable_content(content):
+    if not settings.STREAMING_TRANSCODE or content.downloaded_successfully or content.celery_download_task_id:
+        return False
+    if content.is_playlist:
+        return False
+    if content.type != 'audio' or content.extension not in STREAMABLE_AUDIO_EXTENSIONS:
+        return False
+    if content.rendition_key and Content.objects.cached_renditions(content.rendition_key).exists():
+        return False
+    return FFmpegPostProcessor().available
+
+
+def get_stream_source(content):
+    """
+    Selects the source format of the content from its info (without downloading it).
+    Returns the selected format info and the download path of the content, or None if the source can not be streamed.
+    :param content:
+    :return:
+    """
+    try:
+        selected_info, download_path = select_content_format(content)
+    except DownloadProcessError:
+        return None
+    if selected_info is None:
+        return None
+    if selected_info.get('requested_formats') or selected_info.get('protocol') not in STREAMABLE_PROTOCOLS:
+        return None
+    if not selected_info.get('url') or selected_info.get('acodec') == 'none':
+        return None
+    return selected_info, download_path
+
+
+def build_streaming_command(selected_info, content):
+    """
+    Returns the ffmpeg command that reads the selected source format and writes the content audio to stdout.
+    :param selected_info:
+    :param content:
+    :return:
+    """
+    ffmpeg = FFmpegPostProcessor()
+    codec, output_format = STREAMABLE_AUDIO_EXTENSIONS[content.extension]
+    command = [ffmpeg.executable or 'ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin']
+    if content.start_time:
+        command += ['-ss', str(content.start_time)]
+    if content.end_time:
+        command += ['-to', str(content.end_time)]
+    http_headers = selected_info.get('http_headers') or {}
+    if http_headers:
+        command += ['-headers', ''.join(f'{key}: {value}\r\n' for key, value in http_headers.items())]
+    command += ['-i', selected_info['url'], '-map', '0:a:0', '-vn', '-c:a', codec]
+    if content.audio_bitrate and output_format != 'wav':
+        command += ['-b:a', f'{content.audio_bitrate}k']
+    for option in FFmpegMetadataPP(None)._get_metadata_opts(selected_info):
+        command += option
+    command += ['-f', output_format, 'pipe:1']
+    return command
+
+
+def iter_stream_output(content, stream_id, info_projection, process, part_path, download_path, first_chunk=b''):
+    """
+    Yields the teed output of the stream (see iter_teed_output) while keeping its in-flight claim alive,
+    the content is updated with download_path if the stream is completed.
+    :param content:
+    :param stream_id:
+    :param info_projection: the stream result info
+    :param process:
+    :param part_path:
+    :param download_path:
+    :param first_chunk:
+    :return:
+    """
+    completed = False
+
+    def on_complete():
+        nonlocal completed
+        completed = True
+        Content.objects.filter(pk=content.pk).update(download_path=download_path, downloaded_successfully=True)
+
+    try:
+        with in_flight_download_heartbeat(content.rendition_key, stream_id):
+            yield from iter_teed_output(process, part_path, download_path, first_chunk, on_complete)
+    finally:
+        finish_stream(content, stream_id, info_projection, completed)
+
+
+def finish_stream(content, stream_id, info_projection, completed):
+    """
+    Stores the result of the stream like an async_download_content result, releases its in-flight download
+    and notifies its waiters. The content of an uncompleted stream is dispatched again by the next request.
+    :param content:
+    :param stream_id:
+    :param info_projection:
+    :param completed:
+    :return:
+    """
+    if not completed:
+        Content.objects.filter(pk=content.pk, celery_download_task_id=stream_id).update(celery_download_task_id=None)
+    result = (0 if completed else 1, info_projection, content.pk)
+    AsyncResult(stream_id).backend.store_result(stream_id, result, states.SUCCESS)
+    release_in_flight_download(content.rendition_key, stream_id)
+    publish_task_done(stream_id)
+    publish_contents_done([content.pk], successful=completed)
+
+
+def iter_teed_output(process, part_path, download_path, first_chunk=b'', on_complete=None):
+    """
+    Yields the stdout chunks of the process while writing them to part_path.
+    The part file is renamed to download_path (and on_complete is called) only if the process is completed
+    successfully, it is removed if the stream is interrupted (e.g. the client is disconnected) or the process fails.
+    :param process:
+    :param part_path:
+    :param download_path:
+    :param first_chunk:
+    :param on_complete:
+    :return:
+    """
+    completed = False
+    try:
+        with open(part_path, 'wb') as part_file:
+            chunk = first_chunk or process.stdout.read(FILE_CHUNK_SIZE)
+            while chunk:
+                part_file.write(chunk)
+                yield chunk
+                chunk = process.stdout.read(FILE_CHUNK_SIZE)
+        completed = process.wait() == 0
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        if completed:
+            os.replace(part_path, download_path)
+            if on_complete:
+                on_complete()
+        elif os.path.exists(part_path):
+            os.remove(part_path)
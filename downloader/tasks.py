@@ -1,9 +1,26 @@
-from celery import shared_task
+from celery import shared_task, chain, chord, group
+from celery.signals import task_postrun
+from celery.result import AsyncResult
+from celery.utils import uuid
+from celery.utils.log import get_task_logger
+from django.conf import settings
+from yt_dlp.utils import YoutubeDLError
+from .coordination import (claim_in_flight_download, release_in_flight_download, publish_task_done,
+                           in_flight_download_heartbeat)
 from .models import Content
-from .main_downloader import MainDownloader
+from .main_downloader import MainDownloader, DownloadProcessError, make_info_projection
 from .downloaders import CustomYoutubeDL
+from .info_store import get_info_store
+from .playlists import get_entry_contents, split_into_lanes
+from .progress import publish_contents_done
+from .pool import youtubedl_pool
 import os
 
+logger = get_task_logger(__name__)
+
+# The expired contents are processed in batches (one shared files query and one update per batch)
+CLEANUP_BATCH_SIZE = 500
+
 
 @shared_task
 def test_task(word: str):
@@ -13,7 +30,7 @@ def test_task(word: str):
 @shared_task
 def async_extract_info(*args, **kwargs):
     downloader = MainDownloader(*args, **kwargs)
-    with CustomYoutubeDL(downloader.options) as main_ytdl_obj:
+    with youtubedl_pool.acquire(CustomYoutubeDL, downloader.options) as main_ytdl_obj:
         info = downloader.extract_info(main_ytdl_obj)
     return info
 
@@ -21,35 +38,276 @@ def async_extract_info(*args, **kwargs):
 @shared_task
 def async_process_url(*args, **kwargs):
     kwargs = update_kwargs_content_obj(kwargs, ['content_obj', 'pre_created_content_obj'])
+    kwargs.setdefault('info_only', settings.INFO_ONLY_EXTRACTION)
     downloader = MainDownloader(*args, **kwargs)
-    code, info, content, ytdl_obj = downloader.run(download=False)
-    return code, info, content.pk
+    code, info, content = downloader.run(download=False)
+    schedule_info_refresh(info)
+    return code, make_info_projection(info), content.pk
 
 
 @shared_task
-def async_download_content(*args, **kwargs):
+def async_refresh_info(url, info_file_path):
+    """
+    Extracts the info of the url again and saves it to the info file, unless it has already been refreshed.
+    """
+    info_store = get_info_store()
+    if info_store.exists(info_file_path) and info_store.is_fresh(info_store.load(info_file_path)):
+        return 0
+    with youtubedl_pool.acquire(CustomYoutubeDL, MainDownloader(url).options) as ytdl_obj:
+        ytdl_obj.refresh_info_file(url, info_file_path)
+    return 0
+
+
+def schedule_info_refresh(info):
+    """
+    Refreshes the reused stale info in the background, so the download of the content does not wait for it.
+    :param info:
+    :return:
+    """
+    if not settings.INFO_BACKGROUND_REFRESH or get_info_store().is_fresh(info):
+        return None
+    if not info.get('webpage_url') or not info.get('info_file_path'):
+        return None
+    return async_refresh_info.delay(info['webpage_url'], info['info_file_path'])
+
+
+# acks_late: a download of a lost worker is delivered again instead of being lost (at once on the prefork pool with
+# reject_on_worker_lost, after the broker visibility timeout on the threads pool, see CELERY_BROKER_TRANSPORT_OPTIONS)
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def async_download_content(*args, in_flight_key=None, in_flight_owner_id=None, **kwargs):
     kwargs = update_kwargs_content_obj(kwargs, ['content_obj', 'pre_created_content_obj'])
     downloader = MainDownloader(*args, **kwargs)
-    code, info, content, ytdl_obj = downloader.run(download=True)
-    return code, info, content.pk
+    # In a chain, the in-flight download belongs to the last (postprocess) task which releases it.
+    owner_id = in_flight_owner_id or async_download_content.request.id
+    try:
+        with in_flight_download_heartbeat(in_flight_key, owner_id, hand_over=bool(in_flight_owner_id)):
+            code, info, content = downloader.run(download=True)
+    except Exception:
+        release_in_flight_download(in_flight_key, owner_id)
+        raise
+    if not in_flight_owner_id:
+        release_in_flight_download(in_flight_key, owner_id)
+    return code, make_info_projection(info), content.pk
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def async_postprocess_content(download_result, *args, in_flight_key=None, **kwargs):
+    """
+    The postprocess (CPU-bound) stage of a download, chained after async_download_content(defer_postprocessing=True).
+    Runs the deferred postprocessors on the downloaded files, returns the same result as async_download_content.
+    """
+    code, info, content_pk = download_result
+    try:
+        content = Content.objects.get(pk=content_pk)
+        # nothing to postprocess for the failed downloads and the cached renditions
+        if not code and not content.downloaded_successfully:
+            downloader = MainDownloader(
+                *args, pre_created_content_obj=content, info_file_path=content.info_file_path, **kwargs
+            )
+            with in_flight_download_heartbeat(in_flight_key, async_postprocess_content.request.id):
+                code, full_info, content = downloader.run_postprocessing()
+            info = make_info_projection(full_info)
+    finally:
+        release_in_flight_download(in_flight_key, async_postprocess_content.request.id)
+    return code, info, content_pk
+
+
+@shared_task(acks_late=True, reject_on_worker_lost=True)
+def async_download_playlist_entry(url, in_flight_key=None, **kwargs):
+    """
+    Downloads an entry of a playlist (see dispatch_playlist_download), a failed entry (download failure) is logged and
+    recorded on its content, it does not stop the other entries of its lane and the playlist callback.
+    The entry owns the in-flight download of its rendition, it is retried while another task downloads the same
+    rendition and then reuses its file (for at most TASK_RESULT_WAIT_TIMEOUT).
+    Returns the same result as async_download_content.
+    """
+    task_id = async_download_playlist_entry.request.id
+    content_pk = kwargs.get('pre_created_content_obj')
+    if claim_in_flight_download(in_flight_key, task_id) != task_id:
+        max_retries = settings.TASK_RESULT_WAIT_TIMEOUT // settings.TASK_RESULT_RECHECK_INTERVAL
+        if async_download_playlist_entry.request.retries < max_retries:
+            raise async_download_playlist_entry.retry(
+                countdown=settings.TASK_RESULT_RECHECK_INTERVAL, max_retries=max_retries
+            )
+        return 1, None, content_pk
+    try:
+        return async_download_content(url, in_flight_key=in_flight_key, in_flight_owner_id=task_id, **kwargs)
+    except (DownloadProcessError, YoutubeDLError):
+        logger.exception("The download of the playlist entry %s (%s) failed.", content_pk, url)
+        Content.objects.filter(pk=content_pk).update(downloaded_successfully=False)
+        return 1, None, content_pk
+    finally:
+        release_in_flight_download(in_flight_key, task_id)
+
+
+@shared_task
+def async_aggregate_playlist(parent_pk, in_flight_key=None):
+    """
+    The callback of the entry downloads of a playlist: the playlist is downloaded successfully if any of its entries is.
+    Returns the same result as async_download_content for the playlist content.
+    """
+    try:
+        downloaded = Content.objects.filter(parent_id=parent_pk, downloaded_successfully=True).exists()
+        Content.objects.filter(pk=parent_pk).update(downloaded_successfully=downloaded)
+        info_file_path = Content.objects.filter(pk=parent_pk).values_list('info_file_path', flat=True).first()
+        info_store = get_info_store()
+        info = make_info_projection(info_store.load(info_file_path)) if info_store.exists(info_file_path) else None
+    finally:
+        release_in_flight_download(in_flight_key, async_aggregate_playlist.request.id)
+    publish_contents_done([parent_pk], successful=downloaded)
+    return int(not downloaded), info, parent_pk
 
 
 @shared_task
+def async_process_url_and_download_content(url, detail=None, **kwargs):
+    """
+    Processes the url and then dispatches the download of the content without waiting for it.
+    Used by the asynchronous (non-blocking) api mode, the download task id is stored on the content.
+    """
+    code, info, content_pk = async_process_url(url, detail=detail, **kwargs)
+    content = Content.objects.get(pk=content_pk)
+    download_result = dispatch_download_content(
+        url, rendition_key=content.rendition_key, detail=detail, info_file_path=info.get('info_file_path'),
+        pre_created_content_obj=content.pk, playlist=content.is_playlist
+    )
+    # Updating only the task id, the download task may have already updated the content.
+    Content.objects.filter(pk=content.pk).update(celery_download_task_id=download_result.task_id)
+    return code, info, content_pk
+
+
+def dispatch_download_content(url, rendition_key=None, playlist=False, **kwargs):
+    """
+    Dispatches async_download_content (chained with async_postprocess_content if DEFER_POSTPROCESSING) for the url unless the same rendition is already being downloaded,
+    in which case the running download is shared instead of starting a new one.
+    The entries of a playlist content are downloaded in parallel instead (see dispatch_playlist_download).
+    Returns the AsyncResult of the task that owns the download.
+    :param url:
+    :param rendition_key:
+    :param playlist: whether the content (pre_created_content_obj) is a playlist
+    :param kwargs: async_download_content keyword arguments
+    :return:
+    """
+    task_id = uuid()
+    owner_task_id = claim_in_flight_download(rendition_key, task_id)
+    if owner_task_id != task_id:
+        return AsyncResult(owner_task_id)
+    kwargs['in_flight_key'] = rendition_key
+    if playlist:
+        return dispatch_playlist_download(task_id, **kwargs)
+    if not settings.DEFER_POSTPROCESSING:
+        return async_download_content.apply_async(args=(url, ), kwargs=kwargs, task_id=task_id)
+    # The download (I/O-bound) and the postprocess (CPU-bound) stages run on their own queues,
+    # the task id is the id of the last task (the result of the chain).
+    download_kwargs = dict(kwargs, defer_postprocessing=True, in_flight_owner_id=task_id)
+    return chain(
+        async_download_content.s(url, **download_kwargs),
+        async_postprocess_content.s(url, detail=kwargs.get('detail'), in_flight_key=rendition_key),
+    ).apply_async(task_id=task_id)
+
+
+def dispatch_playlist_download(task_id, pre_created_content_obj, detail=None, in_flight_key=None, **kwargs):
+    """
+    Dispatches the downloads of the entries of the playlist content (one content per entry) as a chord:
+    the entries are split into PLAYLIST_PARALLEL_DOWNLOADS lanes running in parallel, the entries of a lane are
+    downloaded one after another, and async_aggregate_playlist updates the playlist content after all of them.
+    Returns the AsyncResult of async_aggregate_playlist (task_id).
+    :param task_id:
+    :param pre_created_content_obj: the playlist content pk
+    :param detail:
+    :param in_flight_key:
+    :param kwargs: the other async_download_content keyword arguments (not used by the entries)
+    :return:
+    """
+    parent = Content.objects.get(pk=pre_created_content_obj)
+    # the entries downloaded by a previous dispatch are not downloaded again
+    entries = [entry for entry in get_entry_contents(parent, detail) if not entry.downloaded_successfully]
+    aggregate_signature = async_aggregate_playlist.si(parent.pk, in_flight_key=in_flight_key).set(task_id=task_id)
+    if not entries:
+        return aggregate_signature.apply_async()
+    lanes = [
+        chain(*(
+            async_download_playlist_entry.si(
+                entry.url, detail=detail, info_file_path=entry.info_file_path, pre_created_content_obj=entry.pk,
+                in_flight_key=entry.rendition_key,
+            ) for entry in lane
+        )) for lane in split_into_lanes(entries, settings.PLAYLIST_PARALLEL_DOWNLOADS)
+    ]
+    return chord(group(lanes))(aggregate_signature)
+
+
+def update_content_with_download_result(content, result):
+    """
+    Updates the content using the content of a shared download, when the download belonged to another content.
+    :param content:
+    :param result: async_download_content result
+    :return:
+    """
+    code, info, downloaded_content_pk = result
+    if str(downloaded_content_pk) == str(content.pk) or content.downloaded_successfully:
+        return content
+    try:
+        downloaded_content = Content.objects.get(pk=downloaded_content_pk)
+    except Content.DoesNotExist:
+        return content
+    if downloaded_content.downloaded_successfully:
+        content.download_path = downloaded_content.download_path
+        content.rendition_key = downloaded_content.rendition_key
+        content.downloaded_successfully = True
+    return content
+
+
+@shared_task(acks_late=True)
 def delete_expired_content_files():
-    expired_but_not_processed_contents = Content.objects.expired_contents().filter(expired=False)
-    objs = []
-    for content in expired_but_not_processed_contents:
-        file_path = content.download_path
-        if file_path and os.path.exists(file_path):
-            print(f'content file {file_path} expired, removing it...')
-            os.remove(file_path)
-        content.download_path = None
-        content.expired = True
-        objs.append(content)
-    Content.objects.bulk_update(objs, ['download_path', 'expired'])
+    expired_but_not_processed_contents = Content.objects.expired_contents().filter(expired=False).values_list(
+        'pk', 'download_path'
+    ).order_by('pk')
+    # Paginated by pk, only a batch of the expired contents is loaded at once.
+    contents = list(expired_but_not_processed_contents[:CLEANUP_BATCH_SIZE])
+    while contents:
+        # The files may be shared with other valid contents of the same rendition.
+        shared_file_paths = get_shared_file_paths({file_path for _, file_path in contents if file_path})
+        for _, file_path in contents:
+            if file_path and file_path not in shared_file_paths and os.path.exists(file_path):
+                print(f'content file {file_path} expired, removing it...')
+                os.remove(file_path)
+        Content.objects.filter(pk__in=[pk for pk, _ in contents]).update(download_path=None, expired=True)
+        if len(contents) < CLEANUP_BATCH_SIZE:
+            break
+        contents = list(expired_but_not_processed_contents.filter(pk__gt=contents[-1][0])[:CLEANUP_BATCH_SIZE])
     return 0
 
 
+@task_postrun.connect
+def notify_task_done(task_id=None, **kwargs):
+    # Waking up the views waiting for the task result (see coordination.wait_for_result).
+    publish_task_done(task_id)
+
+
+@task_postrun.connect
+def notify_attached_contents_done(sender=None, task_id=None, state=None, retval=None, **kwargs):
+    # The contents sharing a download (their download task id is the id of the owner task) and the playlists
+    # have no progress publisher of their own.
+    if sender not in (async_download_content, async_postprocess_content, async_aggregate_playlist):
+        return
+    successful = state == 'SUCCESS' and isinstance(retval, (list, tuple)) and not retval[0]
+    publish_contents_done(
+        Content.objects.filter(celery_download_task_id=task_id).values_list('pk', flat=True), successful=successful
+    )
+
+
+def get_shared_file_paths(file_paths):
+    """
+    Returns the set of the file paths that are used by valid contents (in one query).
+    :param file_paths:
+    :return:
+    """
+    if not file_paths:
+        return set()
+    return set(
+        Content.objects.valid_contents().filter(download_path__in=file_paths).values_list('download_path', flat=True)
+    )
+
+
 def update_kwargs_content_obj(kwargs, update_fields):
     for field in update_fields:
         if kwargs.get(field):
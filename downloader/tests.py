@@ -1,21 +1,71 @@
 from django.test import TestCase, override_settings
+from unittest import skipUnless
 from django.shortcuts import reverse
 from django.urls import resolve
 from django.http import FileResponse
+from django.utils import timezone
+from django.core.cache import caches
 from rest_framework import status
+from celery import current_app, states
 from celery.result import AsyncResult
-from datetime import timedelta
+from celery.utils import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
 import json
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import time
-from .main_downloader import MainDownloader, CustomYoutubeDL, DownloadProcessError
-from .downloaders import BaseDownloader, YoutubeDownloader
+import io
+import zipfile
+from yt_dlp.postprocessor import FFmpegPostProcessor
+from yt_dlp.postprocessor.common import PostProcessor
+from .main_downloader import (MainDownloader, CustomYoutubeDL, DownloadProcessError, normalize_detail, make_rendition_key,
+                              make_info_projection, make_master_key, select_content_format)
+from .downloaders import BaseDownloader, YoutubeDownloader, ThumbnailEditedYoutubeDL
 from .models import Content, AllowedExtractor
-from .tasks import async_extract_info, async_process_url, async_download_content
-from .views import DownloadContentView
+from . import tasks
+from .tasks import (test_task, async_extract_info, async_process_url, async_download_content, async_postprocess_content,
+                    delete_expired_content_files, update_content_with_download_result, schedule_info_refresh,
+                    async_download_playlist_entry, async_aggregate_playlist, dispatch_download_content)
+from .coordination import (claim_in_flight_download, get_redis_connection, wait_for_result, TaskResultWaitError,
+                           is_in_flight_download_owner)
+from .views import DownloadContentView, ContentProgressView
+from .progress import ProgressPublisher, get_done_event, FINISHED_EVENT, FAILED_EVENT
+from .delivery import parse_range_header
+from .extractors import allowed_extractor_registry, bump_generation, make_combinable_pattern
+from .info_store import InfoStore, get_info_store
+from .options import OptionProfile
+from .pool import YoutubeDLPool
+from .url_normalization import URL_KEY_MAX_LENGTH, make_info_url_key, normalize_url
+from .postprocessors import FFmpegSinglePassAudioPP, FFmpegRemuxingVideoConvertorPP
+from .streaming import (build_streaming_command, finish_stream, get_stream_source, is_streamable_content,
+                        iter_teed_output)
+from .direct_url import get_direct_url, get_url_expiration, is_direct_format, select_direct_format
+from .playlists import create_entry_contents, get_archive_members, make_playlist_response, split_into_lanes
 # Create your tests here.
 
 
+class TemporaryInfoStoreMixin:
+    """
+    Saves the infos of the test case to a temporary info store root which is removed after the test case.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.info_store_root = tempfile.mkdtemp()
+        cls.info_store_settings = override_settings(INFO_STORE_ROOT=cls.info_store_root, INFO_STORE_CACHE_ALIAS='')
+        cls.info_store_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.info_store_settings.disable()
+        shutil.rmtree(cls.info_store_root, ignore_errors=True)
+
+
 class ContentTests(TestCase):
 
     @classmethod
@@ -78,6 +128,82 @@ class AllowedExtractorTests(TestCase):
         self.assertEqual(AllowedExtractor.objects.active_extractors().count(), 1)
 
 
+class AllowedExtractorRegistryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.youtube_extractor = AllowedExtractor.objects.create(
+            name='youtube',
+            regex='^youtube',
+            active=True,
+        )
+        cls.instagram_extractor = AllowedExtractor.objects.create(
+            name='instagram',
+            regex='^instagram',
+            active=False,
+        )
+
+    def setUp(self):
+        # the rollbacks of the previous tests do not send the signals
+        allowed_extractor_registry.invalidate()
+
+    def test_regexes(self):
+        self.assertListEqual(allowed_extractor_registry.get_regexes(), [self.youtube_extractor.regex])
+        self.assertListEqual(
+            [extractor_class.IE_NAME for extractor_class in allowed_extractor_registry.get_extractor_classes()],
+            ['youtube']
+        )
+
+    def test_url_pre_filter(self):
+        self.assertTrue(allowed_extractor_registry.is_url_supported('https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv'))
+        self.assertTrue(allowed_extractor_registry.is_url_supported('https://www.youtube.com/watch?v=2PuFyjAs7JA'))
+        self.assertFalse(allowed_extractor_registry.is_url_supported('https://www.instagram.com/p/C8PqNXPtjyN/'))
+        self.assertFalse(allowed_extractor_registry.is_url_supported('https://example.com/unsupported-content'))
+
+    def test_canonical_key(self):
+        for url in (
+            'https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv',
+            'https://www.youtube.com/watch?v=2PuFyjAs7JA&t=10',
+            'https://m.youtube.com/watch?v=2PuFyjAs7JA',
+        ):
+            self.assertEqual(allowed_extractor_registry.get_canonical_key(url), 'Youtube:2PuFyjAs7JA')
+        # not allowed
+        self.assertIsNone(allowed_extractor_registry.get_canonical_key('https://www.instagram.com/p/C8PqNXPtjyN/'))
+        self.assertListEqual(
+            allowed_extractor_registry.get_url_keys('https://example.com/content/?utm_source=share'),
+            ['https://example.com/content']
+        )
+        self.assertListEqual(
+            allowed_extractor_registry.get_url_keys('https://youtu.be/2PuFyjAs7JA'),
+            ['Youtube:2PuFyjAs7JA', 'https://youtu.be/2PuFyjAs7JA']
+        )
+
+    def test_invalidation_on_changes(self):
+        allowed_extractor_registry.get_regexes()
+        self.instagram_extractor.active = True
+        self.instagram_extractor.save()
+        self.assertListEqual(
+            sorted(allowed_extractor_registry.get_regexes()), [self.instagram_extractor.regex, self.youtube_extractor.regex]
+        )
+        self.assertTrue(allowed_extractor_registry.is_url_supported('https://www.instagram.com/p/C8PqNXPtjyN/'))
+        self.youtube_extractor.delete()
+        self.assertListEqual(allowed_extractor_registry.get_regexes(), [self.instagram_extractor.regex])
+        self.assertFalse(allowed_extractor_registry.is_url_supported('https://youtu.be/2PuFyjAs7JA'))
+
+    def test_invalidation_by_other_processes(self):
+        allowed_extractor_registry.get_regexes()
+        # another process changed the extractors, only the generation counter is shared
+        AllowedExtractor.objects.filter(pk=self.instagram_extractor.pk).update(active=True)
+        bump_generation()
+        with override_settings(ALLOWED_EXTRACTORS_RECHECK_INTERVAL=0):
+            self.assertEqual(len(allowed_extractor_registry.get_regexes()), 2)
+
+    def test_combinable_patterns(self):
+        self.assertEqual(make_combinable_pattern(r'https?://(?P<host>\w+)\.com/(?P<id>\d+)'), r'https?://(?:\w+)\.com/(?:\d+)')
+        self.assertEqual(make_combinable_pattern('(?x)https?://a\\.com/ # comment'), '(?x:https?://a\\.com/ # comment\n)')
+        self.assertIsNone(make_combinable_pattern(r'(?P<q>["\'])(?P<url>.+)(?P=q)'))
+
+
 class MainDownloaderTests(TestCase):
 
     @classmethod
@@ -95,7 +221,7 @@ class MainDownloaderTests(TestCase):
         cls.content_url = 'https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv'
         with CustomYoutubeDL() as ytdl_obj:
             cls.info = ytdl_obj.extract_info(cls.content_url, download=False)
-            cls.info['info_file_path'] = f'info/info-{cls.info['id']}.json'
+            cls.info['info_file_path'] = get_info_store().get_path(cls.info['id'])
 
     def setUp(self):
         self.main_downloader_obj = MainDownloader(
@@ -105,12 +231,17 @@ class MainDownloaderTests(TestCase):
 
     def test_default_options(self):
         """
-            Tests MainDownloader default_options property that will be updated with given options argument.
+            Tests MainDownloader default_options property that is an immutable profile, the options of the process are
+            derived from it with the allowed extractors and the given options argument.
         """
-        self.assertDictEqual(self.main_downloader_obj.options, self.main_downloader_obj.default_options)
-        self.assertEqual(self.main_downloader_obj.default_options.get('format', None), 'bestaudio[ext=mp3]/bestaudio/best')
-        self.assertEqual(self.main_downloader_obj.default_options.get('outtmpl', None), 'temp/%(title)s.%(ext)s')
-        self.assertListEqual(self.main_downloader_obj.default_options.get('allowed_extractors', list()), [self.youtube_extractor.regex, ])
+        self.assertIsInstance(self.main_downloader_obj.default_options, OptionProfile)
+        self.assertNotIn('allowed_extractors', self.main_downloader_obj.default_options)
+        self.assertEqual(self.main_downloader_obj.options.get('format', None), 'bestvideo+bestaudio/best/best*')
+        self.assertTrue(self.main_downloader_obj.options.get('outtmpl', '').endswith('temp/%(title)s.%(ext)s'))
+        self.assertTupleEqual(self.main_downloader_obj.options.get('allowed_extractors', tuple()), (self.youtube_extractor.regex, ))
+        main_downloader_obj = MainDownloader(url=self.content_url, options={'format': 'bestaudio'})
+        self.assertEqual(main_downloader_obj.options['format'], 'bestaudio')
+        self.assertEqual(self.main_downloader_obj.default_options['format'], 'bestvideo+bestaudio/best/best*')
 
     def test_info_extraction_without_info_without_info_file(self):
         """
@@ -123,12 +254,11 @@ class MainDownloaderTests(TestCase):
             self.assertIsInstance(info, dict)
             self.assertEqual(info.get('original_url', None), self.content_url)
             self.assertEqual(info['id'], self.main_downloader_obj.info['id'])
-            self.assertEqual(self.main_downloader_obj.info_file_path, f'info/info-{info['id']}.json')
+            self.assertEqual(self.main_downloader_obj.info_file_path, get_info_store().get_path(info['id']))
             self.assertEqual(self.main_downloader_obj.info_file_path, info['info_file_path'])
             self.assertTrue(os.path.exists(self.main_downloader_obj.info_file_path))
             self.assertTrue(os.path.isfile(self.main_downloader_obj.info_file_path))
-            with open(self.main_downloader_obj.info_file_path, 'r') as info_file:
-                self.assertEqual(info['id'], json.load(info_file)['id'])
+            self.assertEqual(info['id'], get_info_store().load(self.main_downloader_obj.info_file_path)['id'])
 
     def test_info_extraction_with_info_without_info_file(self):
         """
@@ -138,11 +268,10 @@ class MainDownloaderTests(TestCase):
         self.main_downloader_obj.info = getattr(self, 'info', dict())
         with CustomYoutubeDL(self.main_downloader_obj.options) as ytdl_obj:
             self.main_downloader_obj.extract_info(ytdl_obj)
-            self.assertEqual(self.main_downloader_obj.info_file_path, f'info/info-{self.info['id']}.json')
+            self.assertEqual(self.main_downloader_obj.info_file_path, get_info_store().get_path(self.info['id']))
             self.assertTrue(os.path.exists(self.main_downloader_obj.info_file_path))
             self.assertTrue(os.path.isfile(self.main_downloader_obj.info_file_path))
-            with open(self.main_downloader_obj.info_file_path, 'r') as info_file:
-                self.assertEqual(self.info['id'], json.load(info_file)['id'])
+            self.assertEqual(self.info['id'], get_info_store().load(self.main_downloader_obj.info_file_path)['id'])
 
     def test_info_extraction_with_similar_content(self):
         """
@@ -151,18 +280,17 @@ class MainDownloaderTests(TestCase):
         """
         similar_content = Content.objects.create(
             info_id=self.info['id'],
-            info_file_path=f'info/info-{self.info["id"]}.json',
+            info_file_path=get_info_store().get_path(self.info['id']),
             url=self.content_url,
         )
         with CustomYoutubeDL(self.main_downloader_obj.options) as ytdl_obj:
-            with open(similar_content.info_file_path, 'w') as info_file:
-                json.dump(ytdl_obj.sanitize_info(self.info), info_file)
+            get_info_store().save(ytdl_obj.sanitize_info(self.info), path=similar_content.info_file_path)
             info = self.main_downloader_obj.extract_info(ytdl_obj)
             self.assertIsInstance(info, dict)
             self.assertEqual(info.get('original_url', None), self.content_url)
             self.assertEqual(self.info['id'], info['id'])
             self.assertEqual(self.info['id'], self.main_downloader_obj.info['id'])
-            self.assertEqual(self.main_downloader_obj.info_file_path, f'info/info-{self.info['id']}.json')
+            self.assertEqual(self.main_downloader_obj.info_file_path, get_info_store().get_path(self.info['id']))
 
     def test_custom_downloader_selection(self):
         """
@@ -247,7 +375,7 @@ class MainDownloaderTests(TestCase):
         """
 
         # download=True
-        code, info, content_obj, ytdl_obj = self.main_downloader_obj.run(download=True)
+        code, info, content_obj = self.main_downloader_obj.run(download=True)
         self.assertEqual(code, 0)
         self.assertEqual(info['original_url'], self.content_url)
         self.assertEqual(info['id'], self.info['id'])
@@ -255,13 +383,12 @@ class MainDownloaderTests(TestCase):
         self.assertEqual(content_obj.url, self.content_url)
         self.assertEqual(content_obj.info_id, info['id'])
         self.assertEqual(content_obj.info_file_path, info['info_file_path'])
-        self.assertTrue(os.path.exists(self.main_downloader_obj.get_download_path(ytdl_obj)))
+        self.assertTrue(os.path.exists(content_obj.download_path))
         self.assertTrue(os.path.isfile(content_obj.download_path))
-        self.assertIsInstance(ytdl_obj, CustomYoutubeDL)
         wait_until_file_is_being_processed_then_delete(content_obj.download_path, tries=5)
 
         # download=False
-        code, info, content_obj, ytdl_obj = self.main_downloader_obj.run(download=False)
+        code, info, content_obj = self.main_downloader_obj.run(download=False)
         self.assertEqual(code, 0)
         self.assertEqual(info['original_url'], self.content_url)
         self.assertEqual(info['id'], self.info['id'])
@@ -270,7 +397,6 @@ class MainDownloaderTests(TestCase):
         self.assertEqual(content_obj.info_id, info['id'])
         self.assertEqual(content_obj.info_file_path, info['info_file_path'])
         self.assertFalse(os.path.exists(content_obj.download_path))
-        self.assertIsInstance(ytdl_obj, CustomYoutubeDL)
 
     def test_download_process_error_raise(self):
         """
@@ -287,6 +413,560 @@ class MainDownloaderTests(TestCase):
         #     self.fail('Did not raised DownloadProcessError for a wrong url!')
 
 
+class InfoStoreTests(TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.info_store = InfoStore(root=self.root, compression='gzip', cache_alias='')
+        self.info = {'id': '2PuFyjAs7JA', 'title': 'test content', 'formats': [{'format_id': '18', 'ext': 'mp4'}]}
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def test_info_saving_and_loading(self):
+        info_file_path = self.info_store.save(self.info)
+        self.assertEqual(info_file_path, self.info_store.get_path(self.info['id']))
+        self.assertTrue(info_file_path.startswith(self.root))
+        self.assertTrue(info_file_path.endswith('info-2PuFyjAs7JA.json.gz'))
+        # hashed directory layout
+        self.assertEqual(len(os.path.relpath(info_file_path, self.root).split(os.sep)), 3)
+        with open(info_file_path, 'rb') as info_file:
+            self.assertEqual(info_file.read(2), b'\x1f\x8b')
+        self.assertDictEqual(self.info_store.load(info_file_path), self.info)
+        # no temporary file is left behind by the atomic writing
+        self.assertListEqual(os.listdir(os.path.dirname(info_file_path)), [os.path.basename(info_file_path)])
+
+    def test_legacy_info_file_loading(self):
+        legacy_info_file_path = os.path.join(self.root, 'info-2PuFyjAs7JA.json')
+        with open(legacy_info_file_path, 'w') as info_file:
+            json.dump(self.info, info_file)
+        self.assertDictEqual(self.info_store.load(legacy_info_file_path), self.info)
+        self.info['title'] = 'refreshed test content'
+        self.info_store.save(self.info, path=legacy_info_file_path)
+        with open(legacy_info_file_path) as info_file:
+            self.assertEqual(json.load(info_file)['title'], 'refreshed test content')
+
+    def test_info_cache_hot_tier(self):
+        info_store = InfoStore(root=self.root, cache_alias='default')
+        info_file_path = info_store.save(self.info)
+        os.remove(info_file_path)
+        self.assertDictEqual(info_store.load(info_file_path), self.info)
+        # the compressed data is cached
+        self.assertEqual(caches['default'].get(info_store.get_cache_key(info_file_path))[:2], b'\x1f\x8b')
+
+    def test_failed_info_saving(self):
+        # the rename fails, the path is a directory
+        info_file_path = os.path.join(self.root, 'info-2PuFyjAs7JA.json.gz')
+        os.mkdir(info_file_path)
+        with self.assertRaises(OSError):
+            self.info_store.save(self.info, path=info_file_path)
+        self.assertListEqual(os.listdir(self.root), ['info-2PuFyjAs7JA.json.gz'])
+
+    @override_settings(INFO_FRESHNESS_MARGIN=60)
+    def test_info_freshness(self):
+        expire = int(time.time()) + 3600
+        self.info['formats'] += [
+            {'format_id': '22', 'ext': 'mp4', 'url': f'https://example.com/22?expire={expire}'},
+            {'format_id': '37', 'ext': 'mp4', 'url': f'https://example.com/37?expire={expire + 60}'},
+        ]
+        info = self.info_store.load(self.info_store.save(self.info))
+        self.assertEqual(info['_fresh_until'], expire - 60)
+        self.assertTrue(self.info_store.is_fresh(info))
+        info['_fresh_until'] = time.time() - 1
+        self.assertFalse(self.info_store.is_fresh(info))
+        # the infos saved without the deadline
+        soon_expire = int(time.time()) + 30
+        self.info['formats'][1]['url'] = f'https://example.com/22?expire={soon_expire}'
+        self.assertFalse(self.info_store.is_fresh(self.info))
+        # the infos without expiring urls
+        self.assertTrue(self.info_store.is_fresh({'id': '2PuFyjAs7JA', 'formats': [{'url': 'https://example.com/18'}]}))
+        self.assertNotIn('_fresh_until', self.info_store.load(self.info_store.save({'id': '2PuFyjAs7JA'})))
+        # the playlists expire with their entries
+        playlist_info = {'_type': 'playlist', 'id': 'playlist', 'entries': [None, self.info]}
+        playlist_info = self.info_store.load(self.info_store.save(playlist_info))
+        self.assertEqual(playlist_info['_fresh_until'], soon_expire - 60)
+
+    def test_stale_info_refresh_before_download(self):
+        stale_info = {
+            'id': '2PuFyjAs7JA', 'title': 'test content', 'webpage_url': 'https://www.youtube.com/watch?v=2PuFyjAs7JA',
+            'extractor': 'youtube', 'extractor_key': 'Youtube',
+            'formats': [{'format_id': '18', 'ext': 'mp4', 'url': 'https://example.com/18?expire=1'}],
+        }
+        fresh_info = dict(stale_info, formats=[
+            {'format_id': '18', 'ext': 'mp4', 'url': f'https://example.com/18?expire={int(time.time()) + 3600}'}
+        ])
+
+        class RefreshingYoutubeDL(CustomYoutubeDL):
+            extracted_urls = []
+
+            def extract_info(self, url, *args, **kwargs):
+                self.extracted_urls.append(url)
+                return dict(fresh_info)
+
+        with override_settings(INFO_STORE_ROOT=self.root, INFO_STORE_CACHE_ALIAS=''):
+            info_file_path = get_info_store().save(stale_info)
+            with RefreshingYoutubeDL({'simulate': True, 'quiet': True}) as ytdl_obj:
+                self.assertEqual(ytdl_obj.download_with_info_file(info_file_path), 0)
+            self.assertListEqual(RefreshingYoutubeDL.extracted_urls, [stale_info['webpage_url']])
+            self.assertTrue(get_info_store().is_fresh(get_info_store().load(info_file_path)))
+
+
+class OptionProfileTests(TestCase):
+
+    def setUp(self):
+        self.profile = OptionProfile({
+            'format': 'bestvideo+bestaudio/best/best*',
+            'postprocessors': [{'key': 'FFmpegMetadata'}],
+        })
+        self.audio_detail = {'type': 'audio', 'extension': 'mp3', 'audio_bitrate': 320}
+
+    def test_immutability(self):
+        self.assertIsInstance(self.profile['postprocessors'], tuple)
+        self.assertIsInstance(self.profile['postprocessors'][0], OptionProfile)
+        with self.assertRaises(TypeError):
+            self.profile['format'] = 'bestaudio'
+        profile = self.profile.replace(format='bestaudio')
+        self.assertEqual(profile['format'], 'bestaudio')
+        self.assertEqual(self.profile['format'], 'bestvideo+bestaudio/best/best*')
+        options = self.profile.to_dict()
+        options['postprocessors'].append({'key': 'EmbedThumbnail'})
+        self.assertEqual(len(self.profile['postprocessors']), 1)
+
+    def test_hashing(self):
+        same_profile = OptionProfile({
+            'postprocessors': [{'key': 'FFmpegMetadata'}],
+            'format': 'bestvideo+bestaudio/best/best*',
+        })
+        self.assertEqual(same_profile, self.profile)
+        self.assertEqual(hash(same_profile), hash(self.profile))
+        self.assertNotEqual(self.profile.replace(format='bestaudio'), self.profile)
+        self.assertEqual(len({self.profile, same_profile}), 1)
+
+    def test_youtube_downloader_options(self):
+        youtube_downloader_obj = YoutubeDownloader(None, detail=self.audio_detail, default_options=self.profile)
+        option_profile = youtube_downloader_obj.get_option_profile()
+        self.assertEqual(option_profile['format'], 'bestaudio[ext=mp3]/bestaudio/best')
+        self.assertEqual(len(option_profile['postprocessors']), 1)
+        # the derived profile is cached and the profile is not changed by the repeated uses
+        for _ in range(3):
+            options = YoutubeDownloader(None, detail=dict(self.audio_detail), default_options=self.profile).get_options()
+            self.assertEqual(len(options['postprocessors']), 1)
+        self.assertIs(YoutubeDownloader(None, detail=self.audio_detail, default_options=self.profile).get_option_profile(),
+                      option_profile)
+        # the per request fields are not a part of the cache key
+        for url in ('https://youtu.be/2PuFyjAs7JA', 'https://youtu.be/dQw4w9WgXcQ'):
+            detail = dict(self.audio_detail, url=url)
+            self.assertIs(
+                YoutubeDownloader(None, detail=detail, default_options=self.profile).get_option_profile(), option_profile
+            )
+        self.assertEqual(len(self.profile['postprocessors']), 1)
+
+    def test_per_use_options(self):
+        progress_hook = lambda status: None
+        options = self.profile.replace(progress_hooks=[progress_hook])
+        youtube_downloader_obj = YoutubeDownloader(None, detail=self.audio_detail, default_options=options)
+        self.assertNotIn('progress_hooks', youtube_downloader_obj.get_option_profile())
+        self.assertListEqual(youtube_downloader_obj.get_options()['progress_hooks'], [progress_hook])
+
+
+class YoutubeDLPoolTests(TestCase):
+
+    def setUp(self):
+        self.pool = YoutubeDLPool(max_profiles=2, max_uses=3)
+        self.options = {
+            'format': 'bestaudio/best',
+            'allowed_extractors': ['^youtube'],
+            'outtmpl': 'temp/%(title)s.%(ext)s',
+            'postprocessors': [{'key': 'FFmpegMetadata'}],
+        }
+
+    def tearDown(self):
+        self.pool.clear()
+
+    def test_reusing_objects_of_the_same_profile(self):
+        progress_hook = lambda status: None
+        with self.pool.acquire(CustomYoutubeDL, self.options) as ytdl_obj:
+            ytdl_obj._download_retcode = 1
+        options = dict(self.options, outtmpl='temp/%(title)s-2.%(ext)s', progress_hooks=[progress_hook])
+        with self.pool.acquire(CustomYoutubeDL, options) as reused_ytdl_obj:
+            self.assertIs(reused_ytdl_obj, ytdl_obj)
+            self.assertEqual(reused_ytdl_obj._download_retcode, 0)
+            self.assertEqual(reused_ytdl_obj.params['outtmpl']['default'], 'temp/%(title)s-2.%(ext)s')
+            self.assertListEqual(reused_ytdl_obj._progress_hooks, [progress_hook])
+        with self.pool.acquire(CustomYoutubeDL, self.options) as reused_ytdl_obj:
+            self.assertListEqual(reused_ytdl_obj._progress_hooks, [])
+        # the options of the caller are not changed by YoutubeDL
+        self.assertEqual(self.options['outtmpl'], 'temp/%(title)s.%(ext)s')
+
+    def test_different_profiles(self):
+        with self.pool.acquire(CustomYoutubeDL, self.options) as ytdl_obj:
+            pass
+        with self.pool.acquire(CustomYoutubeDL, dict(self.options, format='bestvideo+bestaudio')) as other_ytdl_obj:
+            self.assertIsNot(other_ytdl_obj, ytdl_obj)
+        with self.pool.acquire(ThumbnailEditedYoutubeDL, self.options) as other_ytdl_obj:
+            self.assertIsNot(other_ytdl_obj, ytdl_obj)
+        # the least recently used profile is evicted
+        self.assertEqual(len(self.pool.get_idle_objects()), 2)
+        with self.pool.acquire(CustomYoutubeDL, self.options) as other_ytdl_obj:
+            self.assertIsNot(other_ytdl_obj, ytdl_obj)
+
+    def test_recycling_objects(self):
+        ytdl_objs = []
+        for _ in range(4):
+            with self.pool.acquire(CustomYoutubeDL, self.options) as ytdl_obj:
+                ytdl_objs.append(ytdl_obj)
+        self.assertIs(ytdl_objs[1], ytdl_objs[0])
+        self.assertIs(ytdl_objs[2], ytdl_objs[0])
+        self.assertIsNot(ytdl_objs[3], ytdl_objs[0])
+        with self.assertRaises(ValueError):
+            with self.pool.acquire(CustomYoutubeDL, self.options) as ytdl_obj:
+                raise ValueError
+        with self.pool.acquire(CustomYoutubeDL, self.options) as other_ytdl_obj:
+            self.assertIsNot(other_ytdl_obj, ytdl_obj)
+
+
+class RenditionCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.content_url = 'https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv'
+        cls.info = {
+            'id': '2PuFyjAs7JA',
+            'extractor': 'youtube',
+            'extractor_key': 'Youtube',
+            'title': 'test content',
+            'original_url': cls.content_url,
+        }
+        cls.detail = {'type': 'audio', 'audio_bitrate': 320, 'extension': 'mp3'}
+        cls.rendition_key = make_rendition_key('Youtube', cls.info['id'], cls.detail)
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as rendition_file:
+            self.rendition_file_path = rendition_file.name
+        self.cached_content = Content.objects.create(
+            info_id=self.info['id'],
+            info_file_path='info/info-2PuFyjAs7JA.json',
+            url=self.content_url,
+            download_path=self.rendition_file_path,
+            rendition_key=self.rendition_key,
+            downloaded_successfully=True,
+        )
+        self.main_downloader_obj = MainDownloader(
+            url=self.content_url,
+            detail={'type': 'audio', 'audio_bitrate': '320', 'extension': 'mp3', 'resolution': 720},
+            info=dict(self.info),
+            info_file_path='info/info-2PuFyjAs7JA.json',
+        )
+
+    def tearDown(self):
+        if os.path.exists(self.rendition_file_path):
+            os.remove(self.rendition_file_path)
+
+    def test_info_projection(self):
+        info = dict(self.info, formats=[{'format_id': '18'}], description='d' * 1000, info_file_path='info/test.json')
+        info_projection = make_info_projection(info)
+        self.assertNotIn('formats', info_projection)
+        self.assertEqual(info_projection['id'], self.info['id'])
+        self.assertEqual(info_projection['info_file_path'], 'info/test.json')
+        self.assertEqual(len(info_projection['description']), 500)
+        self.assertTrue(info_projection['description'].endswith('d...'))
+        self.assertEqual(make_info_projection(dict(info, description='d' * 500))['description'], 'd' * 500)
+
+    def test_detail_normalization(self):
+        self.assertDictEqual(
+            normalize_detail({'type': 'audio', 'audio_bitrate': '320', 'extension': 'MP3', 'resolution': 720}),
+            {'type': 'audio', 'extension': 'mp3', 'audio_bitrate': 320},
+        )
+        self.assertDictEqual(
+            normalize_detail({'type': 'video', 'extension': 'mp4', 'resolution': '1080', 'aspect_ratio': 'none'}),
+            {'type': 'video', 'extension': 'mp4', 'resolution': 1080, 'frame_rate': None, 'aspect_ratio': None},
+        )
+        self.assertEqual(self.rendition_key, make_rendition_key('youtube', self.info['id'], self.main_downloader_obj.detail))
+        self.assertNotEqual(self.rendition_key, make_rendition_key('youtube', self.info['id'], {'type': 'audio'}))
+
+    def test_clip_detail_normalization(self):
+        self.assertDictEqual(
+            normalize_detail({'type': 'audio', 'extension': 'mp3', 'start_time': '30', 'end_time': 90.5}),
+            {'type': 'audio', 'extension': 'mp3', 'audio_bitrate': None, 'start_time': 30.0, 'end_time': 90.5},
+        )
+        # a clip starting at 0 without an end is the whole content
+        self.assertEqual(self.rendition_key, make_rendition_key('youtube', self.info['id'], dict(self.detail, start_time=0)))
+        clip_rendition_key = make_rendition_key('youtube', self.info['id'], dict(self.detail, start_time=30, end_time=90))
+        self.assertNotEqual(self.rendition_key, clip_rendition_key)
+        self.assertEqual(
+            clip_rendition_key,
+            make_rendition_key('youtube', self.info['id'], dict(self.detail, start_time='30.0', end_time=90.0))
+        )
+
+    def test_clip_options(self):
+        detail = {'type': 'audio', 'extension': 'mp3', 'start_time': 30.0, 'end_time': 90.0}
+        youtube_downloader_obj = YoutubeDownloader(self.content_url, detail=detail, default_options=MainDownloader.default_options)
+        self.assertTupleEqual(youtube_downloader_obj.get_clip(), (30.0, 90.0))
+        download_ranges = youtube_downloader_obj.get_options()['download_ranges']
+        self.assertListEqual(list(download_ranges({'id': self.info['id']}, None)), [{'start_time': 30.0, 'end_time': 90.0}])
+        self.assertIs(youtube_downloader_obj.get_option_profile(), youtube_downloader_obj.get_option_profile())
+        open_clip_downloader_obj = YoutubeDownloader(self.content_url, detail={'type': 'audio', 'start_time': 30})
+        self.assertTupleEqual(open_clip_downloader_obj.get_clip(), (30.0, float('inf')))
+        self.assertIsNone(YoutubeDownloader(self.content_url, detail={'type': 'audio'}).get_clip())
+        self.assertNotIn('download_ranges', YoutubeDownloader(
+            self.content_url, detail={'type': 'audio'}, default_options=MainDownloader.default_options
+        ).get_options())
+
+    def test_cached_rendition_reusing(self):
+        """
+            Tests download method of MainDownloader in the situation that the same rendition is already downloaded.
+            It should reuse the cached file instead of downloading it again.
+        """
+        with CustomYoutubeDL(self.main_downloader_obj.options) as ytdl_obj:
+            code, ytdl_obj = self.main_downloader_obj.download(ytdl_obj)
+            self.assertEqual(code, 0)
+            self.assertTrue(self.main_downloader_obj.downloaded_successfully)
+            self.assertEqual(self.main_downloader_obj.get_download_path(ytdl_obj), self.rendition_file_path)
+            content_obj = self.main_downloader_obj.get_content_obj(ytdl_obj)
+        self.assertNotEqual(content_obj.pk, self.cached_content.pk)
+        self.assertEqual(content_obj.rendition_key, self.rendition_key)
+        self.assertEqual(content_obj.download_path, self.rendition_file_path)
+        self.assertEqual(content_obj.audio_bitrate, 320)
+
+    def test_missing_cached_rendition_file(self):
+        os.remove(self.rendition_file_path)
+        with CustomYoutubeDL(self.main_downloader_obj.options) as ytdl_obj:
+            self.assertIsNone(self.main_downloader_obj.get_cached_rendition(ytdl_obj))
+
+    def test_shared_rendition_file_deletion(self):
+        Content.objects.filter(pk=self.cached_content.pk).update(expiration_date=timezone.now())
+        shared_content = Content.objects.create(
+            info_id=self.info['id'],
+            info_file_path='info/info-2PuFyjAs7JA.json',
+            download_path=self.rendition_file_path,
+            rendition_key=self.rendition_key,
+            downloaded_successfully=True,
+        )
+        delete_expired_content_files()
+        self.assertTrue(os.path.exists(self.rendition_file_path))
+        self.cached_content.refresh_from_db()
+        self.assertTrue(self.cached_content.expired)
+        self.assertIsNone(self.cached_content.download_path)
+        Content.objects.filter(pk=shared_content.pk).update(expiration_date=timezone.now())
+        delete_expired_content_files()
+        self.assertFalse(os.path.exists(self.rendition_file_path))
+
+
+class QueryBudgetTests(TemporaryInfoStoreMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.content_url = 'https://www.youtube.com/watch?v=2PuFyjAs7JA&si=R6UuXVl-BPr-niXv'
+        cls.info = {
+            'id': '2PuFyjAs7JA',
+            'extractor': 'youtube',
+            'extractor_key': 'Youtube',
+            'title': 'test content',
+            'original_url': cls.content_url,
+        }
+        cls.detail = {'type': 'audio', 'audio_bitrate': 320, 'extension': 'mp3'}
+        cls.rendition_key = make_rendition_key('Youtube', cls.info['id'], cls.detail)
+        cls.info_file_path = get_info_store().save(dict(cls.info))
+        AllowedExtractor.objects.create(name='youtube', regex='^youtube', active=True)
+
+    def setUp(self):
+        # the rollbacks of the previous tests do not send the signals
+        allowed_extractor_registry.invalidate()
+        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as rendition_file:
+            self.rendition_file_path = rendition_file.name
+
+    def tearDown(self):
+        if os.path.exists(self.rendition_file_path):
+            os.remove(self.rendition_file_path)
+
+    def test_url_normalization(self):
+        self.assertEqual(
+            normalize_url('http://WWW.YouTube.com/watch?v=2PuFyjAs7JA&si=abc&utm_source=x#t=10'),
+            'https://youtube.com/watch?v=2PuFyjAs7JA'
+        )
+        self.assertEqual(
+            normalize_url('https://example.com:443/a/b/?y=2&x=1'), normalize_url('https://example.com/a/b?x=1&y=2')
+        )
+        self.assertIsNone(normalize_url(None))
+        # the long urls sharing their first URL_KEY_MAX_LENGTH characters have different keys
+        long_path = 'a' * URL_KEY_MAX_LENGTH
+        long_url_keys = {normalize_url(f'https://example.com/{long_path}?page={page}') for page in (1, 2)}
+        self.assertEqual(len(long_url_keys), 2)
+        self.assertTrue(all(len(url_key) <= URL_KEY_MAX_LENGTH for url_key in long_url_keys))
+
+    def test_content_save(self):
+        with self.assertNumQueries(1):
+            content = Content.objects.create(url=self.content_url, info_file_path=self.info_file_path)
+        self.assertEqual(content.url_key, 'https://youtube.com/watch?v=2PuFyjAs7JA')
+        self.assertEqual(content.expiration_date, content.processed_at + timedelta(hours=5))
+        with self.assertNumQueries(1):
+            content = Content.objects.create(url=self.content_url, url_key=make_info_url_key(self.info))
+        self.assertEqual(content.url_key, 'Youtube:2PuFyjAs7JA')
+
+    def test_getinfo_queries(self):
+        Content.objects.create(
+            url=self.content_url, url_key=make_info_url_key(self.info), info_file_path=self.info_file_path
+        )
+        main_downloader_obj = MainDownloader('https://m.youtube.com/watch?v=2PuFyjAs7JA&t=10')
+        with CustomYoutubeDL() as ytdl_obj, self.assertNumQueries(1):
+            info = main_downloader_obj.extract_info(ytdl_obj)
+        self.assertEqual(info['id'], self.info['id'])
+        self.assertEqual(main_downloader_obj.info_file_path, self.info_file_path)
+
+    def test_download_queries(self):
+        Content.objects.create(
+            url=self.content_url,
+            info_file_path=self.info_file_path,
+            download_path=self.rendition_file_path,
+            rendition_key=self.rendition_key,
+            downloaded_successfully=True,
+        )
+        main_downloader_obj = MainDownloader(
+            self.content_url, detail=self.detail, info=dict(self.info), info_file_path=self.info_file_path
+        )
+        with CustomYoutubeDL(main_downloader_obj.options) as ytdl_obj, self.assertNumQueries(2):
+            code, ytdl_obj = main_downloader_obj.download(ytdl_obj)
+            content = main_downloader_obj.get_content_obj(ytdl_obj)
+        self.assertEqual(code, 0)
+        self.assertEqual(content.download_path, self.rendition_file_path)
+
+    def test_cleanup_queries(self):
+        expired_contents = [
+            Content.objects.create(
+                url=self.content_url,
+                info_file_path=self.info_file_path,
+                download_path=self.rendition_file_path,
+                expiration_date=timezone.now(),
+            ) for _ in range(3)
+        ]
+        with self.assertNumQueries(3):
+            delete_expired_content_files()
+        self.assertFalse(os.path.exists(self.rendition_file_path))
+        expired_pks = [content.pk for content in expired_contents]
+        self.assertEqual(Content.objects.filter(pk__in=expired_pks, expired=True).count(), 3)
+
+    def test_cleanup_queries_of_batches(self):
+        self.addCleanup(setattr, tasks, 'CLEANUP_BATCH_SIZE', tasks.CLEANUP_BATCH_SIZE)
+        tasks.CLEANUP_BATCH_SIZE = 2
+        for _ in range(5):
+            Content.objects.create(
+                url=self.content_url,
+                info_file_path=self.info_file_path,
+                download_path=self.rendition_file_path,
+                expiration_date=timezone.now(),
+            )
+        # three queries per batch (the contents, the shared files and the update) for three batches
+        with self.assertNumQueries(9):
+            delete_expired_content_files()
+        self.assertFalse(Content.objects.filter(expired=False).exists())
+
+
+class InfoOnlyExtractionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.content_url = 'https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv'
+        cls.raw_info = {
+            'id': '2PuFyjAs7JA',
+            'title': 'test content',
+            'duration': 200,
+            'timestamp': 1700000000,
+            'thumbnails': [
+                {'url': 'https://i.ytimg.com/vi/2PuFyjAs7JA/default.jpg', 'preference': -10},
+                {'url': 'https://i.ytimg.com/vi/2PuFyjAs7JA/maxresdefault.jpg', 'preference': 0},
+            ],
+            'formats': [{'format_id': '18', 'ext': 'mp4', 'url': 'https://example.com/18'}],
+            'extractor': 'youtube',
+            'extractor_key': 'Youtube',
+            'webpage_url': 'https://www.youtube.com/watch?v=2PuFyjAs7JA',
+            'webpage_url_domain': 'youtube.com',
+            'original_url': cls.content_url,
+        }
+
+    def test_info_only_extraction(self):
+        raw_info = self.raw_info
+
+        class RawInfoYoutubeDL(CustomYoutubeDL):
+            def extract_info(self, url, download=True, ie_key=None, extra_info=None, process=True, *args, **kwargs):
+                self.processed = process
+                return dict(raw_info)
+
+        with RawInfoYoutubeDL() as ytdl_obj:
+            info = ytdl_obj.extract_info_only(self.content_url)
+            self.assertFalse(ytdl_obj.processed)
+        self.assertEqual(info['duration_string'], '3:20')
+        self.assertEqual(info['upload_date'], '20231114')
+        self.assertEqual(info['thumbnail'], 'https://i.ytimg.com/vi/2PuFyjAs7JA/maxresdefault.jpg')
+        # the formats are not processed
+        self.assertNotIn('format_id', info)
+        self.assertNotIn('http_headers', info['formats'][0])
+
+    def test_process_without_download_preparation(self):
+        main_downloader_obj = MainDownloader(
+            self.content_url, detail={'type': 'audio', 'extension': 'mp3'}, info=dict(self.raw_info),
+            info_file_path='info/info-2PuFyjAs7JA.json', info_only=True,
+        )
+        code, info, content = main_downloader_obj.run(download=False)
+        self.assertEqual(code, 0)
+        # the custom downloader (and its YoutubeDL object) is not prepared
+        self.assertFalse(main_downloader_obj.has_custom_downloader)
+        self.assertEqual(content.title, self.raw_info['title'])
+        self.assertEqual(
+            content.rendition_key, make_rendition_key('Youtube', '2PuFyjAs7JA', {'type': 'audio', 'extension': 'mp3'})
+        )
+        # the download sets the file name
+        self.assertIsNone(content.download_path)
+
+
+class InFlightDownloadTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.downloaded_content = Content.objects.create(
+            info_id='2PuFyjAs7JA',
+            info_file_path='info/info-2PuFyjAs7JA.json',
+            download_path='temp/test content.mp3',
+            rendition_key='test-rendition-key',
+            downloaded_successfully=True,
+        )
+        cls.attached_content = Content.objects.create(
+            info_id='2PuFyjAs7JA',
+            info_file_path='info/info-2PuFyjAs7JA.json',
+        )
+
+    @override_settings(REDIS_URL='')
+    def test_claim_without_redis(self):
+        self.assertIsNone(get_redis_connection())
+        self.assertEqual(claim_in_flight_download('test-rendition-key', 'task-1'), 'task-1')
+        self.assertEqual(claim_in_flight_download('test-rendition-key', 'task-2'), 'task-2')
+
+    def test_content_updating_with_shared_download_result(self):
+        content = update_content_with_download_result(self.attached_content, (0, {}, str(self.downloaded_content.pk)))
+        self.assertTrue(content.downloaded_successfully)
+        self.assertEqual(content.download_path, self.downloaded_content.download_path)
+        self.assertEqual(content.rendition_key, self.downloaded_content.rendition_key)
+
+    def test_content_updating_with_own_download_result(self):
+        content = update_content_with_download_result(self.attached_content, (0, {}, self.attached_content.pk))
+        self.assertFalse(content.downloaded_successfully)
+        self.assertIsNone(content.download_path)
+
+    @override_settings(
+        REDIS_URL='',
+        CELERY_TASK_ALWAYS_EAGER=True,
+        CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
+    )
+    def test_waiting_for_result_without_redis(self):
+        self.assertEqual(wait_for_result(test_task.delay('world')), 'hello world')
+
+    @override_settings(REDIS_URL='')
+    def test_bounded_waiting_for_lost_task(self):
+        # a task whose worker is lost never stores its result
+        with self.assertRaises(TaskResultWaitError):
+            wait_for_result(AsyncResult(uuid()), timeout=0.5)
+        self.assertTrue(is_in_flight_download_owner('test-rendition-key', 'task-1'))
+
+
 @override_settings(
     CELERY_TASK_ALWAYS_EAGER=True,
     CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
@@ -349,8 +1029,10 @@ class MainDownloaderAsyncTasksTests(TestCase):
         code, info, pre_created_content_pk = process_url_result.get()
         self.assertTrue(process_url_result.successful())
         # downloading content using the data obtained during url processing
+        # the tasks only exchange the info file path and a compact info projection
+        self.assertNotIn('formats', info)
         download_content_result = async_download_content.delay(
-            self.content_url, self.main_downloader_obj.detail, info=info,
+            self.content_url, self.main_downloader_obj.detail,
             info_file_path=info.get('info_file_path', None), pre_created_content_obj=pre_created_content_pk
         )
         code, info, content_pk = download_content_result.get()
@@ -370,6 +1052,719 @@ class MainDownloaderAsyncTasksTests(TestCase):
     CELERY_TASK_STORE_EAGER_RESULT=True,
     CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
 )
+class DeferredPostprocessingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.content_url = 'https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv'
+        cls.content = Content.objects.create(
+            url=cls.content_url,
+            info_id='2PuFyjAs7JA',
+            info_file_path='info/info-2PuFyjAs7JA.json',
+            rendition_key='b' * 64,
+            download_path='temp/test content.mp3',
+            downloaded_successfully=True,
+        )
+
+    def test_deferred_postprocessors(self):
+        options = {'defer_postprocessing': True, 'postprocessors': [{'key': 'FFmpegMetadata'}]}
+        with CustomYoutubeDL(options) as ytdl_obj:
+            info = ytdl_obj.post_process('temp/test content.webm', {'id': '2PuFyjAs7JA'}, {'temp/test content.jpg': 'temp/test content.jpg'})
+        self.assertEqual(info['filepath'], 'temp/test content.webm')
+        self.assertEqual(len(ytdl_obj.deferred_postprocessing_infos), 1)
+        deferred_info = ytdl_obj.deferred_postprocessing_infos[0]
+        self.assertEqual(deferred_info['filepath'], 'temp/test content.webm')
+        self.assertDictEqual(deferred_info['__files_to_move'], {'temp/test content.jpg': 'temp/test content.jpg'})
+        ytdl_obj.reset({})
+        self.assertListEqual(ytdl_obj.deferred_postprocessing_infos, [])
+
+    def test_download_postprocessors_are_not_deferred(self):
+        class MergerPP(PostProcessor):
+            def run(self, info):
+                return [], dict(info, merged=True)
+
+        with CustomYoutubeDL({'defer_postprocessing': True}) as ytdl_obj:
+            info = {'id': '2PuFyjAs7JA', '__postprocessors': [MergerPP(ytdl_obj)]}
+            info = ytdl_obj.post_process('temp/test content.mkv', info)
+        self.assertTrue(info['merged'])
+        deferred_info = ytdl_obj.deferred_postprocessing_infos[0]
+        self.assertTrue(deferred_info['merged'])
+        self.assertNotIn('__postprocessors', deferred_info)
+
+    def test_deferred_download_postprocessors_round_trip(self):
+        # the deferred infos are saved (sanitized) by the download stage and loaded by the postprocess stage
+        class MergerPP(PostProcessor):
+            def run(self, info):
+                return [], dict(info, merged=True)
+
+        class ProfilePP(PostProcessor):
+            def run(self, info):
+                return [], dict(info, postprocessed=True)
+
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        file_path = os.path.join(temp_dir, 'test content.mkv')
+        with open(file_path, 'wb') as file:
+            file.write(b'test content')
+        with CustomYoutubeDL({'defer_postprocessing': True, 'quiet': True}) as ytdl_obj:
+            ytdl_obj.post_process(file_path, {'id': '2PuFyjAs7JA', '__postprocessors': [MergerPP(ytdl_obj)]})
+            deferred_infos = [ytdl_obj.sanitize_info(info) for info in ytdl_obj.deferred_postprocessing_infos]
+        info_store = InfoStore(root=temp_dir, cache_alias='')
+        deferred_infos = info_store.load(info_store.save(deferred_infos, path=os.path.join(temp_dir, 'pp.json.gz')))
+        with CustomYoutubeDL({'quiet': True}) as ytdl_obj:
+            ytdl_obj.add_post_processor(ProfilePP(ytdl_obj), when='post_process')
+            for deferred_info in deferred_infos:
+                self.assertNotIn('__postprocessors', deferred_info)
+                files_to_move = deferred_info.pop('__files_to_move', None)
+                info = ytdl_obj.post_process(deferred_info['filepath'], deferred_info, files_to_move)
+        self.assertTrue(info['merged'])
+        self.assertTrue(info['postprocessed'])
+
+    @skipUnless(FFmpegPostProcessor().available, 'ffmpeg is not installed')
+    def test_merged_format_download_in_two_stages(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        ffmpeg = FFmpegPostProcessor().executable
+        video_path, audio_path = os.path.join(temp_dir, 'video.mp4'), os.path.join(temp_dir, 'audio.m4a')
+        subprocess.run([ffmpeg, '-v', 'error', '-f', 'lavfi', '-i', 'testsrc=duration=1:size=64x64:rate=10',
+                        '-c:v', 'mpeg4', video_path], check=True)
+        subprocess.run([ffmpeg, '-v', 'error', '-f', 'lavfi', '-i', 'sine=duration=1', '-c:a', 'aac', audio_path],
+                       check=True)
+        info = {
+            'id': 'merged-test-content', 'title': 'merged test content', 'extractor': 'generic',
+            'extractor_key': 'Generic', 'webpage_url': 'file://' + video_path,
+            'formats': [
+                {'format_id': 'video', 'url': 'file://' + video_path, 'ext': 'mp4', 'vcodec': 'mp4v.20.3',
+                 'acodec': 'none'},
+                {'format_id': 'audio', 'url': 'file://' + audio_path, 'ext': 'm4a', 'vcodec': 'none',
+                 'acodec': 'mp4a.40.2'},
+            ],
+        }
+        options = {
+            'format': 'video+audio', 'outtmpl': os.path.join(temp_dir, 'output', '%(title)s.%(ext)s'),
+            'enable_file_urls': True, 'quiet': True, 'postprocessors': [{'key': 'FFmpegMetadata'}],
+        }
+        # the download stage merges the formats (the merger can not be deferred)
+        with CustomYoutubeDL(dict(options, defer_postprocessing=True)) as ytdl_obj:
+            ytdl_obj.process_ie_result(info, download=True)
+            deferred_infos = [ytdl_obj.sanitize_info(info) for info in ytdl_obj.deferred_postprocessing_infos]
+        info_store = InfoStore(root=temp_dir, cache_alias='')
+        deferred_infos = info_store.load(info_store.save(deferred_infos, path=os.path.join(temp_dir, 'pp.json.gz')))
+        self.assertEqual(len(deferred_infos), 1)
+        # the postprocess stage runs the profile postprocessors on the merged file
+        with CustomYoutubeDL(options) as ytdl_obj:
+            files_to_move = deferred_infos[0].pop('__files_to_move', None)
+            info = ytdl_obj.post_process(deferred_infos[0]['filepath'], deferred_infos[0], files_to_move)
+        self.assertEqual(info['ext'], 'mp4')
+        self.assertTrue(os.path.isfile(info['filepath']))
+        self.assertFalse(os.path.exists(os.path.join(temp_dir, 'output', 'merged test content.fvideo.mp4')))
+
+    def test_main_downloader_deferred_options(self):
+        main_downloader_obj = MainDownloader(self.content_url, defer_postprocessing=True)
+        self.assertTrue(main_downloader_obj.options['defer_postprocessing'])
+        self.assertNotIn('defer_postprocessing', MainDownloader(self.content_url).options)
+
+    def test_postprocessing_info_path_of_contents(self):
+        other_content = Content.objects.create(url=self.content_url, info_id='2PuFyjAs7JA', rendition_key='b' * 64)
+        postprocessing_info_path = MainDownloader(
+            self.content_url, pre_created_content_obj=self.content
+        ).get_postprocessing_info_path(None)
+        # the downloads of the same rendition for other contents do not share the file
+        self.assertNotEqual(
+            postprocessing_info_path,
+            MainDownloader(self.content_url, pre_created_content_obj=other_content).get_postprocessing_info_path(None)
+        )
+        self.assertEqual(
+            postprocessing_info_path,
+            MainDownloader(self.content_url, content_obj=self.content).get_postprocessing_info_path(None)
+        )
+
+    @override_settings(REDIS_URL='')
+    def test_postprocessing_of_already_downloaded_content(self):
+        download_result = (0, {'id': '2PuFyjAs7JA'}, self.content.pk)
+        result = async_postprocess_content(download_result, self.content_url, detail={'type': 'audio'})
+        self.assertEqual(result, download_result)
+        failed_download_result = (1, {'id': '2PuFyjAs7JA'}, self.content.pk)
+        self.assertEqual(async_postprocess_content(failed_download_result, self.content_url), failed_download_result)
+
+
+class SinglePassAudioPostprocessorTests(TestCase):
+
+    def test_postprocessor_key(self):
+        options = {'postprocessors': [{'key': 'FFmpegSinglePassAudio', 'preferredcodec': 'mp3'}]}
+        with CustomYoutubeDL(options) as ytdl_obj:
+            postprocessor = ytdl_obj._pps['post_process'][0]
+        self.assertIsInstance(postprocessor, FFmpegSinglePassAudioPP)
+        self.assertEqual(postprocessor.mapping, 'mp3')
+
+    def test_audio_postprocessors_of_extensions(self):
+        def get_postprocessor_keys(extension):
+            youtube_downloader_obj = YoutubeDownloader(
+                'https://youtu.be/2PuFyjAs7JA', detail={'type': 'audio', 'extension': extension},
+                default_options=MainDownloader.default_options,
+            )
+            return [postprocessor['key'] for postprocessor in youtube_downloader_obj.get_options()['postprocessors']]
+
+        self.assertListEqual(get_postprocessor_keys('mp3'), ['FFmpegSinglePassAudio'])
+        # the containers without cover support keep the chain
+        self.assertListEqual(get_postprocessor_keys('wav'), ['FFmpegExtractAudio', 'EmbedThumbnail', 'FFmpegMetadata'])
+
+    def test_cover_thumbnail_without_thumbnails(self):
+        postprocessor = FFmpegSinglePassAudioPP(preferredcodec='mp3')
+        self.assertTupleEqual(postprocessor.get_cover_thumbnail({'thumbnails': []}), (None, None))
+        self.assertTupleEqual(
+            postprocessor.get_cover_thumbnail({'thumbnails': [{'filepath': 'temp/not existing cover.jpg'}]}),
+            (None, None)
+        )
+
+
+class RemuxFirstFormatSelectionTests(TestCase):
+
+    def setUp(self):
+        self.formats = [
+            {'format_id': 'vp9-1080', 'ext': 'webm', 'vcodec': 'vp9', 'acodec': 'none', 'height': 1080},
+            {'format_id': 'avc1-1080', 'ext': 'mp4', 'vcodec': 'avc1.640028', 'acodec': 'none', 'height': 1080},
+            {'format_id': 'vp9-2160', 'ext': 'webm', 'vcodec': 'vp9', 'acodec': 'none', 'height': 2160},
+            {'format_id': 'audio-opus', 'ext': 'webm', 'vcodec': 'none', 'acodec': 'opus', 'abr': 160},
+            {'format_id': 'audio-aac', 'ext': 'm4a', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128},
+        ]
+
+    def get_selected_format_id(self, detail):
+        options = YoutubeDownloader(None, detail=detail, default_options=MainDownloader.default_options).get_options()
+        options = {'format': options['format'], 'format_sort': options['format_sort'], 'quiet': True, 'simulate': True}
+        info = {
+            'id': '2PuFyjAs7JA', 'title': 'test content', 'extractor': 'test', 'extractor_key': 'Test',
+            'webpage_url': 'https://youtu.be/2PuFyjAs7JA',
+            'formats': [dict(fmt, url=f'https://example.com/{fmt["format_id"]}') for fmt in self.formats],
+        }
+        with CustomYoutubeDL(options) as ytdl_obj:
+            return ytdl_obj.process_ie_result(info, download=False)['format_id']
+
+    def test_remuxable_sources_are_preferred(self):
+        self.assertEqual(self.get_selected_format_id({'type': 'video', 'extension': 'mov', 'resolution': 1080}),
+                         'avc1-1080+audio-aac')
+        self.assertEqual(self.get_selected_format_id({'type': 'audio', 'extension': 'aac', 'audio_bitrate': 320}),
+                         'audio-aac')
+        # the codec preference never outranks the resolution
+        self.assertEqual(self.get_selected_format_id({'type': 'video', 'extension': 'mov'}), 'vp9-2160+audio-aac')
+        self.assertEqual(self.get_selected_format_id({'type': 'video', 'extension': 'mkv'}), 'vp9-2160+audio-opus')
+
+    def test_remuxing_options(self):
+        postprocessor = FFmpegRemuxingVideoConvertorPP(preferedformat='mov')
+        info = {'requested_formats': [{'vcodec': 'avc1.640028', 'acodec': 'none'}, {'vcodec': 'none', 'acodec': 'opus'}]}
+        options = postprocessor.get_remuxing_options('mov', info)
+        self.assertIn('-c:v', options)
+        self.assertEqual(options[options.index('-c:v') + 1], 'copy')
+        self.assertNotIn('-c:a', options)
+        self.assertIn('-c:a', postprocessor.get_remuxing_options('mkv', info))
+        self.assertNotIn('-c:v', postprocessor.get_remuxing_options('webm', info))
+        # the codecs of a single format info
+        self.assertIn('-c:a', postprocessor.get_remuxing_options('mp4', {'vcodec': 'vp9', 'acodec': 'mp4a.40.2'}))
+
+
+class MasterCopyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.content_url = 'https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv'
+        cls.info = {
+            'id': '2PuFyjAs7JA',
+            'extractor': 'youtube',
+            'extractor_key': 'Youtube',
+            'title': 'test content',
+            'original_url': cls.content_url,
+        }
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        settings_override = override_settings(
+            MASTER_COPY_DIR=os.path.join(self.root, 'master'),
+            INFO_STORE_ROOT=os.path.join(self.root, 'info'),
+            INFO_STORE_CACHE_ALIAS='',
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.master_file_path = os.path.join(self.root, 'master.webm')
+        with open(self.master_file_path, 'wb') as master_file:
+            master_file.write(b'master')
+
+    def tearDown(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def get_youtube_downloader_obj(self, detail, default_options=None):
+        return YoutubeDownloader(self.content_url, detail=detail, info=dict(self.info),
+                                 default_options=default_options or MainDownloader.default_options)
+
+    def test_master_key(self):
+        master_details = [
+            self.get_youtube_downloader_obj(detail).get_master_detail() for detail in (
+                {'type': 'audio', 'extension': 'mp3', 'audio_bitrate': 128},
+                {'type': 'audio', 'extension': 'mp3', 'audio_bitrate': 320},
+                {'type': 'audio', 'extension': 'wav'},
+            )
+        ]
+        master_keys = {make_master_key('Youtube', self.info['id'], master_detail) for master_detail in master_details}
+        self.assertEqual(len(master_keys), 1)
+        self.assertNotEqual(master_keys.pop(), make_rendition_key('Youtube', self.info['id'], master_details[0]))
+        video_master_detail = self.get_youtube_downloader_obj(
+            {'type': 'video', 'extension': 'mkv', 'resolution': 720}
+        ).get_master_detail()
+        self.assertEqual(video_master_detail['resolution'], 720)
+        self.assertEqual(video_master_detail['extension'], 'mp4')
+
+    def test_master_options(self):
+        options = self.get_youtube_downloader_obj({'type': 'audio', 'extension': 'mp3'}).get_master_options('master/%(id)s.%(ext)s')
+        self.assertEqual(options['format'], 'bestaudio/bestaudio/best')
+        self.assertListEqual(options['postprocessors'], [])
+        self.assertTrue(options['defer_postprocessing'])
+        self.assertEqual(options['outtmpl'], 'master/%(id)s.%(ext)s')
+
+    def test_cached_video_master_of_audio(self):
+        master_content = Content.objects.create(
+            info_id=self.info['id'],
+            info_file_path='info/info-2PuFyjAs7JA.json',
+            type='master-video',
+            extension='webm',
+            download_path=self.master_file_path,
+            rendition_key='c' * 64,
+            downloaded_successfully=True,
+        )
+        main_downloader_obj = MainDownloader(
+            self.content_url, detail={'type': 'audio', 'extension': 'mp3'}, info=dict(self.info),
+            info_file_path='info/info-2PuFyjAs7JA.json', master_copy=True,
+        )
+        custom_downloader = YoutubeDownloader(self.content_url, detail={'type': 'audio', 'extension': 'mp3'})
+        with CustomYoutubeDL() as ytdl_obj:
+            # the master info is missing
+            self.assertTupleEqual(main_downloader_obj.get_cached_master(ytdl_obj, custom_downloader), (None, None))
+            get_info_store().save(dict(self.info, ext='webm'), path=MainDownloader.get_master_info_path(master_content))
+            cached_master_content, master_info = main_downloader_obj.get_cached_master(ytdl_obj, custom_downloader)
+        self.assertEqual(cached_master_content, master_content)
+        self.assertEqual(master_info['ext'], 'webm')
+
+    def test_rendition_derivation(self):
+        youtube_downloader_obj = self.get_youtube_downloader_obj({}, default_options=OptionProfile(format='best'))
+        code, info, prepared_file_path = youtube_downloader_obj.derive(
+            self.master_file_path, dict(self.info, ext='webm')
+        )
+        self.assertEqual(code, 0)
+        # the data of the released YoutubeDL object is kept instead of the object
+        self.assertEqual(os.path.dirname(prepared_file_path), os.path.dirname(info['filepath']))
+        self.assertListEqual(youtube_downloader_obj.deferred_postprocessing_infos, [])
+        self.assertNotEqual(info['filepath'], self.master_file_path)
+        with open(info['filepath'], 'rb') as derived_file:
+            self.assertEqual(derived_file.read(), b'master')
+        self.assertTrue(os.path.samefile(info['filepath'], self.master_file_path))
+        os.remove(info['filepath'])
+        self.assertTrue(os.path.isfile(self.master_file_path))
+
+
+class StreamingTranscodeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.content = Content.objects.create(
+            url='https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv',
+            info_file_path='info/info-2PuFyjAs7JA.json',
+            type='audio',
+            extension='mp3',
+            audio_bitrate=128,
+            start_time=5.0,
+            end_time=15.0,
+        )
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.download_path = os.path.join(self.temp_dir, 'content.mp3')
+        self.part_path = self.download_path + '.part'
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def get_process(self, code):
+        script = f'import sys; sys.stdout.buffer.write(b"a" * 100000); sys.exit({code})'
+        return subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE)
+
+    def test_streaming_command(self):
+        selected_info = {
+            'url': 'https://example.com/audio.webm',
+            'http_headers': {'User-Agent': 'test'},
+            'title': 'test content',
+        }
+        command = build_streaming_command(selected_info, self.content)
+        self.assertListEqual(command[command.index('-ss'):command.index('-ss') + 4], ['-ss', '5.0', '-to', '15.0'])
+        self.assertEqual(command[command.index('-headers') + 1], 'User-Agent: test\r\n')
+        self.assertEqual(command[command.index('-i') + 1], selected_info['url'])
+        self.assertEqual(command[command.index('-c:a') + 1], 'libmp3lame')
+        self.assertEqual(command[command.index('-b:a') + 1], '128k')
+        self.assertIn('title=test content', command)
+        self.assertListEqual(command[-3:], ['-f', 'mp3', 'pipe:1'])
+
+    def test_teed_output(self):
+        completed = []
+        chunks = list(iter_teed_output(
+            self.get_process(0), self.part_path, self.download_path, on_complete=lambda: completed.append(True)
+        ))
+        self.assertEqual(b''.join(chunks), b'a' * 100000)
+        self.assertListEqual(completed, [True])
+        self.assertFalse(os.path.exists(self.part_path))
+        with open(self.download_path, 'rb') as downloaded_file:
+            self.assertEqual(downloaded_file.read(), b'a' * 100000)
+
+    def test_failed_teed_output(self):
+        completed = []
+        list(iter_teed_output(
+            self.get_process(1), self.part_path, self.download_path, on_complete=lambda: completed.append(True)
+        ))
+        self.assertListEqual(completed, [])
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertFalse(os.path.exists(self.download_path))
+
+    def test_interrupted_teed_output(self):
+        process = self.get_process(0)
+        output = iter_teed_output(process, self.part_path, self.download_path)
+        next(output)
+        # the client is disconnected
+        output.close()
+        self.assertIsNotNone(process.poll())
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertFalse(os.path.exists(self.download_path))
+
+    @override_settings(STREAMING_TRANSCODE=True)
+    def test_streamable_content(self):
+        video_content = Content(url=self.content.url, type='video', extension='mp4')
+        self.assertFalse(is_streamable_content(video_content))
+        with override_settings(STREAMING_TRANSCODE=False):
+            self.assertFalse(is_streamable_content(self.content))
+        downloaded_content = Content(url=self.content.url, type='audio', extension='mp3', downloaded_successfully=True)
+        self.assertFalse(is_streamable_content(downloaded_content))
+        dispatched_content = Content(url=self.content.url, type='audio', extension='mp3', celery_download_task_id='1')
+        self.assertFalse(is_streamable_content(dispatched_content))
+
+    def test_clip_stream_source(self):
+        info = {
+            'id': '2PuFyjAs7JA',
+            'extractor': 'youtube',
+            'extractor_key': 'Youtube',
+            'title': 'test content',
+            'webpage_url': self.content.url,
+            'formats': [
+                {'format_id': 'audio', 'url': 'https://example.com/audio.webm?expire=4102444800', 'ext': 'webm',
+                 'protocol': 'https', 'vcodec': 'none', 'acodec': 'opus', 'abr': 128},
+            ],
+        }
+        with override_settings(INFO_STORE_ROOT=os.path.join(self.temp_dir, 'info'), INFO_STORE_CACHE_ALIAS=''):
+            self.content.info_file_path = get_info_store().save(info)
+            # the clip (download_ranges) is cut by ffmpeg, not by the format selection
+            selected_info, download_path = get_stream_source(self.content)
+        self.assertEqual(selected_info['format_id'], 'audio')
+        self.assertTrue(download_path.endswith('.mp3'))
+
+    def test_stream_result(self):
+        stream_id = uuid()
+        Content.objects.filter(pk=self.content.pk).update(celery_download_task_id=stream_id)
+        finish_stream(self.content, stream_id, {'title': 'test content'}, completed=False)
+        # the next request dispatches the download
+        self.content.refresh_from_db()
+        self.assertIsNone(self.content.celery_download_task_id)
+        code, info, content_pk = AsyncResult(stream_id).get()
+        self.assertEqual(code, 1)
+        self.assertEqual(info['title'], 'test content')
+        self.assertEqual(content_pk, self.content.pk)
+        completed_stream_id = uuid()
+        Content.objects.filter(pk=self.content.pk).update(celery_download_task_id=completed_stream_id)
+        finish_stream(self.content, completed_stream_id, {'title': 'test content'}, completed=True)
+        self.content.refresh_from_db()
+        self.assertEqual(self.content.celery_download_task_id, completed_stream_id)
+        self.assertEqual(AsyncResult(completed_stream_id).get()[0], 0)
+
+
+@override_settings(DIRECT_URL_DELIVERY=True)
+class DirectURLTests(TemporaryInfoStoreMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.content_url = 'https://youtu.be/2PuFyjAs7JA?si=R6UuXVl-BPr-niXv'
+        cls.info = {
+            'id': '2PuFyjAs7JA',
+            'extractor': 'youtube',
+            'extractor_key': 'Youtube',
+            'title': 'test content',
+            'original_url': cls.content_url,
+            'webpage_url': cls.content_url,
+            'formats': [
+                {'format_id': 'video-360', 'url': 'https://example.com/video-360.mp4', 'ext': 'mp4',
+                 'protocol': 'https', 'height': 360, 'vcodec': 'avc1.4d401e', 'acodec': 'none'},
+                {'format_id': 'audio', 'url': 'https://example.com/audio.m4a', 'ext': 'm4a',
+                 'protocol': 'https', 'vcodec': 'none', 'acodec': 'mp4a.40.2', 'abr': 128},
+                {'format_id': 'progressive-360', 'url': 'https://example.com/progressive-360.mp4?expire=4102444800',
+                 'ext': 'mp4', 'protocol': 'https', 'height': 360, 'vcodec': 'avc1.42001E', 'acodec': 'mp4a.40.2'},
+            ],
+        }
+        cls.info_file_path = get_info_store().save(
+            dict(cls.info), path=os.path.join(cls.info_store_root, 'info-direct-2PuFyjAs7JA.json')
+        )
+        cls.content = Content.objects.create(
+            url=cls.content_url,
+            info_id=cls.info['id'],
+            info_file_path=cls.info_file_path,
+            type='video',
+            extension='mp4',
+            resolution=360,
+        )
+
+    def test_url_expiration(self):
+        expiration_date = get_url_expiration('https://example.com/video.mp4?id=1&expire=4102444800')
+        self.assertEqual(expiration_date, datetime(2100, 1, 1, tzinfo=dt_timezone.utc))
+        self.assertIsNone(get_url_expiration('https://example.com/video.mp4?id=1'))
+
+    def test_direct_format(self):
+        selected_info = {'url': 'https://example.com/video.mp4', 'ext': 'mp4', 'protocol': 'https'}
+        self.assertTrue(is_direct_format(selected_info, self.content))
+        self.assertFalse(is_direct_format(dict(selected_info, protocol='m3u8_native'), self.content))
+        self.assertFalse(is_direct_format(dict(selected_info, ext='webm'), self.content))
+        self.assertFalse(is_direct_format(dict(selected_info, requested_formats=[{}, {}]), self.content))
+
+    def test_direct_format_selection(self):
+        # the merged selection is replaced by the progressive format of the same height
+        selected_info = select_direct_format(self.content)
+        self.assertEqual(selected_info['format_id'], 'progressive-360')
+        higher_content = Content(
+            url=self.content_url, info_file_path=self.info_file_path, type='video', extension='mp4', resolution=1080
+        )
+        self.info['formats'].append(
+            {'format_id': 'video-1080', 'url': 'https://example.com/video-1080.mp4', 'ext': 'mp4',
+             'protocol': 'https', 'height': 1080, 'vcodec': 'avc1.640028', 'acodec': 'none'}
+        )
+        higher_content.info_file_path = get_info_store().save(
+            dict(self.info), path=os.path.join(self.info_store_root, 'info-direct-1080-2PuFyjAs7JA.json')
+        )
+        self.assertIsNone(select_direct_format(higher_content))
+        audio_content = Content(url=self.content_url, info_file_path=self.info_file_path, type='audio', extension='mp3')
+        self.assertIsNone(select_direct_format(audio_content))
+
+    def test_direct_url(self):
+        direct_url = get_direct_url(self.content)
+        self.assertEqual(direct_url, self.info['formats'][2]['url'])
+        self.content.refresh_from_db()
+        self.assertEqual(self.content.download_url, direct_url)
+        self.assertEqual(self.content.download_url_expiration_date, datetime(2100, 1, 1, tzinfo=dt_timezone.utc))
+        with override_settings(DIRECT_URL_DELIVERY=False):
+            self.assertIsNone(get_direct_url(self.content))
+        clip_content = Content(url=self.content_url, info_file_path=self.info_file_path, type='video',
+                               extension='mp4', start_time=10)
+        self.assertIsNone(get_direct_url(clip_content))
+
+    def test_stale_info(self):
+        stale_info = dict(self.info, formats=[dict(fmt, url=fmt['url'] + '?expire=1') for fmt in self.info['formats']])
+        stale_content = Content(
+            url=self.content_url, type='video', extension='mp4', resolution=360,
+            info_file_path=get_info_store().save(
+                stale_info, path=os.path.join(self.info_store_root, 'info-direct-stale-2PuFyjAs7JA.json')
+            ),
+        )
+        self.assertTupleEqual(select_content_format(stale_content), (None, None))
+        self.assertIsNone(get_direct_url(stale_content))
+        self.assertIsNone(schedule_info_refresh(dict(self.info, info_file_path=self.info_file_path)))
+        with override_settings(INFO_BACKGROUND_REFRESH=False):
+            self.assertIsNone(schedule_info_refresh(dict(stale_info, info_file_path=stale_content.info_file_path)))
+
+    def test_expired_direct_url(self):
+        expired_content = Content.objects.create(
+            url=self.content_url,
+            info_file_path='info/info-missing.json',
+            type='video',
+            extension='mp4',
+            download_url='https://example.com/expired.mp4',
+            download_url_expiration_date=timezone.now() + timedelta(seconds=10),
+        )
+        # the url expires within the margin and there is no info to select the format again
+        self.assertIsNone(get_direct_url(expired_content))
+        expired_content.download_url_expiration_date = timezone.now() + timedelta(hours=1)
+        self.assertEqual(get_direct_url(expired_content), 'https://example.com/expired.mp4')
+
+
+class PlaylistTests(TemporaryInfoStoreMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.playlist_url = 'https://www.instagram.com/p/DAbCdEfGhIj/'
+        cls.playlist_info = {
+            '_type': 'playlist',
+            'id': 'DAbCdEfGhIj',
+            'extractor': 'Instagram',
+            'extractor_key': 'Instagram',
+            'title': 'test carousel',
+            'webpage_url': cls.playlist_url,
+            'entries': [
+                # a carousel item (processed entry)
+                {'id': '3400000000000000001', 'extractor_key': 'Instagram', 'title': 'test carousel item',
+                 'webpage_url': cls.playlist_url, 'url': 'https://example.com/item-1.mp4', 'ext': 'mp4'},
+                # a flat extracted playlist entry
+                {'_type': 'url', 'ie_key': 'Youtube', 'id': '2PuFyjAs7JA', 'title': 'test url entry',
+                 'url': 'https://www.youtube.com/watch?v=2PuFyjAs7JA'},
+                None,
+            ],
+        }
+        cls.playlist = Content.objects.create(
+            url=cls.playlist_url,
+            info_id=cls.playlist_info['id'],
+            info_file_path=get_info_store().save(dict(cls.playlist_info)),
+            title='test: carousel',
+            type='video',
+            extension='mp4',
+            is_playlist=True,
+        )
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+
+    def create_downloaded_entry(self, playlist_index, file_name, data):
+        download_path = os.path.join(self.temp_dir, file_name)
+        with open(download_path, 'wb') as file:
+            file.write(data)
+        return Content.objects.create(
+            parent=self.playlist, playlist_index=playlist_index, url=self.playlist_url, info_id=str(playlist_index),
+            download_path=download_path, downloaded_successfully=True,
+        )
+
+    def test_entry_contents_creation(self):
+        with self.assertNumQueries(1):
+            entries = create_entry_contents(self.playlist, self.playlist_info, {'type': 'video', 'extension': 'mp4'})
+        self.assertEqual(len(entries), 2)
+        item, url_entry = sorted(self.playlist.entries.all(), key=lambda entry: entry.playlist_index)
+        self.assertEqual(item.playlist_index, 1)
+        self.assertEqual(item.url_key, 'Instagram:3400000000000000001')
+        self.assertEqual(get_info_store().load(item.info_file_path)['url'], 'https://example.com/item-1.mp4')
+        self.assertEqual(url_entry.url, 'https://www.youtube.com/watch?v=2PuFyjAs7JA')
+        self.assertEqual(url_entry.url_key, 'Youtube:2PuFyjAs7JA')
+        self.assertEqual(url_entry.info_file_path, '')
+        self.assertEqual(
+            url_entry.rendition_key, make_rendition_key('Youtube', '2PuFyjAs7JA', {'type': 'video', 'extension': 'mp4'})
+        )
+        for entry in (item, url_entry):
+            self.assertEqual((entry.type, entry.extension), ('video', 'mp4'))
+            self.assertIsNotNone(entry.expiration_date)
+            self.assertFalse(entry.is_playlist)
+
+    def test_lanes(self):
+        self.assertListEqual(split_into_lanes([1, 2, 3, 4, 5], 2), [[1, 3, 5], [2, 4]])
+        self.assertListEqual(split_into_lanes([1, 2], 4), [[1], [2]])
+        self.assertListEqual(split_into_lanes([1, 2], 0), [[1, 2]])
+
+    def test_streamed_zip_response(self):
+        self.create_downloaded_entry(2, 'same title.mp4', b'second entry')
+        self.create_downloaded_entry(1, 'same title.mp4.first', b'first entry' * 10000)
+        missing_entry = self.create_downloaded_entry(3, 'missing.mp4', b'')
+        os.remove(missing_entry.download_path)
+        Content.objects.create(parent=self.playlist, playlist_index=4, url=self.playlist_url, info_id='4')
+        self.assertListEqual(
+            [arcname for arcname, _ in get_archive_members(self.playlist)],
+            ['001 - same title.mp4.first', '002 - same title.mp4'],
+        )
+        response = make_playlist_response(self.playlist)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('test_ carousel.zip', response['Content-Disposition'])
+        with zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content))) as zip_file:
+            self.assertIsNone(zip_file.testzip())
+            self.assertEqual(zip_file.read('001 - same title.mp4.first'), b'first entry' * 10000)
+            self.assertEqual(zip_file.read('002 - same title.mp4'), b'second entry')
+
+    def test_empty_playlist_response(self):
+        self.assertIsNone(make_playlist_response(self.playlist))
+
+    def test_playlist_aggregation(self):
+        Content.objects.create(parent=self.playlist, playlist_index=1, url=self.playlist_url, info_id='1')
+        code, info, parent_pk = async_aggregate_playlist(self.playlist.pk)
+        self.assertEqual(code, 1)
+        self.assertEqual(info['title'], 'test carousel')
+        self.create_downloaded_entry(2, 'entry.mp4', b'entry')
+        self.assertEqual(async_aggregate_playlist(self.playlist.pk)[0], 0)
+        self.playlist.refresh_from_db()
+        self.assertTrue(self.playlist.downloaded_successfully)
+
+    @override_settings(
+        CELERY_TASK_ALWAYS_EAGER=True,
+        CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
+    )
+    def test_failed_entries_do_not_stop_the_playlist(self):
+        playlist = Content.objects.create(
+            url='https://example.com/playlist', info_id='playlist', info_file_path='info/info-missing.json',
+            is_playlist=True,
+        )
+        create_entry_contents(playlist, {'entries': [
+            {'_type': 'url', 'id': f'entry-{index}', 'url': f'https://unsupported.invalid/{index}'}
+            for index in range(3)
+        ]})
+        with override_settings(PLAYLIST_PARALLEL_DOWNLOADS=2):
+            result = dispatch_download_content(playlist.url, playlist=True, pre_created_content_obj=playlist.pk)
+        self.assertTupleEqual(tuple(wait_for_result(result)), (1, None, playlist.pk))
+        self.assertEqual(playlist.entries.count(), 3)
+        self.assertFalse(playlist.entries.filter(downloaded_successfully=True).exists())
+
+    def test_failed_entry(self):
+        entry = Content.objects.create(
+            parent=self.playlist, playlist_index=1, url='https://example.invalid/entry', downloaded_successfully=True
+        )
+        # a download failure of an entry is a failed entry (the lane and the playlist callback go on)
+        with self.assertLogs('downloader.tasks', level='ERROR'):
+            result = async_download_playlist_entry.apply(
+                args=(entry.url, ), kwargs={'pre_created_content_obj': entry.pk}
+            )
+        self.assertTupleEqual(tuple(result.get()), (1, None, entry.pk))
+        entry.refresh_from_db()
+        self.assertFalse(entry.downloaded_successfully)
+
+    def test_unexpected_entry_failure(self):
+        entry = Content.objects.create(parent=self.playlist, playlist_index=1, url='https://example.com/entry')
+        # the other exceptions are not download failures of the entry
+        result = async_download_playlist_entry.apply(
+            args=(entry.url, ), kwargs={'pre_created_content_obj': entry.pk, 'unknown_option': True}
+        )
+        with self.assertRaises(TypeError):
+            result.get()
+
+    def test_url_entry_info_reuse(self):
+        AllowedExtractor.objects.create(name='youtube', regex='^youtube', active=True)
+        allowed_extractor_registry.invalidate()
+        self.addCleanup(allowed_extractor_registry.invalidate)
+        url = 'https://www.youtube.com/watch?v=2PuFyjAs7JA'
+        info = {'id': '2PuFyjAs7JA', 'extractor_key': 'Youtube', 'title': 'test content', 'webpage_url': url}
+        Content.objects.create(url=url, url_key='Youtube:2PuFyjAs7JA', info_file_path=get_info_store().save(info))
+        # the newer url entry of the same video has no info yet
+        create_entry_contents(self.playlist, self.playlist_info)
+        main_downloader_obj = MainDownloader(url)
+        with CustomYoutubeDL() as ytdl_obj:
+            self.assertEqual(main_downloader_obj.extract_info(ytdl_obj)['title'], 'test content')
+
+    def test_playlist_content(self):
+        self.assertIsNone(get_direct_url(self.playlist))
+        self.assertFalse(is_streamable_content(self.playlist))
+
+
+class TaskRoutingTests(TestCase):
+
+    def get_queue_name(self, task):
+        return current_app.amqp.router.route({}, task.name)['queue'].name
+
+    def test_task_queues(self):
+        self.assertEqual(self.get_queue_name(async_process_url), 'extract')
+        self.assertEqual(self.get_queue_name(async_extract_info), 'extract')
+        self.assertEqual(self.get_queue_name(async_download_content), 'download')
+        self.assertEqual(self.get_queue_name(async_postprocess_content), 'postprocess')
+        self.assertEqual(self.get_queue_name(async_download_playlist_entry), 'download')
+        self.assertEqual(self.get_queue_name(async_aggregate_playlist), 'download')
+        self.assertEqual(self.get_queue_name(delete_expired_content_files), 'maintenance')
+        self.assertEqual(self.get_queue_name(test_task), 'celery')
+
+    def test_download_task_is_acknowledged_late(self):
+        self.assertTrue(async_download_content.acks_late)
+        self.assertTrue(async_download_content.reject_on_worker_lost)
+        self.assertFalse(async_process_url.acks_late)
+
+
 class DownloadContentViewTests(TestCase):
 
     @classmethod
@@ -428,6 +1823,175 @@ class DownloadContentViewTests(TestCase):
         wait_until_file_is_being_processed_then_delete(content.download_path, 5)
 
 
+
+class ContentProgressViewTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.content = Content.objects.create(
+            info_id='2PuFyjAs7JA',
+            info_file_path='info/info-2PuFyjAs7JA.json',
+            title='test content',
+            downloaded_successfully=True,
+        )
+        cls.path = reverse('content-progress', kwargs={'pk': cls.content.pk})
+
+    def test_view_url(self):
+        self.assertEqual(resolve(self.path).func.__name__, ContentProgressView.as_view().__name__)
+
+    def test_downloaded_content_progress(self):
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = b''.join(response.streaming_content).decode()
+        self.assertEqual(events, 'event: progress\ndata: {"stage": "done", "status": "finished"}\n\n')
+
+    def test_progress_publisher_hooks(self):
+        progress_publisher = ProgressPublisher(self.content.pk)
+        hooks_options = progress_publisher.get_hooks_options()
+        self.assertListEqual(hooks_options['progress_hooks'], [progress_publisher.progress_hook, ])
+        self.assertListEqual(hooks_options['postprocessor_hooks'], [progress_publisher.postprocessor_hook, ])
+        self.assertEqual(MainDownloader(url='', pre_created_content_obj=self.content).get_progress_publisher().content_pk,
+                         str(self.content.pk))
+        self.assertIsNone(MainDownloader(url='').get_progress_publisher())
+
+    @override_settings(REDIS_URL='')
+    def test_progress_without_redis(self):
+        pending_content = Content.objects.create(
+            info_id='2PuFyjAs7JA', info_file_path='info/info-2PuFyjAs7JA.json', celery_download_task_id=uuid(),
+        )
+        path = reverse('content-progress', kwargs={'pk': pending_content.pk})
+        self.assertEqual(self.client.get(path).status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        current_app.backend.store_result(pending_content.celery_download_task_id, (1, None, None), states.SUCCESS)
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        events = b''.join(response.streaming_content).decode()
+        self.assertEqual(events, 'event: progress\ndata: {"stage": "done", "status": "error"}\n\n')
+
+    def test_done_event_of_attached_content(self):
+        self.assertDictEqual(get_done_event(self.content.pk), FINISHED_EVENT)
+        self.assertDictEqual(get_done_event(uuid()), FAILED_EVENT)
+        attached_content = Content.objects.create(
+            info_id='2PuFyjAs7JA', info_file_path='info/info-2PuFyjAs7JA.json', celery_download_task_id=uuid(),
+        )
+        # the download owner is still running
+        self.assertIsNone(get_done_event(attached_content.pk))
+        current_app.backend.store_result(attached_content.celery_download_task_id, 'hello world', states.SUCCESS)
+        # the owner is done without a download result of the content
+        self.assertDictEqual(get_done_event(attached_content.pk), FAILED_EVENT)
+
+
+
+class ContentFileDeliveryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.file_data = bytes(range(256)) * 40
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile(suffix='.mp3', delete=False) as content_file:
+            content_file.write(self.file_data)
+            self.content_file_path = content_file.name
+        download_task_id = uuid()
+        self.content = Content.objects.create(
+            info_id='2PuFyjAs7JA',
+            info_file_path='info/info-2PuFyjAs7JA.json',
+            title='test content',
+            download_path=self.content_file_path,
+            downloaded_successfully=True,
+            celery_download_task_id=download_task_id,
+        )
+        AsyncResult(download_task_id).backend.store_result(download_task_id, (0, {}, str(self.content.pk)), 'SUCCESS')
+        self.path = reverse('download-content', kwargs={'pk': self.content.pk})
+
+    def tearDown(self):
+        os.remove(self.content_file_path)
+
+    def test_range_header_parsing(self):
+        self.assertListEqual(parse_range_header('bytes=0-99', 1000), [(0, 99)])
+        self.assertListEqual(parse_range_header('bytes=900-, -50', 1000), [(900, 999), (950, 999)])
+        self.assertListEqual(parse_range_header('bytes=500-2000', 1000), [(500, 999)])
+        self.assertListEqual(parse_range_header('bytes=1000-', 1000), [])
+        self.assertIsNone(parse_range_header('bytes=20-10', 1000))
+        self.assertIsNone(parse_range_header('items=0-10', 1000))
+
+    def test_whole_file_response(self):
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(b''.join(response.streaming_content), self.file_data)
+
+    def test_conditional_response(self):
+        etag = self.client.get(self.path)['ETag']
+        response = self.client.get(self.path, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        response = self.client.get(self.path, headers={'If-None-Match': '"another-etag"'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_single_range_response(self):
+        etag = self.client.get(self.path)['ETag']
+        response = self.client.get(self.path, headers={'Range': 'bytes=100-199', 'If-Range': etag})
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(response['Content-Range'], f'bytes 100-199/{len(self.file_data)}')
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content), self.file_data[100:200])
+
+    def test_multiple_ranges_response(self):
+        response = self.client.get(self.path, headers={'Range': 'bytes=0-9, -10'})
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = b''.join(response.streaming_content)
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertIn(self.file_data[:10], body)
+        self.assertIn(self.file_data[-10:], body)
+
+    def test_changed_file_range_response(self):
+        response = self.client.get(self.path, headers={'Range': 'bytes=100-199', 'If-Range': '"old-etag"'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.file_data)
+
+    @override_settings(
+        CONTENT_DELIVERY_BACKEND='x-accel-redirect',
+        CONTENT_DELIVERY_ROOT=tempfile.gettempdir(),
+        CONTENT_DELIVERY_INTERNAL_URL='/protected/',
+    )
+    def test_x_accel_redirect_response(self):
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + os.path.basename(self.content_file_path))
+        self.assertEqual(response['Content-Type'], 'audio/mpeg')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        self.assertEqual(response.content, b'')
+
+    @override_settings(CONTENT_DELIVERY_BACKEND='x-accel-redirect', CONTENT_DELIVERY_ROOT='/not/the/content/root')
+    def test_x_accel_redirect_fallback_response(self):
+        response = self.client.get(self.path)
+        self.assertIsInstance(response, FileResponse)
+        self.assertNotIn('X-Accel-Redirect', response)
+
+    @override_settings(CONTENT_DELIVERY_BACKEND='x-sendfile', CONTENT_DELIVERY_ROOT=tempfile.gettempdir())
+    def test_x_sendfile_response(self):
+        response = self.client.get(self.path)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Sendfile'], os.path.abspath(self.content_file_path))
+
+    @override_settings(CONTENT_DELIVERY_BACKEND='x-sendfile')
+    def test_x_sendfile_fallback_response(self):
+        # the default root is the download directory
+        response = self.client.get(self.path)
+        self.assertIsInstance(response, FileResponse)
+        self.assertNotIn('X-Sendfile', response)
+
+    def test_unsatisfiable_range_response(self):
+        response = self.client.get(self.path, headers={'Range': f'bytes={len(self.file_data)}-'})
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.file_data)}')
+
+
 def wait_until_file_is_being_processed_then_delete(file_path, tries=5):
     for i in range(tries):
         try:
@@ -436,4 +2000,4 @@ def wait_until_file_is_being_processed_then_delete(file_path, tries=5):
         except PermissionError as e:
             time.sleep(3)
         else:
-            break
\ No newline at end of file
+            break
@@ -0,0 +1,64 @@
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# The query parameters that only track the sharing of an url, they do not change its content
+TRACKING_QUERY_PARAMS = ('si', 'feature', 'igsh', 'igshid', 'fbclid', 'gclid', 'pp')
+TRACKING_QUERY_PARAM_PREFIXES = ('utm_', )
+URL_KEY_MAX_LENGTH = 400
+
+
+def normalize_url(url):
+    """
+    Returns the normalized form of the url, the Content.url_key of the urls without an extractor id:
+    https scheme, lowercase host without www. and the default port, no fragment, no trailing slash
+    and the sorted query without the tracking parameters.
+    Returns None for an empty url (see fit_url_key for the long urls).
+    :param url:
+    :return:
+    """
+    if not url:
+        return None
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').removeprefix('www.')
+    if parts.port and parts.port not in (80, 443):
+        host += f':{parts.port}'
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key not in TRACKING_QUERY_PARAMS and not key.startswith(TRACKING_QUERY_PARAM_PREFIXES)
+    )
+    path = parts.path.rstrip('/')
+    return fit_url_key(urlunsplit(('https', host, path, urlencode(query), '')))
+
+
+def make_url_key(extractor_key, video_id):
+    """
+    Returns the canonical key of the urls of a video, the same for all of its url variants
+    (e.g. youtu.be/X?si=..., youtube.com/watch?v=X&t=10 and m.youtube.com/watch?v=X are 'Youtube:X').
+    :param extractor_key:
+    :param video_id:
+    :return:
+    """
+    return fit_url_key(f'{extractor_key}:{video_id}')
+
+
+def fit_url_key(key):
+    """
+    Returns the key if it fits in Content.url_key, otherwise its sha256 digest (a truncated key could be shared by
+    different urls).
+    :param key:
+    :return:
+    """
+    if len(key) <= URL_KEY_MAX_LENGTH:
+        return key
+    return 'sha256:' + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def make_info_url_key(info):
+    """
+    Returns the canonical key of the url of the info, or None if the info has no extractor key or id.
+    :param info:
+    :return:
+    """
+    if not info.get('extractor_key') or not info.get('id'):
+        return None
+    return make_url_key(info['extractor_key'], info['id'])
@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import DownloadContentView
+from .views import DownloadContentView, ContentProgressView
 
 urlpatterns = [
     path('<uuid:pk>/', DownloadContentView.as_view(), name='download-content'),
+    path('<uuid:pk>/progress/', ContentProgressView.as_view(), name='content-progress'),
 ]
\ No newline at end of file
@@ -1,16 +1,22 @@
 from django.forms import model_to_dict
 from django.shortcuts import render, get_object_or_404
-from django.http import FileResponse, HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.urls import reverse_lazy
 from django.views.generic import View, FormView
 from celery.result import AsyncResult
 from rest_framework import status
+import json
 import os
 from api.views import make_short_description
 from home.forms import URLForm
+from .coordination import TaskResultWaitError, get_redis_connection, wait_for_result
+from .delivery import make_file_response
+from .extractors import allowed_extractor_registry
 from .main_downloader import DownloadProcessError
 from .models import Content
-from .tasks import async_process_url, async_download_content
+from .playlists import make_playlist_response
+from .progress import iter_progress_events, format_server_sent_event, get_done_event, FINISHED_EVENT
+from .tasks import async_process_url, dispatch_download_content, update_content_with_download_result
 # Create your views here.
 
 
@@ -35,10 +41,15 @@ class ProcessURLFormView(FormView):
 
     def form_valid(self, form):
         context = self.get_context_data()
+        if not allowed_extractor_registry.is_url_supported(form.cleaned_data['url']):
+            # rejected before queueing any task
+            context['successful_process'] = False
+            context['error_message'] = str(DownloadProcessError("Unsupported URL!"))
+            return self.render_to_response(context)
         process_url_result = async_process_url.delay(url=form.cleaned_data['url'], detail=form.get_detail_dict())
         try:
-            code, info, content_pk = process_url_result.get()
-        except DownloadProcessError as error:
+            code, info, content_pk = wait_for_result(process_url_result)
+        except (DownloadProcessError, TaskResultWaitError) as error:
             context['successful_process'] = False
             context['error_message'] = str(error)
         else:
@@ -57,9 +68,9 @@ class ProcessURLFormView(FormView):
                 'Channel': info.get('channel'),
                 'Uploader': info.get('uploader'),
             }
-            download_result = async_download_content.delay(
-                url=form.cleaned_data['url'], detail=form.get_detail_dict(), pre_created_content_obj=content.pk, info=info,
-                info_file_path=content.info_file_path
+            download_result = dispatch_download_content(
+                form.cleaned_data['url'], rendition_key=content.rendition_key, detail=form.get_detail_dict(),
+                pre_created_content_obj=content.pk, info_file_path=content.info_file_path, playlist=content.is_playlist
             )
             content.celery_download_task_id = download_result.task_id
             content.save()
@@ -82,24 +93,62 @@ class DownloadContentView(View):
         if content.celery_download_task_id:
             download_result = AsyncResult(id=content.celery_download_task_id)
         else:
-            detail_fields = ['type', 'extension', 'resolution', 'frame_rate', 'aspect_ratio', 'audio_bitrate']
+            detail_fields = [
+                'type', 'extension', 'resolution', 'frame_rate', 'aspect_ratio', 'audio_bitrate', 'start_time', 'end_time'
+            ]
             content_detail = {k: v for k, v in model_to_dict(content).items() if k in detail_fields}
-            download_result = async_download_content.delay(
-                content.url, detail=content_detail, info_file_path=content.info_file_path,
-                pre_created_content_obj=content.pk
+            download_result = dispatch_download_content(
+                content.url, rendition_key=content.rendition_key, detail=content_detail,
+                info_file_path=content.info_file_path, pre_created_content_obj=content.pk, playlist=content.is_playlist
             )
         try:
-            result = download_result.get()
+            result = wait_for_result(download_result, in_flight_key=content.rendition_key)
+        except TaskResultWaitError as error:
+            # the next request dispatches the download again
+            Content.objects.filter(pk=content.pk).update(celery_download_task_id=None)
+            return HttpResponse(f"<h1>{str(error)}</h1>", status=status.HTTP_502_BAD_GATEWAY)
         except DownloadProcessError as error:
             return HttpResponse(f"<h1>{str(error)}</h1>", status=status.HTTP_502_BAD_GATEWAY)
         else:
             if download_result.successful():
                 content.refresh_from_db()
+                update_content_with_download_result(content, result)
                 content.celery_download_task_id = download_result.task_id
                 content.save()
+                if content.is_playlist and content.downloaded_successfully:
+                    response = make_playlist_response(content)
+                    if response is not None:
+                        return response
                 if content.download_path and content.downloaded_successfully and os.path.exists(content.download_path):
-                    return FileResponse(open(content.download_path, 'rb'), as_attachment=True, status=status.HTTP_200_OK)
+                    return make_file_response(request, content.download_path)
             return HttpResponse("<h1>Download process was unsuccessful!</h1>", status=status.HTTP_502_BAD_GATEWAY)
 
     def post(self, request, pk, *args, **kwargs):
         return self.get(request, pk, *args, **kwargs)
+
+
+class ContentProgressView(View):
+    """
+    Streams the download progress events of the content as server-sent events (text/event-stream).
+    Each open stream holds a worker thread, the web server runs threaded workers (see docker-compose-prod.yml).
+    Without redis, only the done event of a done download is sent, otherwise 503 is returned.
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        content = get_object_or_404(Content.objects.valid_contents(), pk=pk)
+        if content.downloaded_successfully:
+            events = [format_server_sent_event(json.dumps(FINISHED_EVENT)), ]
+        elif get_redis_connection() is None:
+            done_event = get_done_event(content.pk)
+            if done_event is None:
+                return HttpResponse(
+                    "The progress events are not available!", status=status.HTTP_503_SERVICE_UNAVAILABLE
+                )
+            events = [format_server_sent_event(json.dumps(done_event)), ]
+        else:
+            events = iter_progress_events(content.pk)
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Disabling the proxy buffering to deliver the events immediately.
+        response['X-Accel-Buffering'] = 'no'
+        return response
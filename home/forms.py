@@ -47,6 +47,16 @@ class URLForm(forms.Form):
     }
     url = forms.CharField(max_length=400)
     detail = forms.ChoiceField(choices=CONTENT_DETAIL_CHOICES, initial='mp4 360')
+    # the clip to download (seconds), the whole content if not set
+    start_time = forms.FloatField(required=False, min_value=0, label='Start time (seconds)')
+    end_time = forms.FloatField(required=False, min_value=0, label='End time (seconds)')
+    CLIP_DATA_NAMES = ['start_time', 'end_time']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('end_time') and cleaned_data['end_time'] <= (cleaned_data.get('start_time') or 0):
+            self.add_error('end_time', 'The end time must be after the start time!')
+        return cleaned_data
 
     def get_detail_dict(self):
         detail_str = self.cleaned_data.get('detail')
@@ -56,6 +66,9 @@ class URLForm(forms.Form):
             detail_dict = make_detail_dict(self.VIDEO_FORMAT_DATA_NAMES, values_list)
         else:
             detail_dict = make_detail_dict(self.AUDIO_FORMAT_DATA_NAMES, values_list)
+        for name in self.CLIP_DATA_NAMES:
+            if self.cleaned_data.get(name):
+                detail_dict[name] = self.cleaned_data[name]
         return detail_dict
 
 